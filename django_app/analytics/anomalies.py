@@ -0,0 +1,333 @@
+"""
+Detección de anomalías y revisiones en todas las series mensuales.
+
+Series: cada residencia (tabla principal), cada isla y cada par
+residencia × isla (tabla de islas). Se apilan en una matriz S × P
+(series × meses consecutivos, NaN donde falta el dato) y todo el cálculo se
+hace con operaciones de array sobre esa matriz, sin bucles por serie:
+
+- Expectativa estacional: mismo mes del año anterior corregido con la
+  variación interanual típica de la serie. Se trabaja con
+  r[t] = log((v[t] + 1) / (v[t-12] + 1)); la puntuación robusta es
+  z = (r - mediana) / (1.4826 · MAD) por serie.
+- outlier: |z| >= OUTLIER_Z.
+- break (cambio estructural): salto entre la media de r en los BREAK_WINDOW
+  meses anteriores y posteriores, en unidades de error estándar robusto.
+  Se guarda el salto más fuerte de cada serie si supera BREAK_Z.
+- revision: periodos ya publicados cuyo valor cambia respecto a la matriz
+  de la ejecución anterior (guardada en ANOMALY_STATE_FILE).
+
+Los resultados (solo de los últimos `months` meses, salvo revisiones) se
+guardan en la tabla series_anomalies, que el dashboard consulta tal cual.
+Outliers y breaks se recalculan enteros en cada ejecución; las revisiones
+solo se detectan en la ejecución que ve el cambio, así que se acumulan
+(con su detected_at) y se podan pasados REVISION_RETENTION_DAYS días. Una
+ejecución sin cambios de datos (p. ej. un despliegue) no las borra.
+"""
+
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+ANOMALIES_TABLE = "series_anomalies"
+
+OUTLIER_Z = 3.5
+BREAK_Z = 4.0
+BREAK_WINDOW = 6
+# Series con mediana por debajo de esto son demasiado ruidosas para puntuarlas
+MIN_SERIES_MEDIAN = 50.0
+REVISION_TOLERANCE = 0.005   # 0,5 % de cambio relativo
+REVISION_RETENTION_DAYS = 90
+
+RECENT_MONTHS = 24
+
+# Matriz de la ejecución anterior, para detectar revisiones
+ANOMALY_STATE_FILE = "anomaly_state.npz"
+
+
+def _period_index(first, last):
+    """Meses consecutivos entre (y, m) y (y, m) inclusive, como y * 100 + m."""
+    (y0, m0), (y1, m1) = first, last
+    months = np.arange(y0 * 12 + m0 - 1, y1 * 12 + m1)
+    return (months // 12) * 100 + months % 12 + 1
+
+
+def build_series_matrix(backend):
+    """
+    Devuelve (keys, periods, values):
+    - keys: [(kind, residence, island)] con kind residence | island | residence_island
+    - periods: array de period_id (year * 100 + month) consecutivos
+    - values: matriz float S × P
+    """
+    rows = []
+    for label, year, month, total in backend.period_totals("residence", "month", {}):
+        rows.append((("residence", label, ""), int(year), int(month), total))
+    for label, year, month, total in backend.period_totals("island", "month", {}):
+        rows.append((("island", "", label), int(year), int(month), total))
+    for island, residence, year, month, total in backend.island_residence_totals({}):
+        rows.append((("residence_island", residence, island), int(year), int(month), total))
+
+    if not rows:
+        return [], np.array([], dtype=int), np.empty((0, 0))
+
+    keys = sorted({row[0] for row in rows})
+    key_idx = {key: i for i, key in enumerate(keys)}
+    ym = [(y, m) for _, y, m, _ in rows]
+    periods = _period_index(min(ym), max(ym))
+
+    row_pos = np.fromiter((key_idx[r[0]] for r in rows), dtype=int, count=len(rows))
+    col_pos = np.searchsorted(periods, [y * 100 + m for y, m in ym])
+    values = np.full((len(keys), len(periods)), np.nan)
+    values[row_pos, col_pos] = [float(r[3]) if r[3] is not None else np.nan for r in rows]
+    return keys, periods, values
+
+
+def _nanmedian(x, **kwargs):
+    # Las filas sin ningún dato dan NaN sin avisar ("All-NaN slice")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmedian(x, **kwargs)
+
+
+def _robust_z(r):
+    """z robusto por fila (mediana / MAD), NaN donde no se puede calcular."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        median = _nanmedian(r, axis=1, keepdims=True)
+        mad = 1.4826 * _nanmedian(np.abs(r - median), axis=1, keepdims=True)
+        mad[mad == 0] = np.nan
+        return (r - median) / mad, median, mad
+
+
+def _window_mean(x, window):
+    """Media móvil de `window` columnas terminando en cada columna (NaN-aware)."""
+    valid = ~np.isnan(x)
+    csum = np.cumsum(np.where(valid, x, 0.0), axis=1)
+    ccount = np.cumsum(valid, axis=1)
+    pad = np.zeros((x.shape[0], 1))
+    csum = np.concatenate([pad, csum], axis=1)
+    ccount = np.concatenate([pad, ccount], axis=1)
+    out = np.full(x.shape, np.nan)
+    sums = csum[:, window:] - csum[:, :-window]
+    counts = ccount[:, window:] - ccount[:, :-window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out[:, window - 1:] = np.where(counts >= window // 2 + 1, sums / counts, np.nan)
+    return out
+
+
+def score_matrix(values):
+    """
+    Puntuaciones vectorizadas sobre la matriz S × P. Devuelve un dict con
+    arrays S × P: yoy_log, z, expected; y por serie: break_col, break_z.
+    """
+    s, p = values.shape
+    yoy = np.full((s, p), np.nan)
+    if p > 12:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            yoy[:, 12:] = np.log((values[:, 12:] + 1.0) / (values[:, :-12] + 1.0))
+
+    # Series demasiado pequeñas: no se puntúan
+    with np.errstate(invalid="ignore"):
+        small = ~(_nanmedian(values, axis=1) >= MIN_SERIES_MEDIAN) if p else np.ones(s, bool)
+    yoy[small] = np.nan
+
+    z, median, mad = _robust_z(yoy)
+
+    expected = np.full((s, p), np.nan)
+    if p > 12:
+        expected[:, 12:] = (values[:, :-12] + 1.0) * np.exp(median) - 1.0
+
+    # Cambio estructural: media de r en la ventana anterior vs la posterior
+    break_col = np.full(s, -1)
+    break_z = np.full(s, np.nan)
+    w = BREAK_WINDOW
+    if p >= 2 * w + 12:
+        before = _window_mean(yoy, w)             # termina en t
+        after = np.full((s, p), np.nan)
+        after[:, :-w] = before[:, w:]             # empieza en t + 1
+        with np.errstate(invalid="ignore"):
+            jump = np.abs(after - before) / (mad * np.sqrt(2.0 / w))
+        has_jump = ~np.all(np.isnan(jump), axis=1)
+        cols = np.nanargmax(np.where(np.isnan(jump), -np.inf, jump), axis=1)
+        best = jump[np.arange(s), cols]
+        ok = has_jump & (best >= BREAK_Z)
+        break_col[ok] = cols[ok] + 1               # primer mes del nuevo régimen
+        break_z[ok] = best[ok]
+
+    return {"yoy_log": yoy, "z": z, "expected": expected, "break_col": break_col, "break_z": break_z}
+
+
+def find_revisions(keys, periods, values, previous):
+    """
+    Celdas cuyo valor cambia frente a la matriz anterior (mismas series y
+    periodos). Devuelve [(fila, columna, valor anterior)].
+    """
+    if previous is None:
+        return []
+    prev_keys = [tuple(k) for k in previous["keys"].tolist()]
+    prev_periods = previous["periods"]
+    prev_values = previous["values"]
+
+    prev_row = {key: i for i, key in enumerate(prev_keys)}
+    rows_now = np.array([i for i, k in enumerate(keys) if k in prev_row], dtype=int)
+    if not len(rows_now):
+        return []
+    rows_prev = np.array([prev_row[keys[i]] for i in rows_now], dtype=int)
+
+    common, cols_now, cols_prev = np.intersect1d(periods, prev_periods, return_indices=True)
+    if not len(common):
+        return []
+
+    now = values[np.ix_(rows_now, cols_now)]
+    before = prev_values[np.ix_(rows_prev, cols_prev)]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        changed = (
+            ~np.isnan(now) & ~np.isnan(before)
+            & (np.abs(now - before) > REVISION_TOLERANCE * np.maximum(np.abs(before), 1.0))
+        )
+    r, c = np.nonzero(changed)
+    return [(int(rows_now[i]), int(cols_now[j]), float(before[i, j])) for i, j in zip(r, c)]
+
+
+def _state_path():
+    return Path(settings.ANOMALY_STATE_DIR) / ANOMALY_STATE_FILE
+
+
+def load_previous_state():
+    path = _state_path()
+    if not path.exists():
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in ("keys", "periods", "values")}
+
+
+def save_state(keys, periods, values):
+    path = _state_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez_compressed(tmp, keys=np.array(keys, dtype=str).reshape(-1, 3), periods=periods, values=values)
+    tmp.replace(path)
+
+
+def detect_anomalies(keys, periods, values, months=RECENT_MONTHS, previous=None):
+    """Lista de anomalías (dicts) de la matriz: outliers, breaks y revisiones."""
+    if not keys:
+        return []
+    scores = score_matrix(values)
+    recent_from = max(0, len(periods) - months)
+
+    def period_label(col):
+        pid = int(periods[col])
+        return f"{pid // 100}-{pid % 100:02d}"
+
+    def record(row, col, anomaly_type, score, expected):
+        kind, residence, island = keys[row]
+        value = values[row, col]
+        return {
+            "kind": kind,
+            "residence": residence or None,
+            "island": island or None,
+            "period": period_label(col),
+            "anomaly_type": anomaly_type,
+            "value": None if np.isnan(value) else float(value),
+            "expected": None if expected is None or np.isnan(expected) else float(expected),
+            "score": float(score),
+        }
+
+    results = []
+    z = scores["z"]
+    with np.errstate(invalid="ignore"):
+        rows, cols = np.nonzero(np.abs(z[:, recent_from:]) >= OUTLIER_Z)
+    for r, c in zip(rows, cols + recent_from):
+        results.append(record(r, c, "outlier", z[r, c], scores["expected"][r, c]))
+
+    for r in np.nonzero(scores["break_col"] >= recent_from)[0]:
+        c = scores["break_col"][r]
+        results.append(record(r, c, "break", scores["break_z"][r], scores["expected"][r, c]))
+
+    for r, c, before in find_revisions(keys, periods, values, previous):
+        change = (values[r, c] - before) / max(abs(before), 1.0) * 100
+        results.append(record(r, c, "revision", change, before))
+
+    return results
+
+
+def ensure_anomalies_table(cursor):
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {ANOMALIES_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            residence TEXT,
+            island TEXT,
+            period TEXT NOT NULL,
+            anomaly_type TEXT NOT NULL,
+            value REAL,
+            expected REAL,
+            score REAL NOT NULL,
+            detected_at TEXT NOT NULL
+        )
+        """
+    )
+
+
+def save_anomalies(results, retention_days=REVISION_RETENTION_DAYS):
+    """
+    Guarda una ejecución en una sola transacción: sustituye outliers y
+    breaks, añade las revisiones nuevas y poda las de más de
+    retention_days días.
+    """
+    now = time.time()
+    detected_at = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now))
+    cutoff = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now - retention_days * 86400))
+    with transaction.atomic(), connection.cursor() as cursor:
+        ensure_anomalies_table(cursor)
+        cursor.execute(
+            f"DELETE FROM {ANOMALIES_TABLE} WHERE anomaly_type <> 'revision' OR detected_at < %s",
+            [cutoff],
+        )
+        cursor.executemany(
+            f"""
+            INSERT INTO {ANOMALIES_TABLE}
+                (kind, residence, island, period, anomaly_type, value, expected, score, detected_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            [
+                (r["kind"], r["residence"], r["island"], r["period"], r["anomaly_type"],
+                 r["value"], r["expected"], r["score"], detected_at)
+                for r in results
+            ],
+        )
+
+
+def top_anomalies(residence=None, island=None, limit=10):
+    """Anomalías más fuertes para el dashboard ([] si el análisis aún no se ha ejecutado)."""
+    where = []
+    params = []
+    if residence:
+        where.append("residence = %s")
+        params.append(residence)
+    if island:
+        where.append("island = %s")
+        params.append(island)
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT kind, residence, island, period, anomaly_type, value, expected, score
+                FROM {ANOMALIES_TABLE}
+                {where_sql}
+                ORDER BY period DESC, ABS(score) DESC
+                LIMIT %s
+                """,
+                params + [limit],
+            )
+            columns = [col[0] for col in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except DatabaseError:
+        return []
@@ -0,0 +1,552 @@
+"""
+Backends de consulta para el camino de lectura analítico.
+
+Las consultas de los paneles del dashboard (filas mensuales filtradas y
+totales por isla) son las mismas SQL para todos los backends; cada backend
+solo decide:
+- contra qué "tabla" se ejecutan (tabla SQLite o ficheros Parquet)
+- el placeholder de parámetros (%s en Django, ? en DuckDB)
+
+Backends disponibles (settings.ANALYTICS_BACKEND):
+- "sqlite": tablas de db.sqlite3 vía django.db.connection (por defecto)
+- "duckdb": motor columnar embebido sobre data/processed/parquet, sin servidor
+"""
+
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import request_started
+from django.db import connection
+
+TABLE_NAME = "frontur_canarias_monthly"
+# Tabla mensual por isla (year, month, island, tourists)
+ISLAND_TABLE = "frontur_canarias_islands_monthly"
+
+# Esquema en estrella que cargan las ETL (etl/star_schema.py); las dos tablas
+# anteriores pasan a ser vistas sobre estas tablas de hechos
+MONTHLY_FACT = "fact_canarias_monthly"
+ISLANDS_FACT = "fact_canarias_islands_monthly"
+# Marginales residencia × isla × periodo con id 0 = "todas" (drill-down de islas)
+ISLANDS_MARGINALS = "agg_islands_marginals"
+ALL_ID = 0
+# En el dataset Parquet de marginales (etl/processed_store.py) "todas" es la etiqueta vacía
+ALL_LABEL = ""
+
+# Tabla ancha con todas las medidas (ETL con --all-measures): dataset Parquet
+# con etiquetas y tabla de hechos con claves enteras en SQLite
+WIDE_TABLE = "frontur_canarias_monthly_wide"
+MONTHLY_WIDE_FACT = "fact_canarias_monthly_wide"
+
+# Columnas de la tabla ancha (nombres normalizados de MEDIDAS, ver etl/wide_ingest.py)
+WIDE_TOURISTS = "turistas"
+WIDE_SPEND = "gasto_total"
+WIDE_STAY = "estancia_media"
+
+# Dimensiones de comparación: (tabla, columna de etiqueta o None para el total)
+COMPARISON_DIMENSIONS = {
+    "total": (TABLE_NAME, None),
+    "residence": (TABLE_NAME, "residence"),
+    "island": (ISLAND_TABLE, "island"),
+}
+
+
+def build_where(filters, placeholder="%s"):
+    """
+    Construye WHERE + params a partir de los filtros normalizados:
+    - residence
+    - year_from / year_to
+    """
+    where_clauses = []
+    params = []
+
+    if filters.get("year_from"):
+        where_clauses.append(f"year >= {placeholder}")
+        params.append(filters["year_from"])
+
+    if filters.get("year_to"):
+        where_clauses.append(f"year <= {placeholder}")
+        params.append(filters["year_to"])
+
+    if filters.get("residence"):
+        where_clauses.append(f"residence = {placeholder}")
+        params.append(filters["residence"])
+
+    where_sql = ""
+    if where_clauses:
+        where_sql = "WHERE " + " AND ".join(where_clauses)
+    return where_sql, params
+
+
+class AnalyticsBackend:
+    """Consultas de panel comunes; las subclases implementan _table y _fetch."""
+
+    name = None
+    placeholder = "%s"
+
+    def _table(self, table_name):
+        raise NotImplementedError
+
+    def _fetch(self, sql, params):
+        """Ejecuta la consulta y devuelve (columns, rows)."""
+        raise NotImplementedError
+
+    def _columns(self, table_name):
+        """Columnas de una tabla/dataset ([] si no existe)."""
+        raise NotImplementedError
+
+    def monthly_rows(self, filters):
+        """Filas (year, month, residence, tourists) de la tabla principal."""
+        where_sql, params = build_where(filters, self.placeholder)
+        return self._fetch(
+            f"""
+            SELECT year, month, residence, tourists
+            FROM {self._table(TABLE_NAME)}
+            {where_sql}
+            ORDER BY year, month, residence
+            """,
+            params,
+        )
+
+    def island_rows(self, filters, island=None):
+        """Filas (year, month, island, residence, tourists) de la tabla de islas."""
+        where_sql, params = build_where(filters, self.placeholder)
+        if island:
+            where_sql = (where_sql + " AND " if where_sql else "WHERE ") + f"island = {self.placeholder}"
+            params.append(island)
+        return self._fetch(
+            f"""
+            SELECT year, month, island, residence, tourists
+            FROM {self._table(ISLAND_TABLE)}
+            {where_sql}
+            ORDER BY year, month, island, residence
+            """,
+            params,
+        )
+
+    def drilldown_totals(self, group_by, start, end, residence=None, island=None):
+        """
+        Drill-down isla × residencia: total por isla (group_by="island") o por
+        residencia (group_by="residence") entre dos periodos (year, month)
+        inclusive, opcionalmente filtrado por residencia y/o isla. Lista de
+        (label, total) de mayor a menor.
+        """
+        (y_start, m_start), (y_end, m_end) = start, end
+        p = self.placeholder
+        where_sql = (
+            f"(year > {p} OR (year = {p} AND month >= {p})) "
+            f"AND (year < {p} OR (year = {p} AND month <= {p}))"
+        )
+        params = [y_start, y_start, m_start, y_end, y_end, m_end]
+        for column, value in (("residence", residence), ("island", island)):
+            if value:
+                where_sql += f" AND {column} = {p}"
+                params.append(value)
+
+        _, rows = self._fetch(
+            f"""
+            SELECT {group_by} AS label, SUM(tourists) AS total
+            FROM {self._table(ISLAND_TABLE)}
+            WHERE {where_sql}
+            GROUP BY {group_by}
+            ORDER BY total DESC, label
+            """,
+            params,
+        )
+        return rows
+
+    def period_totals(self, dimension, granularity, filters):
+        """
+        Totales agrupados (label, year, month, total) de una dimensión en una
+        sola consulta. Con granularity="year", month es NULL.
+        """
+        table_name, label_col = COMPARISON_DIMENSIONS[dimension]
+        label_sql = label_col or "'Total'"
+        month_sql = "month" if granularity == "month" else "NULL"
+        group_cols = [c for c in (label_col, "year", "month" if granularity == "month" else None) if c]
+        where_sql, params = build_where(filters, self.placeholder)
+
+        _, rows = self._fetch(
+            f"""
+            SELECT {label_sql} AS label, year, {month_sql} AS month, SUM(tourists) AS total
+            FROM {self._table(table_name)}
+            {where_sql}
+            GROUP BY {", ".join(group_cols)}
+            """,
+            params,
+        )
+        return rows
+
+    def island_residence_totals(self, filters):
+        """Totales (island, residence, year, month, total) de la tabla de islas."""
+        where_sql, params = build_where(filters, self.placeholder)
+        _, rows = self._fetch(
+            f"""
+            SELECT island, residence, year, month, SUM(tourists) AS total
+            FROM {self._table(ISLAND_TABLE)}
+            {where_sql}
+            GROUP BY island, residence, year, month
+            """,
+            params,
+        )
+        return rows
+
+    def measure_kpis(self, filters):
+        """
+        KPIs de la tabla ancha en una sola consulta: gasto por turista y
+        estancia media ponderada por turistas. None si no hay tabla ancha.
+        """
+        columns = self._columns(WIDE_TABLE)
+        if not columns:
+            return None
+        return self._measure_kpis(self._table(WIDE_TABLE), columns, *build_where(filters, self.placeholder))
+
+    def _measure_kpis(self, source, columns, where_sql, params):
+        if WIDE_TOURISTS not in columns:
+            return None
+        has_spend = WIDE_SPEND in columns
+        has_stay = WIDE_STAY in columns
+        if not (has_spend or has_stay):
+            return None
+
+        t = f'"{WIDE_TOURISTS}"'
+        spend = f'"{WIDE_SPEND}"' if has_spend else "NULL"
+        stay = f'"{WIDE_STAY}"' if has_stay else "NULL"
+        _, rows = self._fetch(
+            f"""
+            SELECT
+                SUM({spend}),
+                SUM(CASE WHEN {spend} IS NOT NULL THEN {t} END),
+                SUM({stay} * {t}),
+                SUM(CASE WHEN {stay} IS NOT NULL THEN {t} END)
+            FROM {source}
+            {where_sql}
+            """,
+            params,
+        )
+        spend_sum, spend_tourists, stay_sum, stay_tourists = rows[0]
+        return {
+            "spend_per_tourist": spend_sum / spend_tourists if spend_tourists else None,
+            "avg_stay": stay_sum / stay_tourists if stay_tourists else None,
+        }
+
+
+def build_star_where(filters, alias="f"):
+    """
+    WHERE sobre las tablas de hechos: años como rango de period_id
+    (year * 100 + month) y residencia como clave entera.
+    """
+    where_clauses = []
+    params = []
+
+    if filters.get("year_from"):
+        where_clauses.append(f"{alias}.period_id >= %s")
+        params.append(int(filters["year_from"]) * 100)
+
+    if filters.get("year_to"):
+        where_clauses.append(f"{alias}.period_id <= %s")
+        params.append(int(filters["year_to"]) * 100 + 99)
+
+    if filters.get("residence"):
+        where_clauses.append(
+            f"{alias}.residence_id = (SELECT residence_id FROM dim_residence WHERE residence = %s)"
+        )
+        params.append(filters["residence"])
+
+    where_sql = ""
+    if where_clauses:
+        where_sql = "WHERE " + " AND ".join(where_clauses)
+    return where_sql, params
+
+
+# Dimensiones de comparación sobre la estrella: (hechos, dimensión, clave, etiqueta)
+STAR_DIMENSIONS = {
+    "total": (MONTHLY_FACT, None, None, None),
+    "residence": (MONTHLY_FACT, "dim_residence", "residence_id", "residence"),
+    "island": (ISLANDS_FACT, "dim_island", "island_id", "island"),
+}
+
+
+# Tablas de db.sqlite3 vistas por cada hilo: se leen de sqlite_master una vez
+# por conexión y petición, no en cada consulta del backend
+_sqlite_tables = threading.local()
+
+
+def forget_sqlite_tables(**kwargs):
+    """Olvida las tablas recordadas por el hilo (al empezar cada petición)."""
+    _sqlite_tables.__dict__.clear()
+
+
+request_started.connect(forget_sqlite_tables, dispatch_uid="analytics_forget_sqlite_tables")
+
+
+class SQLiteAnalyticsBackend(AnalyticsBackend):
+    """
+    Con el esquema en estrella, agrupa y filtra por claves enteras y
+    decodifica las etiquetas una sola vez al final (JOIN con la dimensión
+    sobre el resultado ya agregado). Si la BD aún tiene las tablas antiguas
+    (sin migrar), usa las consultas genéricas sobre ellas.
+    """
+
+    name = "sqlite"
+    placeholder = "%s"
+
+    def _table(self, table_name):
+        return table_name
+
+    def _fetch(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            columns = [col[0] for col in cursor.description]
+            rows = cursor.fetchall()
+        return columns, rows
+
+    def _columns(self, table_name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA table_info({table_name})")
+            return [row[1] for row in cursor.fetchall()]
+
+    def _tables(self):
+        """Nombres de las tablas de la BD, consultados una vez por conexión."""
+        connection.ensure_connection()
+        if getattr(_sqlite_tables, "raw", None) is not connection.connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+                _sqlite_tables.names = frozenset(row[0] for row in cursor.fetchall())
+            _sqlite_tables.raw = connection.connection
+        return _sqlite_tables.names
+
+    def _has_star_schema(self):
+        return {MONTHLY_FACT, ISLANDS_FACT} <= self._tables()
+
+    def monthly_rows(self, filters):
+        if not self._has_star_schema():
+            return super().monthly_rows(filters)
+
+        where_sql, params = build_star_where(filters)
+        return self._fetch(
+            f"""
+            SELECT p.year, p.month, r.residence, f.tourists
+            FROM {MONTHLY_FACT} f
+            JOIN dim_period p ON p.period_id = f.period_id
+            JOIN dim_residence r ON r.residence_id = f.residence_id
+            {where_sql}
+            ORDER BY f.period_id, r.residence
+            """,
+            params,
+        )
+
+    def _has_island_marginals(self):
+        return ISLANDS_MARGINALS in self._tables()
+
+    def drilldown_totals(self, group_by, start, end, residence=None, island=None):
+        """
+        Desde agg_islands_marginals: la dimensión agrupada toma sus filas
+        (id <> 0) y la otra, su valor filtrado o la fila de total (id 0);
+        nunca se reagrupa la tabla de hechos.
+        """
+        if not (self._has_star_schema() and self._has_island_marginals()):
+            return super().drilldown_totals(group_by, start, end, residence, island)
+
+        (y_start, m_start), (y_end, m_end) = start, end
+        where_clauses = ["m.period_id BETWEEN %s AND %s"]
+        params = [y_start * 100 + m_start, y_end * 100 + m_end]
+        for label_col, value in (("residence", residence), ("island", island)):
+            dim_table, id_col = STAR_DIMENSIONS[label_col][1:3]
+            if value:
+                where_clauses.append(
+                    f"m.{id_col} = (SELECT {id_col} FROM {dim_table} WHERE {label_col} = %s)"
+                )
+                params.append(value)
+            elif label_col != group_by:
+                where_clauses.append(f"m.{id_col} = {ALL_ID}")
+        _, dim_table, id_col, label_col = STAR_DIMENSIONS[group_by]
+        where_clauses.append(f"m.{id_col} <> {ALL_ID}")
+
+        _, rows = self._fetch(
+            f"""
+            SELECT d.{label_col}, t.total
+            FROM (
+                SELECT m.{id_col}, SUM(m.tourists) AS total
+                FROM {ISLANDS_MARGINALS} m
+                WHERE {" AND ".join(where_clauses)}
+                GROUP BY m.{id_col}
+            ) t
+            JOIN {dim_table} d ON d.{id_col} = t.{id_col}
+            ORDER BY t.total DESC, d.{label_col}
+            """,
+            params,
+        )
+        return rows
+
+    def period_totals(self, dimension, granularity, filters):
+        if not self._has_star_schema():
+            return super().period_totals(dimension, granularity, filters)
+
+        fact, dim_table, id_col, label_col = STAR_DIMENSIONS[dimension]
+        # Mes sin el operador % (choca con los placeholders %s en el log SQL de DEBUG)
+        month_sql = "f.period_id - (f.period_id / 100) * 100" if granularity == "month" else "NULL"
+        group_cols = ([id_col] if id_col else []) + ["year"] + (["month"] if granularity == "month" else [])
+        where_sql, params = build_star_where(filters)
+
+        inner = f"""
+            SELECT {f"f.{id_col}, " if id_col else ""}f.period_id / 100 AS year,
+                   {month_sql} AS month, SUM(f.tourists) AS total
+            FROM {fact} f
+            {where_sql}
+            GROUP BY {", ".join(group_cols)}
+        """
+        if id_col:
+            sql = f"""
+                SELECT d.{label_col} AS label, t.year, t.month, t.total
+                FROM ({inner}) t
+                JOIN {dim_table} d ON d.{id_col} = t.{id_col}
+            """
+        else:
+            sql = f"SELECT 'Total' AS label, t.year, t.month, t.total FROM ({inner}) t"
+
+        _, rows = self._fetch(sql, params)
+        return rows
+
+    def island_residence_totals(self, filters):
+        if not self._has_star_schema():
+            return super().island_residence_totals(filters)
+
+        where_sql, params = build_star_where(filters)
+        _, rows = self._fetch(
+            f"""
+            SELECT i.island, r.residence, t.period_id / 100, t.period_id - (t.period_id / 100) * 100, t.total
+            FROM (
+                SELECT f.island_id, f.residence_id, f.period_id, SUM(f.tourists) AS total
+                FROM {ISLANDS_FACT} f
+                {where_sql}
+                GROUP BY f.island_id, f.residence_id, f.period_id
+            ) t
+            JOIN dim_island i ON i.island_id = t.island_id
+            JOIN dim_residence r ON r.residence_id = t.residence_id
+            """,
+            params,
+        )
+        return rows
+
+    def measure_kpis(self, filters):
+        return self._measure_kpis(
+            f"{MONTHLY_WIDE_FACT} f", self._columns(MONTHLY_WIDE_FACT), *build_star_where(filters)
+        )
+
+
+class DuckDBAnalyticsBackend(AnalyticsBackend):
+    """
+    Lee directamente el almacén Parquet particionado por año que escriben las
+    ETL (dataset=<tabla>/year=<YYYY>/*.parquet). DuckDB poda las particiones
+    year=... y solo lee las columnas usadas por cada consulta.
+    """
+
+    name = "duckdb"
+    placeholder = "?"
+
+    def __init__(self, parquet_dir):
+        try:
+            import duckdb
+        except ImportError as exc:
+            raise ImproperlyConfigured(
+                "ANALYTICS_BACKEND='duckdb' requiere el paquete 'duckdb'."
+            ) from exc
+
+        self.parquet_dir = parquet_dir
+        self._conn = duckdb.connect(database=":memory:")
+
+    def _has_dataset(self, table_name):
+        path = Path(self.parquet_dir) / f"dataset={table_name}"
+        return next(path.glob("*/*.parquet"), None) is not None
+
+    def _table(self, table_name):
+        # Sin este aviso, read_parquet falla con un IOException poco claro
+        if not self._has_dataset(table_name):
+            raise ImproperlyConfigured(
+                f"Falta el dataset Parquet {table_name!r} en ANALYTICS_PARQUET_DIR={self.parquet_dir!r}: "
+                "ejecuta las ETL o usa ANALYTICS_BACKEND='sqlite'."
+            )
+        pattern = f"{self.parquet_dir}/dataset={table_name}/*/*.parquet"
+        return f"read_parquet('{pattern}', hive_partitioning = true)"
+
+    def _fetch(self, sql, params):
+        # Un cursor por consulta: la conexión DuckDB no es segura entre hilos
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            columns = [col[0] for col in cursor.description]
+            rows = [tuple(row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+        return columns, rows
+
+    def _columns(self, table_name):
+        if not self._has_dataset(table_name):
+            return []  # dataset aún no generado
+        _, rows = self._fetch(f"DESCRIBE SELECT * FROM {self._table(table_name)}", [])
+        return [row[0] for row in rows]
+
+    def drilldown_totals(self, group_by, start, end, residence=None, island=None):
+        """
+        Desde el dataset de marginales (mismo trabajo que SQLite con
+        agg_islands_marginals): la dimensión agrupada toma sus filas y la
+        otra, su valor filtrado o la fila de total (ALL_LABEL). Sin ese
+        dataset, reagrupa la tabla de islas.
+        """
+        if not self._has_dataset(ISLANDS_MARGINALS):
+            return super().drilldown_totals(group_by, start, end, residence, island)
+
+        (y_start, m_start), (y_end, m_end) = start, end
+        # year por separado: DuckDB poda las particiones year=...
+        where_clauses = ["year BETWEEN ? AND ?", "year * 100 + month BETWEEN ? AND ?"]
+        params = [y_start, y_end, y_start * 100 + m_start, y_end * 100 + m_end]
+        for label_col, value in (("residence", residence), ("island", island)):
+            if value:
+                where_clauses.append(f"{label_col} = ?")
+                params.append(value)
+            elif label_col != group_by:
+                where_clauses.append(f"{label_col} = ?")
+                params.append(ALL_LABEL)
+        where_clauses.append(f"{group_by} <> ?")
+        params.append(ALL_LABEL)
+
+        _, rows = self._fetch(
+            f"""
+            SELECT {group_by} AS label, SUM(tourists) AS total
+            FROM {self._table(ISLANDS_MARGINALS)}
+            WHERE {" AND ".join(where_clauses)}
+            GROUP BY {group_by}
+            ORDER BY total DESC, label
+            """,
+            params,
+        )
+        return rows
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend():
+    """Devuelve (y reutiliza) el backend configurado en settings.ANALYTICS_BACKEND."""
+    name = getattr(settings, "ANALYTICS_BACKEND", "sqlite")
+    parquet_dir = str(getattr(settings, "ANALYTICS_PARQUET_DIR", ""))
+
+    if name == "sqlite":
+        key = (name,)
+    elif name == "duckdb":
+        key = (name, parquet_dir)
+    else:
+        raise ImproperlyConfigured(f"ANALYTICS_BACKEND desconocido: {name!r}")
+
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            if name == "sqlite":
+                backend = SQLiteAnalyticsBackend()
+            else:
+                backend = DuckDBAnalyticsBackend(parquet_dir)
+            _backends[key] = backend
+    return backend
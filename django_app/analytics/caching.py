@@ -0,0 +1,82 @@
+"""
+Versión de datos y claves de caché del dashboard.
+
+Cada recarga de las ETL publica una nueva versión de datos en la tabla
+analytics_data_version (una sola fila). Las claves de caché incluyen esa
+versión, así que:
+- mientras el warm-up (manage.py warm_dashboard_cache) precalcula la nueva
+  versión, los usuarios siguen leyendo la caché de la versión anterior;
+- al publicar, todos los workers pasan a la nueva versión a la vez y
+  encuentran ya calculadas las combinaciones de filtros más usadas.
+"""
+
+import hashlib
+import json
+import time
+
+from django.db import DatabaseError, connection
+
+DATA_VERSION_TABLE = "analytics_data_version"
+
+# Parámetros GET que cambian el resultado del dashboard
+DASHBOARD_PARAMS = ("residence", "island", "year_from", "year_to", "year_a", "year_b", "points")
+
+
+def _ensure_version_table(cursor):
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {DATA_VERSION_TABLE} (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version TEXT NOT NULL,
+            published_at TEXT NOT NULL
+        )
+        """
+    )
+
+
+def current_data_version():
+    """Versión de datos publicada ("0" si las ETL aún no han publicado ninguna)."""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT version FROM {DATA_VERSION_TABLE} WHERE id = 1")
+            row = cursor.fetchone()
+    except DatabaseError:
+        return "0"
+    return row[0] if row else "0"
+
+
+def new_data_version():
+    """Identificador para una nueva versión (ordenable por fecha)."""
+    return time.strftime("%Y%m%d%H%M%S") + f"{time.time_ns() % 1_000_000:06d}"
+
+
+def publish_data_version(version):
+    with connection.cursor() as cursor:
+        _ensure_version_table(cursor)
+        cursor.execute(
+            f"""
+            INSERT INTO {DATA_VERSION_TABLE} (id, version, published_at)
+            VALUES (1, %s, %s)
+            ON CONFLICT(id) DO UPDATE SET
+                version = excluded.version,
+                published_at = excluded.published_at
+            """,
+            [version, time.strftime("%Y-%m-%dT%H:%M:%S")],
+        )
+
+
+def normalize_params(params):
+    """Filtros relevantes del dashboard como dict ordenado, sin valores vacíos."""
+    return {key: params.get(key) for key in DASHBOARD_PARAMS if params.get(key)}
+
+
+def dashboard_cache_key(version, backend_name, params):
+    payload = json.dumps(normalize_params(params), sort_keys=True)
+    digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+    return f"dashboard:{version}:{backend_name}:{digest}"
+
+
+def series_cache_key(version, backend_name, filters, points):
+    payload = json.dumps({"filters": filters, "points": points}, sort_keys=True)
+    digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+    return f"series:{version}:{backend_name}:{digest}"
@@ -0,0 +1,141 @@
+"""
+Matrices de comparación entre periodos (vectorizadas con numpy).
+
+A partir de los totales agrupados (etiqueta, año, mes, total) de UNA consulta
+por dimensión se construye la matriz D×P (dimensiones × periodos) y de ella:
+- pct_change[d, i, j]: variación % del periodo i frente al periodo j
+- yoy_pct[d, i]: variación % frente al mismo mes del año anterior
+  (solo con granularidad mensual)
+
+Todo se calcula con operaciones de array: el coste es proporcional al
+tamaño de la salida (D×P×P), sin recorrer los datos una vez por pareja.
+"""
+
+import numpy as np
+
+
+def period_key(year, month=None):
+    return f"{int(year)}" if month is None else f"{int(year)}-{int(month):02d}"
+
+
+def parse_periods(raw):
+    """
+    Parsea 'periods' de la querystring: '2019,2023' (años) o
+    '2023-01,2024-01' (meses). Devuelve (granularity, [claves]) o
+    (None, []) si no hay periodos. Lanza ValueError si el formato es inválido
+    o mezcla granularidades.
+    """
+    items = [p.strip() for p in (raw or "").split(",") if p.strip()]
+    if not items:
+        return None, []
+
+    granularities = set()
+    keys = []
+    for item in items:
+        if item.isdigit() and len(item) == 4:
+            granularities.add("year")
+            keys.append(period_key(int(item)))
+        else:
+            year, _, month = item.partition("-")
+            if not (year.isdigit() and month.isdigit() and 1 <= int(month) <= 12):
+                raise ValueError(f"Periodo inválido: {item!r}")
+            granularities.add("month")
+            keys.append(period_key(int(year), int(month)))
+
+    if len(granularities) > 1:
+        raise ValueError("No se pueden mezclar años y meses en 'periods'.")
+    return granularities.pop(), keys
+
+
+def build_matrix(rows, periods=None):
+    """
+    rows: [(label, year, month|None, total)] de una consulta agrupada.
+    periods: claves de periodo a usar (None = todas, ordenadas).
+    Devuelve (labels, periods, values) con values de forma D×P (NaN si falta).
+    """
+    labels = sorted({row[0] for row in rows})
+    if periods is None:
+        periods = sorted({period_key(row[1], row[2]) for row in rows})
+
+    label_idx = {label: i for i, label in enumerate(labels)}
+    period_idx = {p: j for j, p in enumerate(periods)}
+
+    values = np.full((len(labels), len(periods)), np.nan)
+    for label, year, month, total in rows:
+        j = period_idx.get(period_key(year, month))
+        if j is not None:
+            values[label_idx[label], j] = float(total or 0.0)
+    return labels, list(periods), values
+
+
+def select_periods(values, all_periods, selected):
+    """Columnas de `values` en el orden de `selected` (NaN para periodos sin datos)."""
+    col_idx = {p: j for j, p in enumerate(all_periods)}
+    out = np.full((values.shape[0], len(selected)), np.nan)
+    for j, p in enumerate(selected):
+        if p in col_idx:
+            out[:, j] = values[:, col_idx[p]]
+    return out
+
+
+def pct_change_matrix(values):
+    """pct[d, i, j] = (v[d, i] - v[d, j]) / v[d, j] * 100 (NaN si la base es 0 o falta)."""
+    current = values[:, :, None]
+    base = values[:, None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = (current - base) / base * 100
+    pct[~np.isfinite(pct)] = np.nan
+    return pct
+
+
+def same_month_last_year(values, periods):
+    """
+    Variación % de cada periodo mensual frente al mismo mes del año anterior.
+    Devuelve (yoy_pct D×P, base_periods) con base_periods[j] la clave usada o None.
+    """
+    period_idx = {p: j for j, p in enumerate(periods)}
+    base_periods = []
+    base_cols = []
+    for p in periods:
+        year, month = p.split("-")
+        prev = period_key(int(year) - 1, int(month))
+        base_periods.append(prev if prev in period_idx else None)
+        base_cols.append(period_idx.get(prev, -1))
+
+    base_cols = np.array(base_cols, dtype=int)
+    base = np.full(values.shape, np.nan)
+    has_base = base_cols >= 0
+    base[:, has_base] = values[:, base_cols[has_base]]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        yoy = (values - base) / base * 100
+    yoy[~np.isfinite(yoy)] = np.nan
+    return yoy, base_periods
+
+
+def to_jsonable(array, ndigits=2):
+    """Lista anidada con NaN → None, redondeada para un JSON compacto."""
+    rounded = np.round(array, ndigits)
+    return np.where(np.isnan(rounded), None, rounded).tolist()
+
+
+def iter_csv_rows(dimension, labels, periods, values, pct):
+    """Filas en formato largo: una por (etiqueta, periodo, periodo base) con i != j."""
+    for d, label in enumerate(labels):
+        for i, period in enumerate(periods):
+            for j, base_period in enumerate(periods):
+                if i == j:
+                    continue
+                yield (
+                    dimension,
+                    label,
+                    period,
+                    base_period,
+                    _num(values[d, i]),
+                    _num(values[d, j]),
+                    _num(pct[d, i, j]),
+                )
+
+
+def _num(value):
+    return None if np.isnan(value) else round(float(value), 2)
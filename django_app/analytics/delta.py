@@ -0,0 +1,143 @@
+"""
+Feed incremental para clientes BI (/download/delta/).
+
+Las cargas de etl/star_schema.py apuntan cada fila insertada, modificada o
+eliminada de las tablas de hechos en row_changes; su seq (creciente, nunca
+reutilizado) es la marca de agua. Un cliente:
+1. pide ?since=0 (o sin since) y recibe todas las filas actuales + watermark;
+2. en cada refresco pide ?since=<watermark anterior> y recibe solo las filas
+   que cambiaron desde entonces + la nueva watermark.
+
+Varias operaciones sobre la misma fila desde la marca de agua se resumen en
+una: la última, con "insert" si el cliente aún no la tenía. Una fila creada y
+borrada después de la marca no aparece.
+
+El registro se poda (ver etl/star_schema.py): solo guarda los cambios por
+encima de un suelo por tabla de hechos. Una marca anterior al suelo recibe
+también el snapshot completo.
+
+Todo se lee de SQLite (donde escriben las ETL y está row_changes), aunque el
+dashboard use otro backend: el Parquet de DuckDB puede ir por detrás de la BD
+y no casaría con la marca de agua.
+"""
+
+from django.db import DatabaseError, connection, transaction
+
+from analytics.backends import ISLAND_TABLE, ISLANDS_FACT, MONTHLY_FACT, TABLE_NAME
+
+CHANGE_LOG = "row_changes"
+CHANGE_LOG_FLOOR = "row_changes_floor"
+
+# dataset -> (tabla de hechos, columnas de las filas, igual que /download/ y las exportaciones)
+DELTA_DATASETS = {
+    "monthly": (MONTHLY_FACT, ("year", "month", "residence", "tourists")),
+    "islands": (ISLANDS_FACT, ("year", "month", "island", "residence", "tourists")),
+}
+
+
+def _scalar_or_zero(sql, params=()):
+    try:
+        # savepoint: el error de tabla inexistente no rompe la transacción de build_delta
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()[0] or 0
+    except DatabaseError:
+        return 0
+
+
+def current_watermark():
+    """
+    Último seq del registro de cambios o suelo más alto si es mayor (la poda
+    puede dejar el registro vacío). 0 si las ETL aún no lo han creado.
+    """
+    return max(
+        _scalar_or_zero(f"SELECT MAX(seq) FROM {CHANGE_LOG}"),
+        _scalar_or_zero(f"SELECT MAX(floor_seq) FROM {CHANGE_LOG_FLOOR}"),
+    )
+
+
+def change_log_floor(dataset):
+    """Seq hasta el que se han podado los cambios del dataset (0 = registro completo)."""
+    fact_table, _ = DELTA_DATASETS[dataset]
+    return _scalar_or_zero(
+        f"SELECT floor_seq FROM {CHANGE_LOG_FLOOR} WHERE fact_table = %s", [fact_table]
+    )
+
+
+def full_snapshot(dataset):
+    """Todas las filas actuales del dataset en SQLite, marcadas como 'insert'."""
+    table = ISLAND_TABLE if dataset == "islands" else TABLE_NAME
+    columns = DELTA_DATASETS[dataset][1]
+    keys = [c for c in columns if c != "tourists"]
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {', '.join(keys)}")
+        return [("insert", *row) for row in cursor.fetchall()]
+
+
+def changes_since(dataset, since, watermark):
+    """
+    Filas (op, *columnas) que cambiaron con since < seq <= watermark, una por
+    clave. En un borrado, tourists es NULL.
+    """
+    fact_table, _ = DELTA_DATASETS[dataset]
+    island_sql = "i.island, " if dataset == "islands" else ""
+    island_join = "JOIN dim_island i ON i.island_id = c.island_id" if dataset == "islands" else ""
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT
+                c.op,
+                (SELECT op FROM {CHANGE_LOG} WHERE seq = k.first_seq) AS first_op,
+                p.year, p.month, {island_sql}r.residence, c.tourists
+            FROM (
+                SELECT MIN(seq) AS first_seq, MAX(seq) AS last_seq
+                FROM {CHANGE_LOG}
+                WHERE fact_table = %s AND seq > %s AND seq <= %s
+                GROUP BY period_id, island_id, residence_id
+            ) k
+            JOIN {CHANGE_LOG} c ON c.seq = k.last_seq
+            JOIN dim_period p ON p.period_id = c.period_id
+            JOIN dim_residence r ON r.residence_id = c.residence_id
+            {island_join}
+            ORDER BY c.period_id, c.island_id, c.residence_id
+            """,
+            [fact_table, since, watermark],
+        )
+        rows = cursor.fetchall()
+
+    delta = []
+    for last_op, first_op, *values in rows:
+        if last_op == "delete":
+            if first_op == "insert":
+                continue  # creada y borrada después de la marca: el cliente nunca la vio
+            delta.append(("delete", *values))
+        else:
+            delta.append(("insert" if first_op == "insert" else "update", *values))
+    return delta
+
+
+def build_delta(dataset, since=None):
+    """
+    {"dataset", "since", "watermark", "full", "columns", "rows"}. Sin since
+    (o 0) devuelve todas las filas, igual que con una marca posterior a la
+    actual (BD recreada) o anterior al suelo del registro (cambios ya
+    podados): el cliente debe sustituir sus datos si full=True.
+    La marca de agua y las filas se leen en la misma transacción: una carga
+    concurrente no puede colarse entre las dos lecturas.
+    """
+    with transaction.atomic():
+        watermark = current_watermark()
+        full = not since or since > watermark or since < change_log_floor(dataset)
+        if full:
+            rows = full_snapshot(dataset)
+        else:
+            rows = changes_since(dataset, since, watermark)
+    return {
+        "dataset": dataset,
+        "since": since or 0,
+        "watermark": watermark,
+        "full": full,
+        "columns": ["op", *DELTA_DATASETS[dataset][1]],
+        "rows": rows,
+    }
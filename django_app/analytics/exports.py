@@ -0,0 +1,285 @@
+"""
+Cola de exportaciones en segundo plano.
+
+Las exportaciones grandes ya no se generan dentro de la petición:
+- /exports/ registra un trabajo en la tabla export_jobs (SQL directo, como
+  analytics_data_version) y responde enseguida con su id;
+- manage.py export_worker (pool local de hilos) reclama los trabajos en cola,
+  genera el fichero en settings.EXPORT_DIR y lo marca como terminado;
+- el cliente consulta /exports/<id>/ y descarga /exports/<id>/download/
+  (con settings.EXPORT_SENDFILE_HEADER, el fichero lo envía nginx/Apache).
+
+El fichero se identifica por (versión de datos, dataset, filtros, formato):
+una petición idéntica posterior reutiliza el trabajo terminado y su fichero
+sin volver a consultar la BD. Con una nueva versión de datos cambian las
+claves, y los ficheros de versiones antiguas se borran (prune_old_exports)
+cuando ya no tienen trabajos en curso ni terminados en los últimos
+PRUNE_GRACE segundos: un enlace de descarga recién entregado sigue valiendo.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+
+from analytics.backends import get_backend
+from analytics.caching import current_data_version
+
+EXPORT_JOBS_TABLE = "export_jobs"
+
+# dataset -> (nombre de fichero, filtros admitidos)
+EXPORT_DATASETS = {
+    "monthly": ("frontur_canarias_clean", ("residence", "year_from", "year_to")),
+    "islands": ("frontur_canarias_islands", ("residence", "island", "year_from", "year_to")),
+}
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Un trabajo "running" más antiguo que esto se considera de un worker caído
+RUNNING_TIMEOUT = 30 * 60
+
+# Margen antes de borrar los ficheros de una versión de datos antigua
+PRUNE_GRACE = 60 * 60
+
+JOB_COLUMNS = (
+    "id", "cache_key", "data_version", "dataset", "filters", "format", "status",
+    "file_path", "row_count", "error", "created_at", "started_at", "finished_at",
+)
+
+
+def ensure_jobs_table():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {EXPORT_JOBS_TABLE} (
+                id TEXT PRIMARY KEY,
+                cache_key TEXT NOT NULL,
+                data_version TEXT NOT NULL,
+                dataset TEXT NOT NULL,
+                filters TEXT NOT NULL,
+                format TEXT NOT NULL,
+                status TEXT NOT NULL,
+                file_path TEXT,
+                row_count INTEGER,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_{EXPORT_JOBS_TABLE}_key ON {EXPORT_JOBS_TABLE} (cache_key, status)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_{EXPORT_JOBS_TABLE}_queue ON {EXPORT_JOBS_TABLE} (status, created_at)"
+        )
+
+
+def normalize_export_filters(dataset, params):
+    """Filtros admitidos por el dataset, como dict ordenado y sin vacíos."""
+    allowed = EXPORT_DATASETS[dataset][1]
+    return {key: str(params.get(key)) for key in allowed if params.get(key)}
+
+
+def export_cache_key(version, dataset, filters, fmt):
+    payload = json.dumps({"dataset": dataset, "filters": filters, "format": fmt}, sort_keys=True)
+    return f"{version}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+
+def export_path(job):
+    filename_stem = EXPORT_DATASETS[job["dataset"]][0]
+    digest = job["cache_key"].rsplit(":", 1)[1][:16]
+    return Path(settings.EXPORT_DIR) / job["data_version"] / f"{filename_stem}-{digest}.{job['format']}"
+
+
+def sendfile_location(path, header):
+    """
+    Valor de la cabecera de descarga delegada: URL interna bajo
+    settings.EXPORT_SENDFILE_URL para X-Accel-Redirect (nginx) y ruta absoluta
+    para X-Sendfile.
+    """
+    if header.lower() == "x-accel-redirect":
+        relative = Path(path).relative_to(settings.EXPORT_DIR).as_posix()
+        return settings.EXPORT_SENDFILE_URL.rstrip("/") + "/" + relative
+    return str(Path(path).resolve())
+
+
+def _row_to_job(row):
+    job = dict(zip(JOB_COLUMNS, row))
+    job["filters"] = json.loads(job["filters"])
+    return job
+
+
+def _select_jobs(where_sql, params, limit=None):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM {EXPORT_JOBS_TABLE} {where_sql}"
+            + (f" LIMIT {int(limit)}" if limit else ""),
+            params,
+        )
+        return [_row_to_job(row) for row in cursor.fetchall()]
+
+
+def get_job(job_id):
+    ensure_jobs_table()
+    jobs = _select_jobs("WHERE id = %s", [job_id])
+    return jobs[0] if jobs else None
+
+
+def submit_export(dataset, filters, fmt):
+    """
+    Devuelve el trabajo para (versión, dataset, filtros, formato): uno
+    terminado con el fichero aún en disco, uno en curso o uno nuevo en cola.
+    """
+    ensure_jobs_table()
+    version = current_data_version()
+    key = export_cache_key(version, dataset, filters, fmt)
+
+    for job in _select_jobs(
+        "WHERE cache_key = %s AND status IN ('done', 'queued', 'running') ORDER BY created_at DESC",
+        [key],
+    ):
+        if job["status"] != "done" or Path(job["file_path"]).exists():
+            return job
+
+    job_id = uuid.uuid4().hex
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {EXPORT_JOBS_TABLE}
+                (id, cache_key, data_version, dataset, filters, format, status, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, 'queued', %s)
+            """,
+            [job_id, key, version, dataset, json.dumps(filters, sort_keys=True), fmt, time.time()],
+        )
+    return get_job(job_id)
+
+
+def claim_next_job():
+    """
+    Pasa a 'running' el trabajo en cola más antiguo y lo devuelve (None si no
+    hay). El UPDATE condicionado a status='queued' evita que dos workers
+    reclamen el mismo trabajo.
+    """
+    ensure_jobs_table()
+    with connection.cursor() as cursor:
+        # Trabajos de workers caídos vuelven a la cola
+        cursor.execute(
+            f"UPDATE {EXPORT_JOBS_TABLE} SET status = 'queued', started_at = NULL "
+            f"WHERE status = 'running' AND started_at < %s",
+            [time.time() - RUNNING_TIMEOUT],
+        )
+
+    while True:
+        candidates = _select_jobs("WHERE status = 'queued' ORDER BY created_at", [], limit=1)
+        if not candidates:
+            return None
+        job = candidates[0]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {EXPORT_JOBS_TABLE} SET status = 'running', started_at = %s "
+                f"WHERE id = %s AND status = 'queued'",
+                [time.time(), job["id"]],
+            )
+            if cursor.rowcount == 1:
+                return get_job(job["id"])
+
+
+def _write_rows(path, columns, rows, fmt):
+    if fmt == "csv":
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(rows)
+    else:
+        import pandas as pd
+
+        pd.DataFrame.from_records(rows, columns=columns).to_parquet(path, index=False)
+
+
+def run_job(job):
+    """Genera el fichero de un trabajo reclamado y actualiza su estado."""
+    try:
+        backend = get_backend()
+        filters = job["filters"]
+        backend_filters = {
+            "residence": filters.get("residence"),
+            "year_from": int(filters["year_from"]) if filters.get("year_from") else None,
+            "year_to": int(filters["year_to"]) if filters.get("year_to") else None,
+        }
+        if job["dataset"] == "islands":
+            columns, rows = backend.island_rows(backend_filters, filters.get("island"))
+        else:
+            columns, rows = backend.monthly_rows(backend_filters)
+
+        path = export_path(job)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Escritura atómica: nunca se sirve un fichero a medias
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            _write_rows(tmp_path, columns, rows, job["format"])
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+    except Exception as exc:
+        _finish_job(job["id"], "failed", error=f"{type(exc).__name__}: {exc}")
+        raise
+
+    _finish_job(job["id"], "done", file_path=str(path), row_count=len(rows))
+    return get_job(job["id"])
+
+
+def _finish_job(job_id, status, file_path=None, row_count=None, error=None):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {EXPORT_JOBS_TABLE}
+            SET status = %s, file_path = %s, row_count = %s, error = %s, finished_at = %s
+            WHERE id = %s
+            """,
+            [status, file_path, row_count, error, time.time(), job_id],
+        )
+
+
+def prune_old_exports(version, grace=PRUNE_GRACE):
+    """
+    Borra las carpetas de versiones de datos distintas de la publicada que
+    no tengan trabajos en cola o en curso ni terminados (ni ficheros
+    escritos) en los últimos `grace` segundos. Devuelve las carpetas borradas.
+    """
+    export_dir = Path(settings.EXPORT_DIR)
+    if not export_dir.exists():
+        return 0
+
+    ensure_jobs_table()
+    cutoff = time.time() - grace
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT DISTINCT data_version FROM {EXPORT_JOBS_TABLE}
+            WHERE status IN ('queued', 'running') OR finished_at >= %s
+            """,
+            [cutoff],
+        )
+        in_use = {row[0] for row in cursor.fetchall()}
+
+    removed = 0
+    for child in export_dir.iterdir():
+        if not child.is_dir() or child.name == version or child.name in in_use:
+            continue
+        if child.stat().st_mtime >= cutoff:
+            continue
+        shutil.rmtree(child, ignore_errors=True)
+        removed += 1
+    return removed
@@ -0,0 +1,41 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from analytics import anomalies
+from analytics.backends import get_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Puntúa todas las series mensuales (residencia, isla y residencia × isla) "
+        "buscando outliers, cambios estructurales y revisiones, y guarda el "
+        "resultado en la tabla series_anomalies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months", type=int, default=anomalies.RECENT_MONTHS,
+            help="Solo se guardan outliers y cambios de los últimos N meses.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        keys, periods, values = anomalies.build_series_matrix(get_backend())
+        t_matrix = time.perf_counter() - started
+
+        results = anomalies.detect_anomalies(
+            keys, periods, values, options["months"], anomalies.load_previous_state()
+        )
+        anomalies.save_anomalies(results)
+        if keys:
+            anomalies.save_state(keys, periods, values)
+
+        counts = Counter(r["anomaly_type"] for r in results)
+        self.stdout.write(self.style.SUCCESS(
+            f"[OK] {len(keys)} series × {len(periods)} meses · "
+            f"{counts['outlier']} outliers, {counts['break']} cambios, {counts['revision']} revisiones · "
+            f"{time.perf_counter() - started:.2f} s (matriz {t_matrix:.2f} s)"
+        ))
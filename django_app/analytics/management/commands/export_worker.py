@@ -0,0 +1,93 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from analytics.caching import current_data_version
+from analytics.exports import PRUNE_GRACE, claim_next_job, prune_old_exports, run_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker de exportaciones: procesa en un pool local los trabajos en cola "
+        "de export_jobs y deja los ficheros en settings.EXPORT_DIR."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=2,
+            help="Hilos que procesan trabajos a la vez.",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0,
+            help="Segundos de espera cuando la cola está vacía.",
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Procesa los trabajos en cola y termina (cron, tests).",
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options["workers"])
+        self._stop = threading.Event()
+        self._prune_lock = threading.Lock()
+        self._version = None
+        self._next_prune = 0.0
+
+        self.stdout.write(f"[EXPORT] Worker iniciado con {workers} hilos")
+        if workers == 1:
+            processed = self._loop(options["poll_interval"], options["once"])
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(self._loop, options["poll_interval"], options["once"])
+                    for _ in range(workers)
+                ]
+                try:
+                    processed = sum(f.result() for f in futures)
+                except KeyboardInterrupt:
+                    self._stop.set()
+                    raise
+        self.stdout.write(self.style.SUCCESS(f"[OK] {processed} exportaciones generadas"))
+
+    def _prune_if_new_version(self):
+        # También cada PRUNE_GRACE: las carpetas en margen al cambiar de versión se borran después
+        version = current_data_version()
+        with self._prune_lock:
+            if version != self._version or time.monotonic() >= self._next_prune:
+                removed = prune_old_exports(version)
+                if removed:
+                    self.stdout.write(f"[EXPORT] {removed} carpetas de versiones antiguas borradas")
+                self._version = version
+                self._next_prune = time.monotonic() + PRUNE_GRACE
+
+    def _loop(self, poll_interval, once):
+        processed = 0
+        try:
+            while not self._stop.is_set():
+                self._prune_if_new_version()
+                job = claim_next_job()
+                if job is None:
+                    if once:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                t0 = time.perf_counter()
+                try:
+                    done = run_job(job)
+                except Exception as exc:
+                    self.stderr.write(f"[ERROR] Exportación {job['id']}: {exc}")
+                    continue
+                processed += 1
+                self.stdout.write(
+                    f"  [export] {job['dataset']} {job['format']} {job['filters'] or ''} · "
+                    f"{done['row_count']} filas · {(time.perf_counter() - t0) * 1000:.0f} ms"
+                )
+        finally:
+            # Cada hilo tiene su propia conexión de Django
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+        return processed
@@ -0,0 +1,89 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.backends import get_backend
+from analytics.reports import (
+    REPORT_FORMATS,
+    generate_one,
+    init_worker,
+    load_shared_aggregates,
+    slugify_name,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera el pack de informes (CSV/JSON/HTML) de cada mercado de residencia "
+        "y de cada isla, repartiendo el trabajo en un pool de procesos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            help="Carpeta de salida (por defecto reports/<fecha-hora> en la raíz del proyecto).",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count() or 1,
+            help="Procesos del pool (1 = sin pool, en este mismo proceso).",
+        )
+        parser.add_argument(
+            "--formats", default=",".join(REPORT_FORMATS),
+            help="Formatos separados por comas: csv,json,html.",
+        )
+
+    def handle(self, *args, **options):
+        formats = tuple(f.strip() for f in options["formats"].split(",") if f.strip())
+        unknown = set(formats) - set(REPORT_FORMATS)
+        if unknown or not formats:
+            raise CommandError(f"Formatos no válidos: {', '.join(sorted(unknown)) or '(vacío)'}")
+
+        out_dir = Path(options["output"] or Path(settings.BASE_DIR) / "reports" / time.strftime("%Y%m%d-%H%M%S"))
+        out_dir.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+
+        # Dos consultas agrupadas para todo el pack; los workers solo calculan y escriben
+        aggregates = load_shared_aggregates(get_backend())
+        t_query = time.perf_counter() - started
+
+        tasks = [("residence", name, str(out_dir), formats) for name in sorted(aggregates["residence_series"])]
+        tasks += [("island", name, str(out_dir), formats) for name in sorted(aggregates["island_residence"])]
+
+        workers = max(1, options["workers"])
+        if workers == 1:
+            init_worker(aggregates)
+            results = [generate_one(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=init_worker, initargs=(aggregates,)
+            ) as pool:
+                results = list(pool.map(generate_one, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+        index = {
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "formats": list(formats),
+            "reports": [
+                {
+                    "kind": kind,
+                    "name": name,
+                    "files": [f"{kind}/{slugify_name(name)}.{fmt}" for fmt in formats],
+                    "seconds": round(seconds, 4),
+                    "bytes": written,
+                }
+                for kind, name, seconds, written in results
+            ],
+        }
+        (out_dir / "index.json").write_text(json.dumps(index, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        elapsed = time.perf_counter() - started
+        per_report = sum(r[2] for r in results) / len(results) if results else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"[OK] {len(results)} informes en {out_dir} · {elapsed:.2f} s "
+            f"(consultas {t_query:.2f} s, {workers} workers, "
+            f"{len(results) / elapsed:.1f} informes/s, {per_report * 1000:.1f} ms/informe)"
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from analytics.caching import new_data_version, publish_data_version
+
+
+class Command(BaseCommand):
+    help = (
+        "Publica una nueva versión de datos sin precalcular la caché: el "
+        "dashboard deja de servir la caché de la carga anterior y calcula "
+        "bajo demanda."
+    )
+
+    def handle(self, *args, **options):
+        version = new_data_version()
+        publish_data_version(version)
+        self.stdout.write(self.style.SUCCESS(f"[OK] Versión de datos {version} publicada"))
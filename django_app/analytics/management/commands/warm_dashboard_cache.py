@@ -0,0 +1,91 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from analytics.backends import get_backend
+from analytics.caching import (
+    current_data_version,
+    dashboard_cache_key,
+    new_data_version,
+    publish_data_version,
+    series_cache_key,
+)
+from analytics.downsampling import DEFAULT_POINTS
+from analytics.views import _filters_from_params, build_dashboard_context, build_series
+
+
+class Command(BaseCommand):
+    help = (
+        "Precalcula en caché las combinaciones de filtros más usadas del dashboard "
+        "para una nueva versión de datos y después la publica."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top-residences", type=int, default=10,
+            help="Número de mercados principales a precalcular con filtro de residencia.",
+        )
+        parser.add_argument(
+            "--no-publish", action="store_true",
+            help="Calienta la versión publicada actual en vez de crear y publicar una nueva.",
+        )
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        version = current_data_version() if options["no_publish"] else new_data_version()
+        started = time.perf_counter()
+
+        # La vista por defecto da los mercados, islas y años disponibles
+        base = build_dashboard_context({}, backend)
+        combos = [{}] + hot_filter_combinations(base, options["top_residences"])
+
+        for params in combos:
+            t0 = time.perf_counter()
+            context = base if not params else build_dashboard_context(params, backend)
+            cache.set(
+                dashboard_cache_key(version, backend.name, params),
+                context,
+                settings.DASHBOARD_CACHE_TIMEOUT,
+            )
+            self.stdout.write(f"  [warm] {params or '(por defecto)'} · {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+        # Series de /series/ con la resolución por defecto (total y mercados principales)
+        for params in [{}] + [c for c in combos if set(c) == {"residence"}]:
+            filters = _filters_from_params(params)
+            cache.set(
+                series_cache_key(version, backend.name, filters, DEFAULT_POINTS),
+                build_series(filters, DEFAULT_POINTS, backend),
+                settings.DASHBOARD_CACHE_TIMEOUT,
+            )
+
+        if not options["no_publish"]:
+            publish_data_version(version)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"[OK] {len(combos)} combinaciones precalculadas para la versión {version} "
+            f"en {time.perf_counter() - started:.2f} s"
+            + ("" if options["no_publish"] else " (publicada)")
+        ))
+
+
+def hot_filter_combinations(base_context, top_residences=10):
+    """
+    Combinaciones de filtros más habituales a partir del contexto por defecto:
+    mercados principales, cada isla, últimos años y comparación del último
+    año completo con el anterior.
+    """
+    top = base_context["residences_ranked"][:top_residences]
+
+    combos = [{"residence": residence} for residence in top]
+
+    for island in base_context["available_islands"]:
+        combos.append({"island": island})
+
+    years = base_context["years_available"]
+    if len(years) >= 3:
+        combos.append({"year_from": str(years[-3]), "year_to": str(years[-1])})
+        # El último año suele estar incompleto: comparamos los dos anteriores completos
+        combos.append({"year_a": str(years[-2]), "year_b": str(years[-3])})
+    return combos
@@ -0,0 +1,203 @@
+"""
+Generación del "report pack": un informe por mercado (residencia) y por isla.
+
+Los agregados se leen UNA vez (dos consultas agrupadas) y se comparten con
+todos los procesos del pool; cada informe solo hace cálculos en memoria y
+escribe sus ficheros (CSV / JSON / HTML).
+"""
+
+import csv
+import json
+import re
+import time
+import unicodedata
+from collections import defaultdict
+from pathlib import Path
+
+# Agregados compartidos por los workers del pool (ver init_worker)
+_AGGREGATES = None
+
+REPORT_FORMATS = ("csv", "json", "html")
+
+
+def load_shared_aggregates(backend):
+    """
+    Lee los agregados que necesitan todos los informes:
+    - residence_series: {residencia: {(year, month): total}} (tabla principal)
+    - island_residence: {isla: {residencia: {(year, month): total}}} (tabla de islas)
+    Solo tipos básicos, para que se serialicen baratos hacia los workers.
+    """
+    residence_series = defaultdict(dict)
+    for label, year, month, total in backend.period_totals("residence", "month", {}):
+        residence_series[label][(int(year), int(month))] = float(total or 0.0)
+
+    island_residence = defaultdict(lambda: defaultdict(dict))
+    for island, residence, year, month, total in backend.island_residence_totals({}):
+        island_residence[island][residence][(int(year), int(month))] = float(total or 0.0)
+
+    return {
+        "residence_series": dict(residence_series),
+        "island_residence": {i: dict(r) for i, r in island_residence.items()},
+    }
+
+
+def init_worker(aggregates):
+    """Inicializador del pool: guarda los agregados y prepara Django (spawn en Windows/macOS)."""
+    global _AGGREGATES
+    _AGGREGATES = aggregates
+
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def slugify_name(name):
+    text = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "sin-nombre"
+
+
+def _sum_series(series_list):
+    total = defaultdict(float)
+    for series in series_list:
+        for period, value in series.items():
+            total[period] += value
+    return dict(total)
+
+
+def _last_12_window(periods):
+    return sorted(periods)[-12:]
+
+
+def _shares(series_by_key, window):
+    """Reparto (%) de cada clave sobre la suma de la ventana de periodos."""
+    totals = {
+        key: sum(series.get(p, 0.0) for p in window)
+        for key, series in series_by_key.items()
+    }
+    grand = sum(totals.values())
+    rows = [
+        {"name": key, "tourists": int(val), "share_pct": round(val / grand * 100, 2) if grand else None}
+        for key, val in totals.items()
+    ]
+    rows.sort(key=lambda r: r["tourists"], reverse=True)
+    return rows
+
+
+def series_report(series):
+    """KPIs, estacionalidad y tendencia de 12 meses de una serie mensual {(y, m): total}."""
+    ordered = sorted(series.items())
+    if not ordered:
+        return {"kpis": {}, "seasonality": [], "trend_12m": [], "series": []}
+
+    values = [v for _, v in ordered]
+    kpis = {
+        "date_min": "{}-{:02d}".format(*ordered[0][0]),
+        "date_max": "{}-{:02d}".format(*ordered[-1][0]),
+        "total_tourists": int(sum(values)),
+        "last_12m": int(sum(values[-12:])) if len(values) >= 12 else None,
+        "prev_12m": int(sum(values[-24:-12])) if len(values) >= 24 else None,
+        "growth_12m_pct": None,
+    }
+    if kpis["last_12m"] is not None and kpis["prev_12m"]:
+        kpis["growth_12m_pct"] = round((kpis["last_12m"] - kpis["prev_12m"]) / kpis["prev_12m"] * 100, 2)
+    (py, pm), pval = max(ordered, key=lambda item: item[1])
+    kpis["peak_month"] = f"{py}-{pm:02d}"
+    kpis["peak_value"] = int(pval)
+
+    month_totals = defaultdict(float)
+    month_counts = defaultdict(int)
+    for (_, m), v in ordered:
+        month_totals[m] += v
+        month_counts[m] += 1
+    seasonality = [
+        {"month": m, "avg_tourists": int(month_totals[m] / month_counts[m])}
+        for m in range(1, 13) if month_counts[m]
+    ]
+
+    # Tendencia: suma móvil de 12 meses en los últimos 12 puntos
+    trend = []
+    for i in range(max(len(values) - 12, 11), len(values)):
+        (y, m), v = ordered[i]
+        trend.append({
+            "period": f"{y}-{m:02d}",
+            "tourists": int(v),
+            "rolling_12m": int(sum(values[i - 11:i + 1])) if i >= 11 else None,
+        })
+
+    return {
+        "kpis": kpis,
+        "seasonality": seasonality,
+        "trend_12m": trend,
+        "series": [{"period": f"{y}-{m:02d}", "tourists": int(v)} for (y, m), v in ordered],
+    }
+
+
+def build_report(kind, name, aggregates=None):
+    """Construye el informe de un mercado (kind='residence') o de una isla (kind='island')."""
+    aggregates = aggregates or _AGGREGATES
+    island_residence = aggregates["island_residence"]
+
+    if kind == "residence":
+        report = series_report(aggregates["residence_series"].get(name, {}))
+        by_island = {
+            island: residences[name]
+            for island, residences in island_residence.items() if name in residences
+        }
+        window = _last_12_window(set().union(*by_island.values())) if by_island else []
+        report["island_share_12m"] = _shares(by_island, window)
+    else:
+        residences = island_residence.get(name, {})
+        island_series = _sum_series(residences.values())
+        report = series_report(island_series)
+        window = _last_12_window(island_series)
+        report["market_mix_12m"] = _shares(residences, window)
+
+        all_islands = {i: _sum_series(r.values()) for i, r in island_residence.items()}
+        share = next((row for row in _shares(all_islands, window) if row["name"] == name), None)
+        report["kpis"]["island_share_12m_pct"] = share["share_pct"] if share else None
+
+    report["kind"] = kind
+    report["name"] = name
+    return report
+
+
+def write_report(report, out_dir, formats=REPORT_FORMATS):
+    """Escribe los ficheros del informe. Devuelve los bytes escritos."""
+    out_dir = Path(out_dir) / report["kind"]
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = slugify_name(report["name"])
+    written = 0
+
+    if "json" in formats:
+        path = out_dir / f"{stem}.json"
+        path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        written += path.stat().st_size
+
+    if "csv" in formats:
+        path = out_dir / f"{stem}.csv"
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["period", "tourists"])
+            for row in report["series"]:
+                writer.writerow([row["period"], row["tourists"]])
+        written += path.stat().st_size
+
+    if "html" in formats:
+        from django.template.loader import render_to_string
+
+        path = out_dir / f"{stem}.html"
+        path.write_text(render_to_string("analytics/report.html", {"report": report}), encoding="utf-8")
+        written += path.stat().st_size
+
+    return written
+
+
+def generate_one(task):
+    """Tarea del pool: (kind, name, out_dir, formats) → (kind, name, segundos, bytes)."""
+    kind, name, out_dir, formats = task
+    t0 = time.perf_counter()
+    report = build_report(kind, name)
+    written = write_report(report, out_dir, formats)
+    return kind, name, time.perf_counter() - t0, written
@@ -0,0 +1,111 @@
+"""
+Coalescencia de peticiones ("single flight") sobre la caché de Django.
+
+Cuando llegan a la vez varias peticiones idénticas sin resultado en caché,
+solo una calcula; el resto espera a que el resultado aparezca en la caché.
+
+- Entre hilos del mismo proceso: un threading.Lock por clave.
+- Entre procesos (workers de gunicorn): un fichero de lock creado con
+  O_CREAT | O_EXCL (atómico en POSIX) en settings.SINGLE_FLIGHT_LOCK_DIR.
+  Un lock más antiguo que LOCK_TIMEOUT se considera huérfano (worker caído)
+  y se puede reclamar.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+LOCK_TIMEOUT = 60        # segundos antes de considerar un lock huérfano
+WAIT_TIMEOUT = 30        # espera máxima de un seguidor antes de calcular él mismo
+POLL_INTERVAL = 0.05
+
+_MISSING = object()
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def _local_lock(key):
+    with _local_locks_guard:
+        lock = _local_locks.get(key)
+        if lock is None:
+            lock = _local_locks[key] = threading.Lock()
+        return lock
+
+
+def _lock_path(key):
+    lock_dir = Path(settings.SINGLE_FLIGHT_LOCK_DIR)
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    return lock_dir / (hashlib.sha1(key.encode("utf-8")).hexdigest() + ".lock")
+
+
+def _try_acquire(path):
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - path.stat().st_mtime > LOCK_TIMEOUT:
+                path.unlink()
+                return _try_acquire(path)
+        except FileNotFoundError:
+            return _try_acquire(path)
+        return False
+    os.write(fd, str(os.getpid()).encode("ascii"))
+    os.close(fd)
+    return True
+
+
+def _release(path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def single_flight(key, compute, timeout=DEFAULT_TIMEOUT):
+    """
+    Devuelve cache[key]; si no existe, lo calcula una sola vez aunque haya
+    peticiones concurrentes (en este proceso o en otros workers).
+    """
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    with _local_lock(key):
+        try:
+            return _compute_once(key, compute, timeout)
+        finally:
+            with _local_locks_guard:
+                _local_locks.pop(key, None)
+
+
+def _compute_once(key, compute, timeout):
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    path = _lock_path(key)
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while not _try_acquire(path):
+        # Otro worker está calculando: esperamos su resultado
+        time.sleep(POLL_INTERVAL)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if time.monotonic() > deadline:
+            return compute()
+
+    try:
+        value = cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            cache.set(key, value, timeout)
+        return value
+    finally:
+        _release(path)
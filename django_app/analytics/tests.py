@@ -1,3 +1,1337 @@
-from django.test import TestCase
+import importlib
+import importlib.util
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from analytics.backends import ISLAND_TABLE, TABLE_NAME, forget_sqlite_tables
+from analytics.caching import current_data_version, dashboard_cache_key
+from analytics.singleflight import single_flight
+
+HAS_DUCKDB = (
+    importlib.util.find_spec("duckdb") is not None
+    and importlib.util.find_spec("pyarrow") is not None
+)
+
+RESIDENCES = ["Germany", "Spain", "United Kingdom"]
+ISLANDS = ["Fuerteventura", "Gran Canaria", "Lanzarote", "Tenerife"]
+YEARS = [2018, 2019, 2020, 2021]
+
+
+def _fixture_rows():
+    """Datos sintéticos deterministas con la forma de las tablas de las ETL."""
+    monthly = []
+    islands = []
+    for year in YEARS:
+        for month in range(1, 13):
+            for r_idx, residence in enumerate(RESIDENCES):
+                base = 1000 * (r_idx + 1) + 37 * month + (year - 2018) * 11
+                if year == 2020 and 4 <= month <= 6:
+                    base = base // 20  # caída tipo COVID
+                monthly.append((year, month, residence, float(base)))
+                for i_idx, island in enumerate(ISLANDS):
+                    islands.append(
+                        (year, month, f"{year}-{month:02d}-01", residence, island,
+                         float(base * (i_idx + 1) / 10))
+                    )
+    return monthly, islands
+
+
+def import_etl_module(name):
+    """Importa un módulo de etl/ (los scripts usan imports entre hermanos)."""
+    sys.path.insert(0, str(settings.BASE_DIR / "etl"))
+    try:
+        return importlib.import_module(name)
+    finally:
+        sys.path.pop(0)
+
+
+def create_frontur_tables(monthly, islands, star=True):
+    """
+    Crea en la BD de test las tablas que normalmente generan las ETL.
+    Por defecto con el esquema en estrella de etl/star_schema.py; con
+    star=False, las tablas planas anteriores (BD sin migrar).
+    """
+    if star:
+        import pandas as pd
+
+        star_schema = import_etl_module("star_schema")
+
+        connection.ensure_connection()
+        raw = connection.connection
+        star_schema.load_monthly(
+            raw, pd.DataFrame(monthly, columns=["year", "month", "residence", "tourists"])
+        )
+        star_schema.load_islands(
+            raw,
+            pd.DataFrame(
+                islands, columns=["year", "month", "date", "residence", "island", "tourists"]
+            ).drop(columns=["date"]),
+        )
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE {TABLE_NAME} (year BIGINT, month BIGINT, residence TEXT, tourists FLOAT)"
+        )
+        cursor.execute(
+            f"""
+            CREATE TABLE {ISLAND_TABLE} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                residence TEXT NOT NULL,
+                island TEXT NOT NULL,
+                tourists REAL
+            )
+            """
+        )
+        cursor.executemany(f"INSERT INTO {TABLE_NAME} VALUES (%s, %s, %s, %s)", monthly)
+        cursor.executemany(
+            f"INSERT INTO {ISLAND_TABLE} (year, month, date, residence, island, tourists) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            islands,
+        )
+
+
+def write_parquet_store(root, monthly, islands):
+    """Escribe los mismos datos con processed_store, como las ETL (dataset=<tabla>/year=<YYYY>)."""
+    import pandas as pd
+
+    processed_store = import_etl_module("processed_store")
+
+    df_monthly = pd.DataFrame(monthly, columns=["year", "month", "residence", "tourists"])
+    df_islands = pd.DataFrame(
+        islands, columns=["year", "month", "date", "residence", "island", "tourists"]
+    ).drop(columns=["date"])
+
+    processed_store.write_dataset(df_monthly, TABLE_NAME, root=root)
+    processed_store.write_dataset(df_islands, ISLAND_TABLE, root=root, chunk_rows=100)
+    processed_store.write_dataset(
+        processed_store.island_marginals(df_islands), processed_store.ISLANDS_MARGINALS_DATASET, root=root
+    )
+
+
+# Caché en memoria y locks en un directorio temporal: los tests no tocan data/cache
+TEST_CACHE_SETTINGS = {
+    "CACHES": {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    "SINGLE_FLIGHT_LOCK_DIR": Path(tempfile.gettempdir()) / "kanarytour-test-locks",
+}
+
+
+@override_settings(**TEST_CACHE_SETTINGS)
+class FronturTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Las tablas creadas en setUpTestData se deshacen entre clases
+        forget_sqlite_tables()
+
+
+# KPIs del contexto del dashboard que deben coincidir entre backends
+KPI_KEYS = [
+    "total_rows",
+    "date_min",
+    "date_max",
+    "total_visitors",
+    "kpi_last_12m",
+    "kpi_prev_12m",
+    "kpi_last_12m_growth_pct",
+    "best_period_label",
+    "best_period_value",
+    "top_residences",
+    "main_market_name",
+    "main_market_share",
+    "baseline_avg",
+    "covid_min_label",
+    "covid_min_val",
+    "recovery_month_label",
+    "chart_labels",
+    "chart_values",
+    "season_values",
+    "series_per_residence_json",
+    "islands_table",
+    "islands_total_12m",
+    "years_available",
+    "year_compare_delta",
+]
+
+
+@override_settings(ANALYTICS_BACKEND="sqlite")
+class DashboardSQLiteTests(FronturTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_frontur_tables(*_fixture_rows())
+
+    def test_dashboard_kpis(self):
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        ctx = response.context
+        self.assertEqual(ctx["total_rows"], len(YEARS) * 12 * len(RESIDENCES))
+        self.assertEqual(ctx["date_min"], "2018-01")
+        self.assertEqual(ctx["date_max"], "2021-12")
+        self.assertEqual(ctx["covid_min_label"], "2020-04")
+        self.assertEqual(len(ctx["islands_table"]), len(ISLANDS))
+
+    def test_legacy_flat_tables_give_same_context(self):
+        star_ctx = self.client.get("/", {"residence": "Spain"}).context
+        with connection.cursor() as cursor:
+            for name in (TABLE_NAME, ISLAND_TABLE):
+                cursor.execute(f"DROP VIEW {name}")
+            for name in ("fact_canarias_monthly", "fact_canarias_islands_monthly"):
+                cursor.execute(f"DROP TABLE {name}")
+        create_frontur_tables(*_fixture_rows(), star=False)
+        cache.clear()
+
+        flat_ctx = self.client.get("/", {"residence": "Spain"}).context
+        for key in KPI_KEYS:
+            with self.subTest(key=key):
+                self.assertEqual(star_ctx[key], flat_ctx[key])
+
+    def test_download_respects_filters(self):
+        response = self.client.get("/download/", {"residence": "Spain", "year_from": 2021})
+        self.assertEqual(response.status_code, 200)
+        lines = response.content.decode().strip().splitlines()
+        self.assertEqual(lines[0], "year,month,residence,tourists")
+        self.assertEqual(len(lines) - 1, 12)
+
+
+@override_settings(DEBUG=True)
+class DebugSqlLoggingTests(FronturTestCase):
+    """Con DEBUG el log de SQL formatea la consulta con sus params: nada de % sueltos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_frontur_tables(*_fixture_rows())
+
+    def test_filtered_endpoints_work_in_debug(self):
+        for url, params in (
+            ("/series/", {"residence": "Germany"}),
+            ("/series/", {"year_from": 2020}),
+            ("/compare/", {"granularity": "month", "periods": "2021-01,2020-01", "residence": "Germany"}),
+        ):
+            with self.subTest(url=url, params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 200)
+
+    def test_report_aggregates_with_filters_in_debug(self):
+        from analytics.backends import get_backend
+
+        rows = get_backend().island_residence_totals({"residence": "Germany", "year_from": 2021})
+        self.assertEqual(len(rows), 12 * len(ISLANDS))
+        self.assertEqual(sorted({r[3] for r in rows}), list(range(1, 13)))
+
+
+class BackendParityTests(FronturTestCase):
+    """Los paneles deben dar exactamente los mismos KPIs en SQLite y en DuckDB."""
+
+    @classmethod
+    def setUpTestData(cls):
+        monthly, islands = _fixture_rows()
+        create_frontur_tables(monthly, islands)
+
+    def setUp(self):
+        super().setUp()
+        if not HAS_DUCKDB:
+            self.skipTest("duckdb/pyarrow no instalados")
+        self.parquet_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.parquet_dir, True)
+        write_parquet_store(self.parquet_dir, *_fixture_rows())
+
+    def _context(self, backend, params):
+        with self.settings(ANALYTICS_BACKEND=backend, ANALYTICS_PARQUET_DIR=self.parquet_dir):
+            response = self.client.get("/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def assertParity(self, params):
+        sqlite_ctx = self._context("sqlite", params)
+        duckdb_ctx = self._context("duckdb", params)
+        for key in KPI_KEYS:
+            with self.subTest(key=key, params=params):
+                self.assertEqual(sqlite_ctx[key], duckdb_ctx[key])
+
+    def test_default_dashboard(self):
+        self.assertParity({})
+
+    def test_residence_filter(self):
+        self.assertParity({"residence": "Germany"})
+
+    def test_year_range_and_compare(self):
+        self.assertParity({"year_from": 2019, "year_to": 2021, "year_a": 2021, "year_b": 2019})
+
+    def test_island_drilldown_parity(self):
+        for params in ({}, {"residence": "Germany"}, {"island": "Tenerife", "year_from": 2020, "year_to": 2020},
+                       {"residence": "Spain", "island": "Lanzarote", "year_from": 2019}):
+            with self.subTest(params=params):
+                with self.settings(ANALYTICS_BACKEND="sqlite"):
+                    sqlite_json = self.client.get("/islands/", params).json()
+                with self.settings(ANALYTICS_BACKEND="duckdb", ANALYTICS_PARQUET_DIR=self.parquet_dir):
+                    duckdb_json = self.client.get("/islands/", params).json()
+                self.assertEqual(sqlite_json, duckdb_json)
+
+    def test_duckdb_drilldown_reads_marginals(self):
+        from analytics.backends import get_backend
+
+        with self.settings(ANALYTICS_BACKEND="duckdb", ANALYTICS_PARQUET_DIR=self.parquet_dir):
+            backend = get_backend()
+            seen = []
+            fetch = backend._fetch
+            with mock.patch.object(backend, "_fetch", lambda sql, params: seen.append(sql) or fetch(sql, params)):
+                backend.drilldown_totals("island", (2020, 1), (2020, 12), residence="Germany")
+        self.assertIn("dataset=agg_islands_marginals", seen[0])
+        self.assertNotIn(f"dataset={ISLAND_TABLE}/", seen[0])
+
+    def test_duckdb_missing_dataset_is_a_configuration_error(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from analytics.backends import get_backend
+
+        empty_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, empty_dir, True)
+        with self.settings(ANALYTICS_BACKEND="duckdb", ANALYTICS_PARQUET_DIR=empty_dir):
+            backend = get_backend()
+            self.assertIsNone(backend.measure_kpis({}))
+            with self.assertRaisesMessage(ImproperlyConfigured, f"Falta el dataset Parquet {TABLE_NAME!r}"):
+                backend.monthly_rows({})
+            with self.assertRaisesMessage(ImproperlyConfigured, "ANALYTICS_BACKEND='sqlite'"):
+                self.client.get("/")
+
+    def test_download_parity(self):
+        params = {"residence": "United Kingdom", "year_from": 2020}
+        with self.settings(ANALYTICS_BACKEND="sqlite"):
+            sqlite_csv = self.client.get("/download/", params).content
+        with self.settings(ANALYTICS_BACKEND="duckdb", ANALYTICS_PARQUET_DIR=self.parquet_dir):
+            duckdb_csv = self.client.get("/download/", params).content
+        self.assertEqual(sqlite_csv, duckdb_csv)
+
+
+@override_settings(ANALYTICS_BACKEND="sqlite")
+class ComparisonEndpointTests(FronturTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_frontur_tables(*_fixture_rows())
+
+    def test_non_numeric_years_are_bad_requests(self):
+        for url in ("/compare/", "/series/", "/", "/download/", "/islands/"):
+            for key in ("year_from", "year_to"):
+                with self.subTest(url=url, key=key):
+                    self.assertEqual(self.client.get(url, {key: "abc"}).status_code, 400)
+        self.assertEqual(self.client.get("/series/", {"year_from": "2020"}).status_code, 200)
+
+    def test_year_matrix_per_residence(self):
+        response = self.client.get(
+            "/compare/", {"periods": "2019,2021", "dimension": "total,residence"}
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        residence = data["dimensions"]["residence"]
+        self.assertEqual(residence["labels"], RESIDENCES)
+        self.assertEqual(residence["periods"], ["2019", "2021"])
+
+        # Germany: base = 1000 + 37*m + (year-2018)*11
+        total_2019 = sum(1000 + 37 * m + 11 for m in range(1, 13))
+        total_2021 = sum(1000 + 37 * m + 33 for m in range(1, 13))
+        self.assertEqual(residence["totals"][0], [total_2019, total_2021])
+        expected = round((total_2021 - total_2019) / total_2019 * 100, 2)
+        self.assertEqual(residence["pct_change"][0][1][0], expected)
+        self.assertEqual(residence["pct_change"][0][0][0], 0.0)
+
+    def test_month_matrix_includes_same_month_last_year(self):
+        response = self.client.get(
+            "/compare/", {"periods": "2021-04,2020-04", "dimension": "island"}
+        )
+        data = response.json()
+        island = data["dimensions"]["island"]
+        self.assertEqual(island["yoy_base_periods"], ["2020-04", "2019-04"])
+        # 2021-04 frente a 2020-04 (caída COVID) es una subida fuerte
+        self.assertGreater(island["yoy_pct"][0][0], 100)
+
+    def test_csv_and_validation(self):
+        response = self.client.get(
+            "/compare/", {"periods": "2019,2020,2021", "dimension": "total", "format": "csv"}
+        )
+        lines = response.content.decode().strip().splitlines()
+        self.assertEqual(len(lines) - 1, 3 * 2)  # N×N sin la diagonal
+
+        self.assertEqual(self.client.get("/compare/", {"periods": "2019,2020-01"}).status_code, 400)
+        self.assertEqual(self.client.get("/compare/", {"dimension": "country"}).status_code, 400)
+
+
+@override_settings(**TEST_CACHE_SETTINGS)
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_callers_share_one_computation(self):
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"value": 42}
+
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight("sf:test", compute)))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"value": 42}] * 8)
+
+
+@override_settings(ANALYTICS_BACKEND="sqlite")
+class CacheWarmupTests(FronturTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_frontur_tables(*_fixture_rows())
+
+    def test_warmup_publishes_new_version_with_hot_filters_cached(self):
+        self.assertEqual(current_data_version(), "0")
+        call_command("warm_dashboard_cache", stdout=StringIO())
+
+        version = current_data_version()
+        self.assertNotEqual(version, "0")
+        for params in ({}, {"residence": "Germany"}, {"island": "Tenerife"}):
+            self.assertIsNotNone(cache.get(dashboard_cache_key(version, "sqlite", params)))
+
+    def test_cached_context_holds_aggregates_not_raw_rows(self):
+        call_command("warm_dashboard_cache", stdout=StringIO())
+        context = cache.get(dashboard_cache_key(current_data_version(), "sqlite", {}))
+        self.assertNotIn("records", context)
+        self.assertLessEqual(len(context["rows"]), 500)
+        self.assertEqual(sorted(context["residences_ranked"]), RESIDENCES)
+        self.assertEqual(context["residences_ranked"][0], context["top_residences"][0]["residence"])
+
+    def test_publish_command_replaces_version_without_warmup(self):
+        call_command("warm_dashboard_cache", stdout=StringIO())
+        warmed = current_data_version()
+        call_command("publish_data_version", stdout=StringIO())
+        self.assertNotIn(current_data_version(), ("0", warmed))
+
+    def test_failed_warmup_still_publishes_a_version(self):
+        from unittest import mock
+
+        post_load = import_etl_module("post_load")
+
+        def run_hooks(failing):
+            ran = []
+
+            def fake_run(args, cwd):
+                ran.append(args[2:])
+                return mock.Mock(returncode=1 if args[2:] == failing else 0)
+
+            with mock.patch.object(post_load.subprocess, "run", fake_run), redirect_stdout(StringIO()):
+                post_load.run_post_load_hooks()
+            return ran
+
+        self.assertEqual(
+            run_hooks(failing=post_load.WARMUP_COMMAND),
+            [["detect_anomalies"], ["warm_dashboard_cache"], ["publish_data_version"]],
+        )
+        self.assertEqual(run_hooks(failing=None), [["detect_anomalies"], ["warm_dashboard_cache"]])
+
+    def test_dashboard_serves_cached_context(self):
+        call_command("warm_dashboard_cache", stdout=StringIO())
+        with self.assertNumQueries(1):  # solo la lectura de la versión publicada
+            response = self.client.get("/", {"residence": "Germany"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["current_residence"], "Germany")
+
+
+class IslandDrilldownTests(FronturTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_frontur_tables(*_fixture_rows())
+
+    def _island_total(self, residence=None, years=YEARS, months=range(1, 13)):
+        return sum(
+            t for y, m, _, r, _, t in _fixture_rows()[1]
+            if (residence is None or r == residence) and y in years and m in months
+        )
+
+    def test_schema_checked_once_per_request(self):
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get("/islands/", {"residence": "Germany"}).status_code, 200)
+            self.assertEqual(self.client.get("/islands/", {"island": "Tenerife"}).status_code, 200)
+        schema_queries = [q for q in ctx.captured_queries if "sqlite_master" in q["sql"]]
+        self.assertEqual(len(schema_queries), 2)
+
+    def test_marginals_hold_fact_rows_and_rollups(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM agg_islands_marginals")
+            n_rows = cursor.fetchone()[0]
+            cursor.execute("SELECT tourists FROM agg_islands_marginals "
+                           "WHERE residence_id = 0 AND island_id = 0 AND period_id = 202001")
+            period_total = cursor.fetchone()[0]
+            # Mix de mercados de una isla: rango del índice por isla, sin recorrer la tabla
+            cursor.execute("EXPLAIN QUERY PLAN SELECT residence_id, SUM(tourists) FROM agg_islands_marginals "
+                           "WHERE island_id = 3 AND residence_id <> 0 AND period_id BETWEEN 202001 AND 202012 "
+                           "GROUP BY residence_id")
+            plan = " ".join(str(row) for row in cursor.fetchall())
+
+        n_periods = len(YEARS) * 12
+        n_r, n_i = len(RESIDENCES), len(ISLANDS)
+        self.assertEqual(n_rows, n_periods * (n_r * n_i + n_r + n_i + 1))
+        self.assertAlmostEqual(period_total, self._island_total(years=[2020], months=[1]))
+        self.assertIn("SEARCH agg_islands_marginals USING", plan)
+        self.assertNotIn("SCAN", plan)
+
+    def test_island_panel_follows_residence_and_years(self):
+        ctx = self.client.get("/", {"residence": "Germany"}).context
+        self.assertEqual(ctx["islands_total_12m"], int(self._island_total("Germany", years=[2021])))
+        self.assertEqual([i["island"] for i in ctx["islands_table"]], list(reversed(ISLANDS)))
+
+        ctx = self.client.get("/", {"residence": "Spain", "year_from": 2018, "year_to": 2019}).context
+        self.assertEqual(ctx["islands_window_label"], "2018-01 a 2019-12")
+        self.assertEqual(ctx["islands_total_12m"], int(self._island_total("Spain", years=[2018, 2019])))
+
+    def test_island_filter_shows_market_mix_and_keeps_all_islands(self):
+        ctx = self.client.get("/", {"island": "Tenerife"}).context
+        self.assertEqual(len(ctx["islands_table"]), len(ISLANDS))
+        self.assertEqual([i["island"] for i in ctx["islands_table"] if i["selected"]], ["Tenerife"])
+        markets = ctx["island_markets"]
+        self.assertEqual([m["residence"] for m in markets], list(reversed(RESIDENCES)))
+        self.assertAlmostEqual(sum(m["share_pct"] for m in markets), 100.0)
+
+    def test_json_endpoint_matches_fact_table_fallback(self):
+        params = {"residence": "Germany", "island": "Lanzarote", "year_from": 2020, "year_to": 2020}
+        from_marginals = self.client.get("/islands/", params).json()
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE agg_islands_marginals")
+        from_facts = self.client.get("/islands/", params).json()
+
+        self.assertEqual(from_marginals, from_facts)
+        self.assertEqual(from_marginals["islands_total"], int(self._island_total("Germany", years=[2020])))
+        self.assertEqual(len(from_marginals["residences"]), len(RESIDENCES))
+        self.assertEqual(self.client.get("/islands/", {"year_from": "x"}).status_code, 400)
+
+
+class DeltaFeedTests(FronturTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_frontur_tables(*_fixture_rows())
+
+    def _reload_monthly(self, monthly):
+        import pandas as pd
+
+        star_schema = import_etl_module("star_schema")
+        connection.ensure_connection()
+        star_schema.load_monthly(
+            connection.connection, pd.DataFrame(monthly, columns=["year", "month", "residence", "tourists"])
+        )
+
+    def _delta(self, **params):
+        return self.client.get("/download/delta/", params).json()
+
+    def test_first_refresh_is_full_snapshot(self):
+        data = self._delta()
+        self.assertTrue(data["full"])
+        self.assertGreater(data["watermark"], 0)
+        self.assertEqual(data["columns"], ["op", "year", "month", "residence", "tourists"])
+        self.assertEqual(len(data["rows"]), len(YEARS) * 12 * len(RESIDENCES))
+        self.assertEqual({row[0] for row in data["rows"]}, {"insert"})
+
+    def test_reload_returns_only_changed_rows(self):
+        watermark = self._delta()["watermark"]
+        monthly, _ = _fixture_rows()
+
+        # Recarga idéntica: no hay cambios que enviar
+        self._reload_monthly(monthly)
+        same = self._delta(since=watermark)
+        self.assertEqual((same["rows"], same["watermark"]), ([], watermark))
+
+        revised = [row for row in monthly if row[:3] != (2018, 1, "Spain")]
+        revised = [(y, m, r, t + 5 if (y, m, r) == (2021, 12, "Germany") else t) for y, m, r, t in revised]
+        revised.append((2022, 1, "Germany", 999.0))
+        self._reload_monthly(revised)
+
+        data = self._delta(since=watermark)
+        self.assertFalse(data["full"])
+        self.assertGreater(data["watermark"], watermark)
+        germany_dec = next(t for y, m, r, t in monthly if (y, m, r) == (2021, 12, "Germany"))
+        self.assertEqual(data["rows"], [
+            ["delete", 2018, 1, "Spain", None],
+            ["update", 2021, 12, "Germany", germany_dec + 5],
+            ["insert", 2022, 1, "Germany", 999.0],
+        ])
+        self.assertEqual(self._delta(since=data["watermark"])["rows"], [])
+
+        # Creada y borrada entre dos refrescos: el cliente no la ve
+        self._reload_monthly(revised[:-1])
+        self.assertNotIn([2022, 1, "Germany"], [row[1:4] for row in self._delta(since=watermark)["rows"]])
+
+    def test_initial_load_is_not_logged_row_by_row(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM row_changes")
+            self.assertEqual(cursor.fetchone()[0], 0)
+        data = self._delta()
+        self.assertTrue(data["full"])
+        self.assertGreater(data["watermark"], 0)
+
+    def test_pruned_changes_fall_back_to_full_snapshot(self):
+        star_schema = import_etl_module("star_schema")
+        watermark = self._delta()["watermark"]
+        monthly, _ = _fixture_rows()
+        self._reload_monthly([(y, m, r, t + 1) for y, m, r, t in monthly])
+        self.assertFalse(self._delta(since=watermark)["full"])
+
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE row_changes SET changed_at = '2000-01-01T00:00:00'")
+        self.assertEqual(star_schema.compact_change_log(connection.connection), len(monthly))
+
+        stale = self._delta(since=watermark)
+        self.assertTrue(stale["full"])
+        self.assertEqual(len(stale["rows"]), len(monthly))
+        current = self._delta(since=stale["watermark"])
+        self.assertEqual((current["full"], current["rows"]), (False, []))
+
+    def test_full_snapshot_is_read_from_sqlite_with_any_backend(self):
+        stale_parquet = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, stale_parquet, True)
+        with self.settings(ANALYTICS_BACKEND="duckdb", ANALYTICS_PARQUET_DIR=stale_parquet):
+            data = self._delta()
+        self.assertTrue(data["full"])
+        self.assertEqual(data["rows"], self._delta()["rows"])
+        self.assertEqual(len(data["rows"]), len(YEARS) * 12 * len(RESIDENCES))
+
+    def test_islands_csv_and_bad_params(self):
+        response = self.client.get("/download/delta/", {"dataset": "islands", "format": "csv"})
+        self.assertEqual(response.status_code, 200)
+        lines = response.content.decode().strip().splitlines()
+        self.assertEqual(lines[0], "op,year,month,island,residence,tourists")
+        self.assertEqual(len(lines) - 1, len(YEARS) * 12 * len(RESIDENCES) * len(ISLANDS))
+        self.assertEqual(response["X-Full-Refresh"], "1")
+
+        watermark = int(response["X-Watermark"])
+        ahead = self._delta(dataset="islands", since=watermark + 100)
+        self.assertTrue(ahead["full"])
+        self.assertEqual(self.client.get("/download/delta/", {"since": "abc"}).status_code, 400)
+        self.assertEqual(self.client.get("/download/delta/", {"dataset": "x"}).status_code, 400)
+
+
+class ReportPackTests(FronturTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_frontur_tables(*_fixture_rows())
+
+    def setUp(self):
+        super().setUp()
+        self.out_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.out_dir, ignore_errors=True)
+
+    def test_pack_has_one_report_per_residence_and_island(self):
+        call_command("generate_report_pack", output=str(self.out_dir), workers=1, stdout=StringIO())
+
+        index = json.loads((self.out_dir / "index.json").read_text(encoding="utf-8"))
+        names = {(r["kind"], r["name"]) for r in index["reports"]}
+        self.assertEqual(
+            names,
+            {("residence", r) for r in RESIDENCES} | {("island", i) for i in ISLANDS},
+        )
+        for report in index["reports"]:
+            for path in report["files"]:
+                self.assertTrue((self.out_dir / path).exists(), path)
+
+    def test_island_report_shares_match_island_totals(self):
+        call_command(
+            "generate_report_pack", output=str(self.out_dir), workers=1, formats="json", stdout=StringIO()
+        )
+        report = json.loads((self.out_dir / "island" / "tenerife.json").read_text(encoding="utf-8"))
+
+        self.assertEqual(report["kpis"]["date_max"], f"{YEARS[-1]}-12")
+        self.assertEqual({row["name"] for row in report["market_mix_12m"]}, set(RESIDENCES))
+        self.assertAlmostEqual(sum(row["share_pct"] for row in report["market_mix_12m"]), 100.0, places=1)
+        self.assertEqual(len(report["trend_12m"]), 12)
+
+
+# Cubo de observaciones en formato largo, como los TSV del ISTAC
+WIDE_TSV = """TERRITORIO\tLUGAR_RESIDENCIA\tMEDIDAS\tTIME_PERIOD\tOBS_VALUE
+Canary Islands\tGermany\tTuristas\t01/2021\t100
+Canary Islands\tGermany\tGasto total\t01/2021\t150000
+Canary Islands\tGermany\tEstancia media\t01/2021\t10
+Canary Islands\tSpain\tTuristas\t01/2021\t300
+Canary Islands\tSpain\tGasto total\t01/2021\t90000
+Canary Islands\tSpain\tEstancia media\t01/2021\t6
+Canary Islands\tSpain\tTuristas\t02/2021\t200
+Canary Islands\tSpain\tEstancia media\t02/2021\t
+Tenerife\tSpain\tTuristas\t02/2021\t999
+"""
+
+
+class WideIngestTests(FronturTestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.tsv = tmp / "observations.tsv"
+        self.tsv.write_text(WIDE_TSV, encoding="utf-8")
+        self.etl = import_etl_module("frontur_canarias_etl")
+        self.wide_ingest = import_etl_module("wide_ingest")
+
+    def _read_wide(self, chunksize):
+        return self.wide_ingest.read_wide_observations(
+            self.tsv,
+            dimensions={"LUGAR_RESIDENCIA": "residence"},
+            pivot_cols=["MEDIDAS"],
+            row_filter={"TERRITORIO": "Canary Islands"},
+            chunksize=chunksize,
+        )
+
+    def test_wide_pivot_matches_tourists_only_path(self):
+        import pandas as pd
+
+        wide = self._read_wide(chunksize=2)
+        self.assertEqual(
+            [c for c in wide.columns if c not in ("year", "month", "residence")],
+            ["estancia_media", "gasto_total", "turistas"],
+        )
+
+        legacy = self.etl.clean_tourists(pd.read_csv(self.tsv, sep="\t", dtype=str))
+        self.assertEqual(
+            sorted(legacy.itertuples(index=False, name=None)),
+            sorted(wide[["year", "month", "residence", "turistas"]].itertuples(index=False, name=None)),
+        )
+
+    def test_locale_formatted_values_are_parsed(self):
+        self.tsv.write_text(
+            "TERRITORIO\tLUGAR_RESIDENCIA\tMEDIDAS\tTIME_PERIOD\tOBS_VALUE\n"
+            "Canary Islands\tGermany\tTuristas\t01/2021\t1.370.188\n"
+            "Canary Islands\tGermany\tEstancia media\t01/2021\t9,5\n"
+            "Canary Islands\tSpain\tTuristas\t01/2021\t1370188\n"
+            "Canary Islands\tSpain\tEstancia media\t01/2021\t9.5\n"
+            "Canary Islands\tSpain\tGasto total\t01/2021\t1234.56\n",
+            encoding="utf-8",
+        )
+        wide = self._read_wide(chunksize=1)
+        self.assertEqual(
+            wide[["residence", "turistas", "estancia_media"]].values.tolist(),
+            [["Germany", 1370188.0, 9.5], ["Spain", 1370188.0, 9.5]],
+        )
+        self.assertEqual(wide["gasto_total"].tolist()[1], 1234.56)
+
+    def test_duplicate_keys_are_reported(self):
+        with self.assertRaisesRegex(ValueError, "2 observaciones.*1 claves"):
+            self.wide_ingest.read_wide_observations(
+                self.tsv, dimensions={"LUGAR_RESIDENCIA": "residence"}, pivot_cols=["MEDIDAS"]
+            )
+
+    def test_dashboard_shows_spend_and_stay_kpis(self):
+        star_schema = import_etl_module("star_schema")
+        connection.ensure_connection()
+        star_schema.load_wide(
+            connection.connection, star_schema.MONTHLY_WIDE_FACT, self._read_wide(chunksize=100), ["residence"]
+        )
+
+        context = self.client.get("/").context
+        # Gasto: (150000 + 90000) / (100 + 300); estancia: (10·100 + 6·300) / 400
+        self.assertAlmostEqual(context["kpi_spend_per_tourist"], 600.0)
+        self.assertAlmostEqual(context["kpi_avg_stay"], 7.0)
+
+        context = self.client.get("/", {"residence": "Germany"}).context
+        self.assertAlmostEqual(context["kpi_spend_per_tourist"], 1500.0)
+
+    def test_dashboard_without_wide_table_has_no_measure_kpis(self):
+        create_frontur_tables(*_fixture_rows())
+        context = self.client.get("/").context
+        self.assertIsNone(context["kpi_spend_per_tourist"])
+        self.assertIsNone(context["kpi_avg_stay"])
+
+
+class ProcessedStoreTests(SimpleTestCase):
+    def setUp(self):
+        import pandas as pd
+
+        self.pd = pd
+        self.store = import_etl_module("processed_store")
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        monthly, _ = _fixture_rows()
+        self.monthly = pd.DataFrame(monthly, columns=["year", "month", "residence", "tourists"])
+
+    def _frame(self, df):
+        return sorted(df[["year", "month", "residence", "tourists"]].astype(object).itertuples(index=False, name=None))
+
+    def test_streamed_chunks_round_trip_with_compact_types(self):
+        self.store.write_dataset(self.monthly, "demo", root=self.root, chunk_rows=7)
+
+        self.assertEqual(self.store.list_years("demo", root=self.root), [2018, 2019, 2020, 2021])
+        df = self.store.read_dataset("demo", root=self.root)
+        self.assertEqual(self._frame(df), self._frame(self.monthly))
+        self.assertEqual(str(df["month"].dtype), "int8")
+        self.assertEqual(str(df["residence"].dtype), "category")
+
+    def test_labels_are_stored_stripped_like_the_star_dimensions(self):
+        padded = self.monthly.assign(residence=" " + self.monthly["residence"] + " ")
+        self.store.write_dataset(padded, "demo", root=self.root)
+        df = self.store.read_dataset("demo", columns=["residence"], root=self.root)
+        self.assertEqual(sorted(df["residence"].unique()), RESIDENCES)
+
+        islas_etl = import_etl_module("istac_islas_etl")
+        obs = self.root / "islas.tsv"
+        obs.write_text(
+            "TIPO_VIAJERO\tMEDIDAS\tTIME_PERIOD\tLUGAR_RESIDENCIA\tTERRITORIO\tOBS_VALUE\n"
+            "Tourist\tTuristas\t01/2021\t Germany \tTenerife \t100\n",
+            encoding="utf-8",
+        )
+        with redirect_stdout(StringIO()):
+            clean = islas_etl.read_tourists(obs)
+        self.assertEqual(clean[["residence", "island"]].values.tolist(), [["Germany", "Tenerife"]])
+
+    def test_read_prunes_years_and_columns(self):
+        from unittest import mock
+
+        self.store.write_dataset(self.monthly, "demo", root=self.root)
+
+        opened = []
+        read_table = self.store.pq.read_table
+
+        def spy(path, **kwargs):
+            opened.append(Path(path).parent.name)
+            return read_table(path, **kwargs)
+
+        with mock.patch.object(self.store.pq, "read_table", spy):
+            df = self.store.read_dataset("demo", year_from=2019, year_to=2020,
+                                         columns=["year", "tourists"], root=self.root)
+
+        self.assertEqual(opened, ["year=2019", "year=2020"])
+        self.assertEqual(list(df.columns), ["year", "tourists"])
+        self.assertEqual(sorted(df["year"].unique()), [2019, 2020])
+        self.assertEqual(len(df), 2 * 12 * len(RESIDENCES))
+
+        empty = self.store.read_dataset("demo", year_from=2030, columns=["year", "tourists"], root=self.root)
+        self.assertTrue(empty.empty)
+        self.assertEqual(list(empty.columns), ["year", "tourists"])
+
+    def test_replace_drops_missing_years_and_backfill_keeps_them(self):
+        self.store.write_dataset(self.monthly, "demo", root=self.root)
+        update = self.monthly[self.monthly["year"] == 2021].assign(tourists=1.0)
+
+        self.store.write_dataset(update, "demo", replace=False, root=self.root)
+        self.assertEqual(self.store.list_years("demo", root=self.root), [2018, 2019, 2020, 2021])
+        df = self.store.read_dataset("demo", root=self.root)
+        self.assertEqual(set(df.loc[df["year"] == 2021, "tourists"]), {1.0})
+        self.assertEqual(
+            self._frame(df[df["year"] < 2021]), self._frame(self.monthly[self.monthly["year"] < 2021])
+        )
+
+        self.store.write_dataset(update, "demo", root=self.root)
+        self.assertEqual(self.store.list_years("demo", root=self.root), [2021])
+        self.assertEqual(len(self.store.read_dataset("demo", root=self.root)), len(update))
+        self.assertEqual([p.name for p in self.root.iterdir()], ["dataset=demo"])  # sin temporales
+
+
+class ParsingTests(SimpleTestCase):
+    """Fija el comportamiento del parseo que antes hacía cada ETL por su cuenta."""
+
+    def setUp(self):
+        import pandas as pd
+
+        self.pd = pd
+        self.parsing = import_etl_module("parsing")
+
+    def test_time_period_matches_previous_parsers(self):
+        periods = self.pd.Series(["10/2025", "01/2019", "10/2025", "12/2020"] * 50, index=range(100, 300))
+        parsed = self.parsing.parse_time_period(periods)
+
+        # frontur_canarias_etl: dos str.extract; istac_islas_etl: split por fila
+        legacy_month = periods.str.extract(r"(\d{2})/\d{4}").astype(int)[0]
+        legacy_year = periods.str.extract(r"\d{2}/(\d{4})").astype(int)[0]
+        legacy_split = [tuple(int(x) for x in reversed(p.split("/"))) for p in periods]
+        self.assertEqual(parsed["month"].tolist(), legacy_month.tolist())
+        self.assertEqual(parsed["year"].tolist(), legacy_year.tolist())
+        self.assertEqual(list(zip(parsed["year"], parsed["month"])), legacy_split)
+        self.assertTrue(parsed.index.equals(periods.index))
+        self.assertEqual(str(parsed["year"].dtype), "int64")
+
+        with self.assertRaises(ValueError):
+            self.parsing.parse_time_period(self.pd.Series(["10/2025", "2025-10"]))
+
+    def test_locale_numbers_match_previous_chain(self):
+        values = self.pd.Series(["1370188", "1.370.188", "12,5", "1.234,5", "", "n/a", None, "7"] * 3, dtype=object)
+        legacy = self.pd.to_numeric(
+            values.astype(str).str.replace(".", "", regex=False).str.replace(",", ".", regex=False),
+            errors="coerce",
+        )
+        parsed = self.parsing.parse_locale_number(values)
+        self.pd.testing.assert_series_equal(parsed, legacy.astype("float64"), check_names=False)
+        self.assertEqual(parsed.iloc[:4].tolist(), [1370188.0, 1370188.0, 12.5, 1234.5])
+
+        # Punto decimal (medidas como estancia media o gasto): no se toma como separador de miles
+        dotted = self.pd.Series(["9.5", "1234.56", "1.370.188", "12,5", "-1.234"], dtype=object)
+        self.assertEqual(self.parsing.parse_locale_number(dotted).tolist(), [9.5, 1234.56, 1370188.0, 12.5, -1234.0])
+
+    def test_labels_and_column_names(self):
+        labels = self.pd.Series([" Germany", "Spain ", " Germany", "Spain"])
+        self.assertEqual(self.parsing.decode_labels(labels).tolist(), ["Germany", "Spain", "Germany", "Spain"])
+        self.assertEqual(self.parsing.decode_labels(labels, strip=False).tolist(), labels.tolist())
+        self.assertEqual(
+            list(self.parsing.decode_labels(labels, categorical=True).cat.categories), ["Germany", "Spain"]
+        )
+
+        columns = [" Gasto Medio ", "Duración", "ESTANCIA MÁXIMA", "Año", 2021]
+        legacy = [str(c).strip().lower().replace(" ", "_").replace("ó", "o").replace("á", "a")
+                  .replace("é", "e").replace("í", "i").replace("ú", "u") for c in columns]
+        self.assertEqual(self.parsing.normalize_columns(columns), legacy)
+
+    def test_each_distinct_value_is_decoded_once_across_chunks(self):
+        calls = []
+
+        def decode(uniques):
+            calls.append(list(uniques))
+            return uniques.str.upper()
+
+        cache = self.parsing.DecodeCache()
+        first = self.parsing.decode_distinct(self.pd.Series(["a", "b", "a", None] * 10), decode, cache)
+        second = self.parsing.decode_distinct(self.pd.Series(["b", "c", None]), decode, cache)
+
+        self.assertEqual(len(calls[0]), 3)
+        self.assertEqual(calls[1], ["c"])
+        self.assertEqual(first[:3].tolist(), ["A", "B", "A"])
+        self.assertEqual(second[:2].tolist(), ["B", "C"])
+
+
+class ExcelIngestTests(SimpleTestCase):
+    def setUp(self):
+        self.excel_ingest = import_etl_module("excel_ingest")
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def _write_xlsx(self, rows, merged=()):
+        import openpyxl
+
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        for row in rows:
+            ws.append(row)
+        for cell_range in merged:
+            ws.merge_cells(cell_range)
+        path = self.tmp / "frontur.xlsx"
+        wb.save(path)
+        return path
+
+    def _read(self, path):
+        with redirect_stdout(StringIO()) as out:
+            df = self.excel_ingest.read_excel_cached(path, cache_dir=self.tmp / "cache")
+        return df, out.getvalue()
+
+    def test_multi_row_header_with_merged_cells(self):
+        path = self._write_xlsx(
+            [
+                ["Turistas y gasto por país de residencia"],
+                ["País", "Turistas", None, "Gasto", None],
+                [None, 2020, 2021, 2020, 2021],
+                ["Alemania", 100, 150, 1000.5, 1600],
+                ["España", 80, 90, 700, 850],
+            ],
+            merged=["B2:C2", "D2:E2"],
+        )
+        df, _ = self._read(path)
+
+        self.assertEqual(
+            list(df.columns),
+            ["País", "Turistas - 2020", "Turistas - 2021", "Gasto - 2020", "Gasto - 2021"],
+        )
+        self.assertEqual(df["País"].tolist(), ["Alemania", "España"])
+        self.assertEqual(df["Gasto - 2020"].tolist(), [1000.5, 700.0])
+        self.assertEqual(str(df["Turistas - 2021"].dtype), "float64")
+
+    def test_second_read_is_served_from_parquet_cache(self):
+        from unittest import mock
+
+        path = self._write_xlsx([["País", "Turistas"], ["Alemania", 100], ["España", 80]])
+        first, output = self._read(path)
+        self.assertIn("[PARSEO]", output)
+
+        with mock.patch.object(self.excel_ingest.openpyxl, "load_workbook", side_effect=AssertionError):
+            second, output = self._read(path)
+        self.assertIn("[CACHÉ]", output)
+        self.assertTrue(first.equals(second))
+
+    def test_duplicate_names_do_not_collide_with_existing_ones(self):
+        path = self._write_xlsx([["a", "a", "a_1", "b"], ["x", 1, 2, 3]])
+        df, _ = self._read(path)
+        self.assertEqual(list(df.columns), ["a", "a_1", "a_1_1", "b"])
+
+    def test_values_beyond_the_header_are_kept(self):
+        path = self._write_xlsx([["País", "Turistas"], ["Alemania", 100], ["España", 80, 5]])
+        df, _ = self._read(path)
+        self.assertEqual(list(df.columns), ["País", "Turistas", "col_2"])
+        self.assertEqual(df["col_2"].tolist()[1], 5.0)
+
+    def test_row_wider_than_the_sheet_is_an_error(self):
+        rows = iter([("País", "Turistas"), ("Alemania", 100), ("España", 80, 5)])
+        header, first = self.excel_ingest._split_header(rows)
+        self.assertEqual(first, ("Alemania", 100))
+        with self.assertRaises(ValueError):
+            self.excel_ingest._fit_row(("España", 80, 5), width=2, n_rows=1)
+
+
+class EtlTraceTests(SimpleTestCase):
+    def setUp(self):
+        self.etl_trace = import_etl_module("etl_trace")
+        self.runs_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.runs_dir, ignore_errors=True)
+
+    def _run(self, rows):
+        with redirect_stdout(StringIO()):
+            trace = self.etl_trace.RunTrace("demo", runs_dir=self.runs_dir)
+            with trace.stage("read") as st:
+                data = list(range(rows))
+                st.rows_out = len(data)
+            with trace.stage("clean", rows_in=len(data)) as st:
+                st.rows_out = len([x for x in data if x % 2])
+            return trace.finish()
+
+    def test_report_is_persisted_with_stage_metrics(self):
+        report = self._run(1000)
+
+        saved = sorted((self.runs_dir / "demo").glob("*.json"))
+        self.assertEqual(len(saved), 1)
+        self.assertEqual(json.loads(saved[0].read_text(encoding="utf-8")), report)
+        self.assertEqual([s["name"] for s in report["stages"]], ["read", "clean"])
+        self.assertEqual(report["stages"][1]["rows_in"], 1000)
+        self.assertEqual(report["stages"][1]["rows_out"], 500)
+        for stage in report["stages"]:
+            self.assertGreaterEqual(stage["wall_s"], 0)
+            self.assertIsNotNone(stage["py_peak_mb"])
+        self.assertIsNone(report["previous_run"])
+
+    def test_regressions_against_previous_run(self):
+        previous = {"stages": [
+            {"name": "read", "wall_s": 1.0, "py_peak_mb": 100.0, "rows_out": 10},
+            {"name": "load", "wall_s": 2.0, "py_peak_mb": 50.0, "rows_out": 10},
+        ]}
+        current = {"stages": [
+            {"name": "read", "wall_s": 1.2, "py_peak_mb": 200.0, "rows_out": 10},
+            {"name": "load", "wall_s": 4.0, "py_peak_mb": 50.0, "rows_out": 8},
+            {"name": "new", "wall_s": 9.0, "py_peak_mb": 1.0, "rows_out": 1},
+        ]}
+        found = {(r["stage"], r["metric"]) for r in self.etl_trace.find_regressions(current, previous)}
+        self.assertEqual(found, {("read", "py_peak_mb"), ("load", "wall_s"), ("load", "rows_out")})
+
+    def test_second_run_is_compared_with_first(self):
+        self._run(10)
+        second = self._run(20)
+        self.assertIsNotNone(second["previous_run"])
+        self.assertIn(("read", "rows_out"), {(r["stage"], r["metric"]) for r in second["regressions"]})
+
+
+class KpiSnapshotTests(SimpleTestCase):
+    def setUp(self):
+        import pandas as pd
+
+        self.snapshots = import_etl_module("kpi_snapshots")
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.df = pd.DataFrame(
+            [
+                (y, m, island, residence, 100.0 * m + (10 if island == "Tenerife" else 0))
+                for y in (2023, 2024)
+                for m in range(1, 13)
+                for island in ("Tenerife", "Gran Canaria")
+                for residence in ("Germany", "Spain")
+            ],
+            columns=["year", "month", "island", "residence", "tourists"],
+        )
+
+    def _record(self, df):
+        with redirect_stdout(StringIO()):
+            return self.snapshots.record_snapshot("demo", df, ["island", "residence"], root=self.root)
+
+    def _blob_count(self):
+        return len(list((self.root / "demo" / "blobs").rglob("*.json")))
+
+    def test_unchanged_run_writes_nothing_new(self):
+        first = self._record(self.df)
+        blobs = self._blob_count()
+        second = self._record(self.df.sample(frac=1, random_state=0))
+
+        self.assertTrue(first["full"])
+        self.assertEqual(len(first["periods"]), 24)
+        self.assertEqual(second["periods"], {})
+        self.assertEqual(second["stats"]["blobs_written"], 0)
+        self.assertEqual(self._blob_count(), blobs)
+        diff = self.snapshots.diff_runs("demo", first["run_id"], second["run_id"], root=self.root)
+        self.assertEqual((diff["kpis"], diff["added"], diff["removed"], diff["revised"]), ({}, [], [], []))
+
+    def test_revision_stores_only_changed_periods_and_diffs(self):
+        first = self._record(self.df)
+        blobs = self._blob_count()
+
+        revised = self.df.copy()
+        mask = (revised["year"] == 2024) & (revised["month"] == 11) & (revised["residence"] == "Spain")
+        revised.loc[mask, "tourists"] += 50
+        revised = revised[~((revised["year"] == 2023) & (revised["month"] == 1))]
+        second = self._record(revised)
+
+        self.assertEqual(list(second["periods"]), ["2024-11"])
+        self.assertEqual(second["removed"], ["2023-01"])
+        # Un periodo revisado + los KPIs agregados
+        self.assertEqual(self._blob_count(), blobs + 2)
+        self.assertEqual(len(self.snapshots.SnapshotStore("demo", self.root).resolve(second["run_id"])["periods"]), 23)
+
+        diff = self.snapshots.diff_runs("demo", first["run_id"], second["run_id"], root=self.root)
+        self.assertEqual(diff["removed"], ["2023-01"])
+        self.assertEqual([r["period"] for r in diff["revised"]], ["2024-11"])
+        self.assertEqual(diff["revised"][0]["delta"], 100.0)
+        self.assertEqual(diff["revised"][0]["by"]["residence"]["Spain"]["delta"], 100.0)
+        self.assertEqual(diff["revised"][0]["by"]["island"]["Tenerife"]["delta"], 50.0)
+        self.assertEqual(diff["kpis"]["by_year"]["2024"]["delta"], 100.0)
+
+    def test_checkpoint_manifest_is_full(self):
+        self.addCleanup(setattr, self.snapshots, "CHECKPOINT_EVERY", self.snapshots.CHECKPOINT_EVERY)
+        self.snapshots.CHECKPOINT_EVERY = 2
+        runs = [self._record(self.df) for _ in range(4)]
+        self.assertEqual([r["full"] for r in runs], [True, False, True, False])
+        self.assertEqual(len(runs[2]["periods"]), 24)
+
+
+class ExportQueueTests(FronturTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_frontur_tables(*_fixture_rows())
+
+    def setUp(self):
+        super().setUp()
+        export_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_dir, ignore_errors=True)
+        override = self.settings(EXPORT_DIR=Path(export_dir))
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _work(self):
+        call_command("export_worker", once=True, workers=1, stdout=StringIO())
+
+    def test_submit_work_and_download(self):
+        params = {"residence": "Spain", "year_from": 2020}
+        response = self.client.get("/exports/", params)
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job["status"], "queued")
+
+        self._work()
+
+        status = self.client.get(job["status_url"]).json()
+        self.assertEqual(status["status"], "done")
+        self.assertEqual(status["rows"], 2 * 12)
+
+        download = self.client.get(status["download_url"])
+        expected = self.client.get("/download/", params)
+        self.assertEqual(b"".join(download.streaming_content), expected.content)
+
+    def test_download_is_handed_to_the_front_server(self):
+        job = self.client.get("/exports/", {"residence": "Spain"}).json()
+        self._work()
+        download_url = self.client.get(job["status_url"]).json()["download_url"]
+
+        with self.settings(EXPORT_SENDFILE_HEADER="X-Accel-Redirect", EXPORT_SENDFILE_URL="/protected-exports/"):
+            response = self.client.get(download_url)
+        self.assertEqual(response.content, b"")
+        self.assertIn("attachment", response["Content-Disposition"])
+        location = response["X-Accel-Redirect"]
+        self.assertTrue(location.startswith("/protected-exports/"))
+        self.assertTrue((settings.EXPORT_DIR / location.removeprefix("/protected-exports/")).exists())
+
+        with self.settings(EXPORT_SENDFILE_HEADER="X-Sendfile"):
+            response = self.client.get(download_url)
+        self.assertTrue(Path(response["X-Sendfile"]).is_file())
+
+    def test_identical_request_reuses_cached_file(self):
+        first = self.client.get("/exports/", {"dataset": "islands", "island": "Tenerife"}).json()
+        self._work()
+
+        again = self.client.get("/exports/", {"dataset": "islands", "island": "Tenerife"})
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()["id"], first["id"])
+
+        redirected = self.client.get("/exports/", {"dataset": "islands", "island": "Tenerife", "redirect": 1})
+        self.assertRedirects(redirected, again.json()["download_url"], fetch_redirect_response=False)
+
+        other_format = self.client.get("/exports/", {"dataset": "islands", "island": "Tenerife", "format": "parquet"})
+        self.assertEqual(other_format.status_code, 202)
+        self.assertNotEqual(other_format.json()["id"], first["id"])
+
+    def test_old_versions_are_pruned_only_after_grace(self):
+        import os
+
+        from analytics import exports
+        from analytics.caching import publish_data_version
+
+        publish_data_version("v1")
+        job = self.client.get("/exports/").json()
+        self._work()
+        download_url = self.client.get(job["status_url"]).json()["download_url"]
+        old_dir = settings.EXPORT_DIR / "v1"
+        self.assertTrue(old_dir.is_dir())
+
+        # Recién terminado: el enlace de descarga entregado sigue funcionando
+        publish_data_version("v2")
+        self._work()
+        self.assertTrue(old_dir.is_dir())
+        self.assertEqual(self.client.get(download_url).status_code, 200)
+
+        # Trabajo de la versión antigua aún en curso: tampoco se borra
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE export_jobs SET finished_at = 0, status = 'running'")
+        os.utime(old_dir, (0, 0))
+        self.assertEqual(exports.prune_old_exports("v2"), 0)
+
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE export_jobs SET status = 'done'")
+        self.assertEqual(exports.prune_old_exports("v2"), 1)
+        self.assertFalse(old_dir.exists())
+
+    def test_pending_submissions_are_deduplicated(self):
+        first = self.client.get("/exports/").json()
+        second = self.client.get("/exports/").json()
+        self.assertEqual(first["id"], second["id"])
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get("/exports/", {"dataset": "nope"}).status_code, 400)
+        self.assertEqual(self.client.get("/exports/", {"format": "xlsx"}).status_code, 400)
+        self.assertEqual(self.client.get("/exports/", {"year_from": "abc"}).status_code, 400)
+        self.assertEqual(self.client.get("/exports/missing/").status_code, 404)
+
+
+class DownsamplingTests(FronturTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_frontur_tables(*_fixture_rows())
+
+    def test_lttb_keeps_endpoints_and_spikes(self):
+        from analytics.downsampling import lttb_indices
+
+        values = [100.0] * 500
+        values[123] = 5000.0
+        values[321] = -4000.0
+        idx = lttb_indices(values, 50)
+
+        self.assertEqual(len(idx), 50)
+        self.assertEqual((idx[0], idx[-1]), (0, 499))
+        self.assertTrue(all(a < b for a, b in zip(idx, idx[1:])))
+        self.assertIn(123, idx)
+        self.assertIn(321, idx)
+
+    def test_short_series_are_untouched(self):
+        from analytics.downsampling import downsample
+
+        self.assertEqual(downsample(["a", "b", "c"], [1, 2, 3], 12), (["a", "b", "c"], [1, 2, 3]))
+
+    def test_dashboard_series_respect_points(self):
+        context = self.client.get("/", {"points": 12}).context
+        self.assertEqual(len(json.loads(context["chart_values"])), 12)
+        self.assertEqual(context["chart_points_total"], len(YEARS) * 12)
+        for series in json.loads(context["series_per_residence_json"]).values():
+            self.assertEqual(len(series["values"]), 12)
+
+        # COVID: el mínimo de la serie completa sobrevive a la reducción
+        full = self.client.get("/").context
+        self.assertEqual(min(json.loads(context["chart_values"])), min(json.loads(full["chart_values"])))
+        self.assertEqual(len(json.loads(full["chart_values"])), len(YEARS) * 12)
+
+    def test_series_endpoint(self):
+        data = self.client.get("/series/", {"residence": "Spain", "points": 12}).json()
+        self.assertEqual(data["points"], 12)
+        self.assertEqual(data["total_points"], len(YEARS) * 12)
+        self.assertEqual(data["labels"][0], f"{YEARS[0]}-01")
+        self.assertEqual(data["labels"][-1], f"{YEARS[-1]}-12")
+
+        with self.assertNumQueries(1):  # solo la versión de datos: la serie sale de caché
+            self.client.get("/series/", {"residence": "Spain", "points": 12})
+
+
+class AnomalyDetectionTests(FronturTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_frontur_tables(*_fixture_rows())
+
+    def setUp(self):
+        super().setUp()
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir, ignore_errors=True)
+        override = self.settings(ANOMALY_STATE_DIR=Path(state_dir))
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _anomalies(self):
+        call_command("detect_anomalies", stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT kind, residence, island, period, anomaly_type FROM series_anomalies")
+            return set(cursor.fetchall())
+
+    def test_matrix_scoring_finds_spike_and_level_shift(self):
+        import numpy as np
+
+        from analytics.anomalies import score_matrix
+
+        months = np.arange(72)
+        seasonal = 1000 + 200 * np.sin(2 * np.pi * months / 12)
+        growth = 1 + 0.002 * months
+        noise = 1 + 0.01 * np.sin(months * 1.7)
+        values = np.vstack([seasonal * growth * noise] * 3)
+        values[1, 40] *= 3                 # pico aislado
+        values[2, 50:] *= 0.5              # cambio de nivel
+        scores = score_matrix(values)
+
+        outliers = {tuple(x) for x in np.argwhere(np.abs(scores["z"]) >= 3.5)}
+        self.assertIn((1, 40), outliers)
+        self.assertFalse(any(row == 0 for row, _ in outliers))
+        self.assertEqual(scores["break_col"][0], -1)
+        self.assertEqual(scores["break_col"][2], 50)
+
+    def test_command_flags_covid_drop_in_every_kind_of_series(self):
+        found = self._anomalies()
+        self.assertIn(("residence", "Germany", None, "2020-04", "outlier"), found)
+        self.assertIn(("island", None, "Tenerife", "2020-04", "outlier"), found)
+        self.assertIn(("residence_island", "Germany", "Tenerife", "2020-04", "outlier"), found)
+        self.assertFalse(any(a[4] == "revision" for a in found))
+
+    def test_revisions_between_runs(self):
+        self._anomalies()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE fact_canarias_monthly SET tourists = tourists * 1.5 WHERE period_id = 201903 "
+                "AND residence_id = (SELECT residence_id FROM dim_residence WHERE residence = 'Spain')"
+            )
+        found = self._anomalies()
+        self.assertIn(("residence", "Spain", None, "2019-03", "revision"), found)
+
+        # Post-carga sin cambios de datos (p. ej. un despliegue): la revisión sigue visible
+        found = self._anomalies()
+        self.assertIn(("residence", "Spain", None, "2019-03", "revision"), found)
+        self.assertIn(("residence", "Germany", None, "2020-04", "outlier"), found)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM series_anomalies WHERE anomaly_type = 'outlier' "
+                           "AND residence = 'Germany' AND island IS NULL AND period = '2020-04'")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+            # Pasado el plazo de retención, se poda
+            cursor.execute("UPDATE series_anomalies SET detected_at = '2000-01-01T00:00:00' "
+                           "WHERE anomaly_type = 'revision'")
+        self.assertFalse(any(a[4] == "revision" for a in self._anomalies()))
+
+    def test_dashboard_lists_anomalies_for_filters(self):
+        self._anomalies()
+        context = self.client.get("/", {"residence": "Germany"}).context
+        self.assertTrue(context["recent_anomalies"])
+        self.assertTrue(all(a["residence"] == "Germany" for a in context["recent_anomalies"]))
@@ -1,7 +1,24 @@
 from django.urls import path
-from analytics.views import dashboard_view, download_clean_csv
+from analytics.views import (
+    comparison_view,
+    dashboard_view,
+    download_clean_csv,
+    download_delta_view,
+    export_download_view,
+    export_status_view,
+    export_submit_view,
+    island_drilldown_view,
+    series_view,
+)
 
 urlpatterns = [
     path("", dashboard_view, name="dashboard"),
     path("download/", download_clean_csv, name="download_clean_csv"),
+    path("download/delta/", download_delta_view, name="download_delta"),
+    path("compare/", comparison_view, name="comparison"),
+    path("series/", series_view, name="series"),
+    path("islands/", island_drilldown_view, name="island_drilldown"),
+    path("exports/", export_submit_view, name="export_submit"),
+    path("exports/<str:job_id>/", export_status_view, name="export_status"),
+    path("exports/<str:job_id>/download/", export_download_view, name="export_download"),
 ]
@@ -2,73 +2,104 @@ import csv
 import json
 from collections import defaultdict
 
-from django.db import connection
-from django.http import HttpResponse
-from django.shortcuts import render
-
-TABLE_NAME = "frontur_canarias_monthly"
-# Tabla mensual por isla (year, month, island, tourists)
-ISLAND_TABLE = "frontur_canarias_islands_monthly"
-
-
-def _build_where_from_request(request):
+from django.conf import settings
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+)
+from django.shortcuts import redirect, render
+from django.urls import reverse
+
+from analytics import anomalies, comparison, delta, downsampling, exports
+from analytics.backends import COMPARISON_DIMENSIONS, TABLE_NAME, get_backend
+from analytics.caching import current_data_version, dashboard_cache_key, series_cache_key
+from analytics.singleflight import single_flight
+
+# Límite de periodos por matriz de comparación (la salida crece con P²)
+MAX_COMPARE_PERIODS = 60
+
+
+def _filters_from_params(params):
     """
-    Construye WHERE + params a partir de filtros:
+    Normaliza los filtros comunes de la querystring:
     - residence
     - year_from / year_to
     (island se maneja solo con la tabla de islas, no existe en la tabla principal)
     """
-    residence = request.GET.get("residence") or ""
-    year_from = request.GET.get("year_from") or ""
-    year_to = request.GET.get("year_to") or ""
-
-    where_clauses = []
-    params = []
-
-    if year_from:
-        where_clauses.append("year >= %s")
-        params.append(int(year_from))
-
-    if year_to:
-        where_clauses.append("year <= %s")
-        params.append(int(year_to))
-
-    if residence:
-        where_clauses.append("residence = %s")
-        params.append(residence)
-
-    where_sql = ""
-    if where_clauses:
-        where_sql = "WHERE " + " AND ".join(where_clauses)
+    residence = params.get("residence") or ""
+    year_from = params.get("year_from") or ""
+    year_to = params.get("year_to") or ""
 
-    current_filters = {
+    return {
         "residence": residence or None,
         "year_from": int(year_from) if year_from else None,
         "year_to": int(year_to) if year_to else None,
     }
-    return where_sql, params, current_filters
+
+
+def _bad_year_params(params):
+    """400 si year_from / year_to no son un año (None si son válidos o vacíos)."""
+    for key in ("year_from", "year_to"):
+        if params.get(key) and not str(params.get(key)).isdigit():
+            return HttpResponseBadRequest(f"{key} debe ser un año.")
+    return None
+
+
+def _with_shares(rows, label_key, value_key):
+    """[(label, total)] -> ([{label_key, value_key, share_pct}], total entero) o ([], None)."""
+    # Redondeo: las marginales suman en otro orden que la tabla de hechos y
+    # las cuotas deben salir idénticas con cualquier backend
+    rows = [(label, round(float(t or 0.0), 6)) for label, t in rows]
+    total = sum(t for _, t in rows)
+    if total <= 0:
+        return [], None
+    items = [
+        {label_key: label, value_key: int(t), "share_pct": t / total * 100}
+        for label, t in rows
+    ]
+    items.sort(key=lambda x: x[value_key], reverse=True)
+    return items, int(total)
 
 
 def dashboard_view(request):
+    """
+    Dashboard principal. El contexto se cachea por (versión de datos,
+    backend, filtros) y las peticiones idénticas concurrentes comparten un
+    único cálculo (single flight).
+    """
+    bad_request = _bad_year_params(request.GET)
+    if bad_request:
+        return bad_request
+    backend = get_backend()
+    key = dashboard_cache_key(current_data_version(), backend.name, request.GET)
+    context = single_flight(
+        key,
+        lambda: build_dashboard_context(request.GET, backend),
+        settings.DASHBOARD_CACHE_TIMEOUT,
+    )
+
+    # Query string actual para anclarlo al botón de descarga
+    context = {**context, "query_string": request.GET.urlencode()}
+    return render(request, "analytics/dashboard.html", context)
+
+
+def build_dashboard_context(params, backend=None):
+    """Calcula todo el contexto del dashboard para unos filtros (QueryDict o dict)."""
+    backend = backend or get_backend()
+
     # --------- 1. Filtros del modo analista ---------
-    island_filter = request.GET.get("island") or None
-    year_a = request.GET.get("year_a") or ""
-    year_b = request.GET.get("year_b") or ""
-    where_sql, params, current_filters = _build_where_from_request(request)
-
-    # --------- 2. Leer datos limpios de SQLite (tabla principal) ---------
-    with connection.cursor() as cursor:
-        cursor.execute(
-            f"""
-            SELECT year, month, residence, tourists
-            FROM {TABLE_NAME}
-            {where_sql}
-            ORDER BY year, month, residence
-            """,
-            params,
-        )
-        columns = [col[0] for col in cursor.description]
-        rows = cursor.fetchall()
+    island_filter = params.get("island") or None
+    year_a = str(params.get("year_a") or "")
+    year_b = str(params.get("year_b") or "")
+    current_filters = _filters_from_params(params)
+    # Resolución máxima de las series del gráfico (?points=)
+    chart_points = downsampling.parse_points(params.get("points"))
+
+    # --------- 2. Leer datos limpios (tabla principal, backend configurado) ---------
+    columns, rows = backend.monthly_rows(current_filters)
 
     # 2b. Para la tabla detallada limitamos a 500 filas, como tenías
     table_rows = rows[:500]
@@ -93,6 +124,7 @@ def dashboard_view(request):
 
     # 5. Agregado por año-mes (para gráfico y KPIs avanzados)
     ym_totals = defaultdict(float)
+    year_totals = defaultdict(float)
     residence_series = defaultdict(lambda: defaultdict(float))  # por residencia
 
     for r in records:
@@ -102,11 +134,15 @@ def dashboard_view(request):
         val = float(r["tourists"])
 
         ym_totals[(y, m)] += val
+        year_totals[y] += val
         residence_series[res][(y, m)] += val
 
     ym_sorted = sorted(ym_totals.items())
-    chart_labels = [f"{y}-{m:02d}" for (y, m), _ in ym_sorted]
-    chart_values = [int(val) for _, val in ym_sorted]
+    chart_labels, chart_values = downsampling.downsample(
+        [f"{y}-{m:02d}" for (y, m), _ in ym_sorted],
+        [int(val) for _, val in ym_sorted],
+        chart_points,
+    )
 
     # 6. KPIs avanzados: últimos 12 meses vs 12 anteriores
     kpi_last_12m = None
@@ -135,14 +171,18 @@ def dashboard_view(request):
         best_period_label = f"{by}-{bm:02d}"
         best_period_value = int(bval)
 
+    # 7b. KPIs de la tabla ancha (ETL con --all-measures): gasto y estancia
+    measure_kpis = backend.measure_kpis(current_filters) or {}
+
     # 8. Top países de residencia (Top 5)
     residence_totals = defaultdict(float)
     for r in records:
         residence_totals[r["residence"]] += float(r["tourists"])
 
-    top_residences = sorted(
+    residences_ranked = sorted(
         residence_totals.items(), key=lambda x: x[1], reverse=True
-    )[:5]
+    )
+    top_residences = residences_ranked[:5]
 
     top_residences_list = [
         {"residence": name, "tourists": int(val)} for name, val in top_residences
@@ -197,16 +237,24 @@ def dashboard_view(request):
                     recovery_month_label = f"{y}-{m:02d}"
                     break
 
+    # 10b. Anomalías precalculadas tras la ETL (manage.py detect_anomalies)
+    recent_anomalies = anomalies.top_anomalies(current_filters["residence"], island_filter)
+
     # 11. Series por residencia para el filtro interactivo
     series_per_residence = {}
     for residence, ymmap in residence_series.items():
         sorted_items = sorted(ymmap.items())
         labels = [f"{y}-{m:02d}" for (y, m), _ in sorted_items]
         values = [int(v) for _, v in sorted_items]
+        labels, values = downsampling.downsample(labels, values, chart_points)
         series_per_residence[residence] = {"labels": labels, "values": values}
 
-    # 12. Métricas por isla basadas en la tabla mensual de islas
+    # 12. Drill-down isla × residencia (marginales precalculadas en la carga):
+    #     cuota por isla para la residencia filtrada y, con isla elegida, su
+    #     mix de mercados. Ventana: el rango de años filtrado o, sin filtro de
+    #     años, los últimos 12 meses.
     islands_table = []          # para tabla + mapa
+    island_markets = []         # mercados de la isla seleccionada
     island_labels = []          # nombres para el bar chart
     island_values_pct = []      # % para el bar chart
     island_total_last_12 = None
@@ -214,64 +262,44 @@ def dashboard_view(request):
     main_island_share = None
     top3_islands_share = None
 
-    if last_12_periods:
-        (y_start, m_start) = last_12_periods[0]
-        (y_end, m_end) = last_12_periods[-1]
-
+    year_filtered = bool(current_filters["year_from"] or current_filters["year_to"])
+    island_window = None
+    islands_window_label = None
+    if year_filtered and ym_sorted:
+        island_window = (ym_sorted[0][0], ym_sorted[-1][0])
+        (y0, m0), (y1, m1) = island_window
+        islands_window_label = f"{y0}-{m0:02d} a {y1}-{m1:02d}"
+    elif not year_filtered and last_12_periods:
+        island_window = (last_12_periods[0], last_12_periods[-1])
+        islands_window_label = "los últimos 12 meses"
+
+    if island_window:
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    f"""
-                    SELECT island, SUM(tourists) AS total_tourists
-                    FROM {ISLAND_TABLE}
-                    WHERE
-                        (year > %s OR (year = %s AND month >= %s))
-                        AND
-                        (year < %s OR (year = %s AND month <= %s))
-                    GROUP BY island
-                    ORDER BY total_tourists DESC
-                    """,
-                    [y_start, y_start, m_start, y_end, y_end, m_end],
-                )
-                island_rows = cursor.fetchall()
+            island_rows = backend.drilldown_totals(
+                "island", *island_window, residence=current_filters["residence"]
+            )
+            market_rows = (
+                backend.drilldown_totals("residence", *island_window, island=island_filter)
+                if island_filter else []
+            )
         except Exception:
-            island_rows = []
-
-        total_islands_all = sum(float(t or 0.0) for _, t in island_rows)
-
-        if total_islands_all > 0:
-            island_total_last_12 = int(total_islands_all)
-
-            for island, total in island_rows:
-                total_f = float(total or 0.0)
-                share_pct = (total_f / total_islands_all) * 100
-                islands_table.append(
-                    {
-                        "island": island,
-                        "tourists_12m": int(total_f),
-                        "share_pct": share_pct,
-                    }
-                )
+            island_rows, market_rows = [], []
 
-            # Filtro por isla en modo analista (solo se deja la seleccionada)
-            if island_filter:
-                islands_table = [
-                    i for i in islands_table if i["island"] == island_filter
-                ]
+        islands_table, island_total_last_12 = _with_shares(island_rows, "island", "tourists_12m")
+        for item in islands_table:
+            item["selected"] = item["island"] == island_filter
+        island_markets, _ = _with_shares(market_rows, "residence", "tourists")
 
-            # Ordenar
-            islands_table.sort(key=lambda x: x["tourists_12m"], reverse=True)
+        island_labels = [i["island"] for i in islands_table]
+        island_values_pct = [round(i["share_pct"], 1) for i in islands_table]
 
-            island_labels = [i["island"] for i in islands_table]
-            island_values_pct = [round(i["share_pct"], 1) for i in islands_table]
-
-            if islands_table:
-                main_island_name = islands_table[0]["island"]
-                main_island_share = islands_table[0]["share_pct"]
-                top3_islands_share = sum(i["share_pct"] for i in islands_table[:3])
+        if islands_table:
+            main_island_name = islands_table[0]["island"]
+            main_island_share = islands_table[0]["share_pct"]
+            top3_islands_share = sum(i["share_pct"] for i in islands_table[:3])
 
     # 13. Años disponibles + comparación año vs año
-    years_available = sorted({int(y) for (y, _) in ym_totals.keys()}) if ym_totals else []
+    years_available = sorted(year_totals)
 
     year_compare_a = int(year_a) if year_a.isdigit() else None
     year_compare_b = int(year_b) if year_b.isdigit() else None
@@ -283,8 +311,8 @@ def dashboard_view(request):
         and year_compare_a in years_available
         and year_compare_b in years_available
     ):
-        total_a = sum(val for (y, _), val in ym_totals.items() if y == year_compare_a)
-        total_b = sum(val for (y, _), val in ym_totals.items() if y == year_compare_b)
+        total_a = year_totals[year_compare_a]
+        total_b = year_totals[year_compare_b]
         if total_b > 0:
             year_compare_delta = ((total_a - total_b) / total_b) * 100
 
@@ -292,14 +320,11 @@ def dashboard_view(request):
     available_residences = sorted({r["residence"] for r in records}) if records else []
     available_islands = sorted({i["island"] for i in islands_table}) if islands_table else []
 
-    # Query string actual para anclarlo al botón de descarga
-    query_string = request.GET.urlencode()
-
-    # 15. Contexto para la plantilla
+    # 15. Contexto para la plantilla. Se cachea entero (FileBasedCache): solo
+    # agregados y las 500 filas de la tabla, nunca todas las filas leídas
     context = {
         "columns": columns,
         "rows": table_rows,
-        "records": records,
         "total_rows": total_rows,
         "date_col": "year/month",
         "visitors_col": "tourists",
@@ -314,6 +339,8 @@ def dashboard_view(request):
         "kpi_last_12m_growth_pct": kpi_last_12m_growth_pct,
         "best_period_label": best_period_label,
         "best_period_value": best_period_value,
+        "kpi_spend_per_tourist": measure_kpis.get("spend_per_tourist"),
+        "kpi_avg_stay": measure_kpis.get("avg_stay"),
 
         # Dependencia de mercados
         "main_market_name": main_market_name,
@@ -326,10 +353,13 @@ def dashboard_view(request):
         "covid_min_val": covid_min_val,
         "covid_drop_pct": covid_drop_pct,
         "recovery_month_label": recovery_month_label,
+        "recent_anomalies": recent_anomalies,
 
         # Series principales
         "chart_labels": json.dumps(chart_labels),
         "chart_values": json.dumps(chart_values),
+        "chart_points": chart_points,
+        "chart_points_total": len(ym_sorted),
         "season_labels": json.dumps(season_labels),
         "season_values": json.dumps(season_values),
 
@@ -338,6 +368,8 @@ def dashboard_view(request):
 
         # Top 5 países
         "top_residences": top_residences_list,
+        # Todos los mercados de mayor a menor (warm-up de la caché)
+        "residences_ranked": [name for name, _ in residences_ranked],
 
         # ISLAS – tabla, KPIs, barra + mapa
         "islands_table": islands_table,
@@ -348,6 +380,8 @@ def dashboard_view(request):
         "islands_map_json": json.dumps(islands_table),
         "island_leader_name": main_island_name,
         "island_leader_share": main_island_share,
+        "islands_window_label": islands_window_label,
+        "island_markets": island_markets,
 
         # Compatibilidad antigua (no los usas en HTML, pero los dejo)
         "island_shares": islands_table,
@@ -368,12 +402,83 @@ def dashboard_view(request):
         "year_compare_a": year_compare_a,
         "year_compare_b": year_compare_b,
         "year_compare_delta": year_compare_delta,
+    }
+    return context
+
+
+def series_view(request):
+    """
+    Serie mensual de turistas en JSON, reducida con LTTB a ?points= puntos.
 
-        # Query string para el botón de descarga
-        "query_string": query_string,
+    Parámetros: residence / year_from / year_to (como el dashboard) y points.
+    Se cachea por (versión de datos, backend, filtros, points).
+    """
+    bad_request = _bad_year_params(request.GET)
+    if bad_request:
+        return bad_request
+    backend = get_backend()
+    filters = _filters_from_params(request.GET)
+    points = downsampling.parse_points(request.GET.get("points"))
+    key = series_cache_key(current_data_version(), backend.name, filters, points)
+    payload = single_flight(
+        key,
+        lambda: build_series(filters, points, backend),
+        settings.DASHBOARD_CACHE_TIMEOUT,
+    )
+    return JsonResponse(payload)
+
+
+def build_series(filters, points, backend=None):
+    """Serie mensual total (con los filtros) reducida a `points` puntos."""
+    backend = backend or get_backend()
+    rows = sorted(backend.period_totals("total", "month", filters), key=lambda r: (r[1], r[2]))
+    labels, values = downsampling.downsample(
+        [comparison.period_key(year, month) for _, year, month, _ in rows],
+        [int(total or 0) for *_, total in rows],
+        points,
+    )
+    return {
+        "residence": filters["residence"],
+        "points": len(values),
+        "total_points": len(rows),
+        "labels": labels,
+        "values": values,
     }
 
-    return render(request, "analytics/dashboard.html", context)
+
+def island_drilldown_view(request):
+    """
+    Drill-down isla × residencia en JSON, desde las marginales precalculadas.
+
+    Parámetros:
+    - residence: cuota por isla solo de ese mercado (vacío = todos)
+    - island: mix de mercados de esa isla (vacío = todas las islas)
+    - year_from / year_to: rango de años (vacío = todo el histórico)
+    """
+    bad_request = _bad_year_params(request.GET)
+    if bad_request:
+        return bad_request
+    filters = _filters_from_params(request.GET)
+    island = request.GET.get("island") or None
+    start = (filters["year_from"] or 0, 1)
+    end = (filters["year_to"] or 9999, 12)
+
+    backend = get_backend()
+    islands, islands_total = _with_shares(
+        backend.drilldown_totals("island", start, end, residence=filters["residence"]),
+        "island", "tourists",
+    )
+    residences, residences_total = _with_shares(
+        backend.drilldown_totals("residence", start, end, island=island),
+        "residence", "tourists",
+    )
+    return JsonResponse({
+        "filters": {**filters, "island": island},
+        "islands": islands,
+        "islands_total": islands_total,
+        "residences": residences,
+        "residences_total": residences_total,
+    })
 
 
 def download_clean_csv(request):
@@ -382,20 +487,10 @@ def download_clean_csv(request):
     (residence + rango de años). Island no se aplica aquí porque la tabla
     principal no tiene columna island.
     """
-    where_sql, params, _ = _build_where_from_request(request)
-
-    with connection.cursor() as cursor:
-        cursor.execute(
-            f"""
-            SELECT year, month, residence, tourists
-            FROM {TABLE_NAME}
-            {where_sql}
-            ORDER BY year, month, residence
-            """,
-            params,
-        )
-        columns = [col[0] for col in cursor.description]
-        rows = cursor.fetchall()
+    bad_request = _bad_year_params(request.GET)
+    if bad_request:
+        return bad_request
+    columns, rows = get_backend().monthly_rows(_filters_from_params(request.GET))
 
     response = HttpResponse(content_type="text/csv")
     response["Content-Disposition"] = 'attachment; filename="frontur_canarias_clean.csv"'
@@ -406,3 +501,209 @@ def download_clean_csv(request):
         writer.writerow(row)
 
     return response
+
+
+def download_delta_view(request):
+    """
+    Feed incremental para refrescos de Power BI y otros clientes:
+    - dataset: monthly (por defecto) | islands
+    - since: marca de agua del refresco anterior (vacío o 0 = todo)
+    - format: json (por defecto) | csv
+
+    Devuelve solo las filas insertadas, modificadas o eliminadas desde since,
+    con una columna op, y la nueva marca de agua (en el JSON o, en CSV, en la
+    cabecera X-Watermark). Con full=True (X-Full-Refresh: 1) son todas las
+    filas y el cliente debe sustituir las que tenía.
+    """
+    dataset = request.GET.get("dataset") or "monthly"
+    if dataset not in delta.DELTA_DATASETS:
+        return HttpResponseBadRequest(f"dataset desconocido: {dataset!r}")
+    since = request.GET.get("since") or "0"
+    if not since.isdigit():
+        return HttpResponseBadRequest("since debe ser la marca de agua (entero) del refresco anterior.")
+
+    payload = delta.build_delta(dataset, int(since))
+
+    if request.GET.get("format") == "csv":
+        response = HttpResponse(content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="frontur_{dataset}_delta.csv"'
+        response["X-Watermark"] = str(payload["watermark"])
+        response["X-Full-Refresh"] = "1" if payload["full"] else "0"
+        writer = csv.writer(response)
+        writer.writerow(payload["columns"])
+        writer.writerows(payload["rows"])
+        return response
+    return JsonResponse(payload)
+
+
+def comparison_view(request):
+    """
+    Matriz de comparación N×N entre periodos, por dimensión.
+
+    Parámetros:
+    - periods: "2019,2023,2024" (años) o "2023-07,2024-07" (meses); vacío = todos
+    - granularity: year | month (si no se deduce de periods; por defecto year)
+    - dimension: total, residence, island (separadas por comas)
+    - residence / year_from / year_to: mismos filtros que el dashboard
+    - format: json (por defecto) | csv
+
+    Una consulta agrupada por dimensión; las variaciones se calculan en bloque
+    con numpy. Con granularidad mensual se añade la variación frente al mismo
+    mes del año anterior (yoy_pct).
+    """
+    try:
+        granularity, periods = comparison.parse_periods(request.GET.get("periods"))
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    requested = request.GET.get("granularity") or granularity or "year"
+    if requested not in ("year", "month") or (granularity and requested != granularity):
+        return HttpResponseBadRequest("granularity debe ser 'year' o 'month' y coincidir con periods.")
+    granularity = requested
+
+    dimensions = [d.strip() for d in (request.GET.get("dimension") or "total").split(",") if d.strip()]
+    unknown = [d for d in dimensions if d not in COMPARISON_DIMENSIONS]
+    if unknown:
+        return HttpResponseBadRequest(f"Dimensión desconocida: {', '.join(unknown)}")
+    bad_request = _bad_year_params(request.GET)
+    if bad_request:
+        return bad_request
+
+    filters = _filters_from_params(request.GET)
+    backend = get_backend()
+
+    results = {}
+    for dimension in dimensions:
+        rows = backend.period_totals(dimension, granularity, filters)
+        labels, all_periods, all_values = comparison.build_matrix(rows)
+
+        selected = periods or all_periods
+        if len(selected) > MAX_COMPARE_PERIODS:
+            return HttpResponseBadRequest(
+                f"Demasiados periodos ({len(selected)}); máximo {MAX_COMPARE_PERIODS}."
+            )
+        values = comparison.select_periods(all_values, all_periods, selected)
+        pct = comparison.pct_change_matrix(values)
+
+        result = {
+            "periods": selected,
+            "labels": labels,
+            "totals": comparison.to_jsonable(values),
+            "pct_change": comparison.to_jsonable(pct),
+        }
+        if granularity == "month":
+            yoy, base_periods = comparison.same_month_last_year(all_values, all_periods)
+            col_idx = {p: j for j, p in enumerate(all_periods)}
+            result["yoy_pct"] = comparison.to_jsonable(
+                comparison.select_periods(yoy, all_periods, selected)
+            )
+            result["yoy_base_periods"] = [
+                base_periods[col_idx[p]] if p in col_idx else None for p in selected
+            ]
+        results[dimension] = (result, values, pct)
+
+    if request.GET.get("format") == "csv":
+        response = HttpResponse(content_type="text/csv")
+        response["Content-Disposition"] = 'attachment; filename="frontur_comparison.csv"'
+        writer = csv.writer(response)
+        writer.writerow(
+            ["dimension", "label", "period", "base_period", "total", "base_total", "pct_change"]
+        )
+        for dimension, (result, values, pct) in results.items():
+            writer.writerows(
+                comparison.iter_csv_rows(dimension, result["labels"], result["periods"], values, pct)
+            )
+        return response
+
+    payload = {
+        "granularity": granularity,
+        "filters": filters,
+        "dimensions": {dimension: result for dimension, (result, _, _) in results.items()},
+    }
+    return JsonResponse(payload)
+
+
+def _export_payload(job):
+    payload = {
+        "id": job["id"],
+        "status": job["status"],
+        "dataset": job["dataset"],
+        "format": job["format"],
+        "filters": job["filters"],
+        "data_version": job["data_version"],
+        "rows": job["row_count"],
+        "error": job["error"],
+        "status_url": reverse("export_status", args=[job["id"]]),
+    }
+    if job["status"] == "done":
+        payload["download_url"] = reverse("export_download", args=[job["id"]])
+    return payload
+
+
+def export_submit_view(request):
+    """
+    Encola una exportación (GET o POST):
+    - dataset: monthly (por defecto) | islands
+    - format: csv (por defecto) | parquet
+    - residence / island / year_from / year_to: mismos filtros que el dashboard
+
+    Si ya existe el fichero para la misma versión de datos, filtros y formato
+    se devuelve ese trabajo terminado. Con redirect=1 y el fichero listo,
+    redirige directamente a la descarga.
+    """
+    params = request.POST if request.method == "POST" else request.GET
+    dataset = params.get("dataset") or "monthly"
+    fmt = params.get("format") or "csv"
+    if dataset not in exports.EXPORT_DATASETS:
+        return HttpResponseBadRequest(f"dataset desconocido: {dataset!r}")
+    if fmt not in exports.EXPORT_FORMATS:
+        return HttpResponseBadRequest(f"format desconocido: {fmt!r}")
+    bad_request = _bad_year_params(params)
+    if bad_request:
+        return bad_request
+
+    job = exports.submit_export(dataset, exports.normalize_export_filters(dataset, params), fmt)
+    if job["status"] == "done" and params.get("redirect"):
+        return redirect("export_download", job["id"])
+    return JsonResponse(_export_payload(job), status=200 if job["status"] == "done" else 202)
+
+
+def export_status_view(request, job_id):
+    """Estado de una exportación; con redirect=1 y terminada, redirige a la descarga."""
+    job = exports.get_job(job_id)
+    if job is None:
+        raise Http404("Exportación no encontrada")
+    if job["status"] == "done" and request.GET.get("redirect"):
+        return redirect("export_download", job["id"])
+
+    response = JsonResponse(_export_payload(job))
+    if job["status"] in ("queued", "running"):
+        response["Retry-After"] = "2"
+    return response
+
+
+def export_download_view(request, job_id):
+    """
+    Sirve el fichero generado. Con settings.EXPORT_SENDFILE_HEADER la
+    transferencia la hace el servidor frontal (nginx / Apache) y el worker
+    queda libre enseguida; si no, FileResponse lo envía desde disco en bloques.
+    """
+    job = exports.get_job(job_id)
+    if job is None or job["status"] != "done":
+        raise Http404("Exportación no disponible")
+    path = exports.export_path(job)
+    if not path.exists():
+        raise Http404("El fichero de la exportación ya no existe; vuelve a solicitarla.")
+
+    header = settings.EXPORT_SENDFILE_HEADER
+    if header:
+        response = HttpResponse(content_type=exports.EXPORT_FORMATS[job["format"]])
+        response["Content-Disposition"] = f'attachment; filename="{path.name}"'
+        response[header] = exports.sendfile_location(path, header)
+        return response
+    return FileResponse(
+        open(path, "rb"),
+        as_attachment=True,
+        filename=path.name,
+        content_type=exports.EXPORT_FORMATS[job["format"]],
+    )
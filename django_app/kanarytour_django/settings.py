@@ -102,6 +102,47 @@ DATABASES = {
     }
 }
 
+# Backend del camino de lectura analítico (analytics/backends.py):
+# - "sqlite": tablas de DATABASES["default"]
+# - "duckdb": motor columnar embebido sobre el almacén Parquet de las ETL
+ANALYTICS_BACKEND = os.environ.get("ANALYTICS_BACKEND", "sqlite")
+ANALYTICS_PARQUET_DIR = BASE_DIR / "data" / "processed" / "parquet"
+
+# =========================
+#  CACHÉ
+# =========================
+
+# Caché en disco compartida por todos los workers de gunicorn y por los
+# comandos de warm-up que lanzan las ETL (manage.py warm_dashboard_cache)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "data" / "cache" / "django",
+        "TIMEOUT": 60 * 60 * 24,
+        "OPTIONS": {"MAX_ENTRIES": 2000},
+    }
+}
+
+DASHBOARD_CACHE_TIMEOUT = 60 * 60 * 24
+SINGLE_FLIGHT_LOCK_DIR = BASE_DIR / "data" / "cache" / "locks"
+
+# Ficheros generados por manage.py export_worker (cola export_jobs),
+# en una carpeta por versión de datos
+EXPORT_DIR = BASE_DIR / "data" / "exports"
+
+# Descarga de exportaciones delegada en el servidor frontal, para que un
+# cliente lento no ocupe un worker síncrono de gunicorn:
+# - "X-Accel-Redirect" (nginx): location interna con alias a EXPORT_DIR, p. ej.
+#       location /protected-exports/ { internal; alias /ruta/a/data/exports/; }
+# - "X-Sendfile" (Apache mod_xsendfile, lighttpd): ruta absoluta del fichero.
+# Vacío: Django envía el fichero (FileResponse), p. ej. en Render sin proxy propio.
+EXPORT_SENDFILE_HEADER = os.environ.get("EXPORT_SENDFILE_HEADER", "")
+EXPORT_SENDFILE_URL = os.environ.get("EXPORT_SENDFILE_URL", "/protected-exports/")
+
+# Matriz de series de la última ejecución de manage.py detect_anomalies
+# (para detectar revisiones de datos ya publicados)
+ANOMALY_STATE_DIR = BASE_DIR / "data" / "cache" / "anomalies"
+
 # =========================
 #  PASSWORDS
 # =========================
@@ -0,0 +1,269 @@
+"""
+Trazas por etapa de las ETL: tiempo, CPU, memoria y filas.
+
+Cada ETL crea un RunTrace y envuelve sus pasos en trace.stage(...):
+
+    trace = RunTrace("frontur_canarias")
+    with trace.stage("read") as st:
+        df = pd.read_csv(...)
+        st.rows_out = len(df)
+    ...
+    trace.finish()
+
+Por etapa se guarda:
+- wall_s / cpu_s: tiempo real y de CPU del proceso
+- py_peak_mb: pico de memoria Python/numpy dentro de la etapa (tracemalloc)
+- rss_mb / rss_peak_mb: memoria residente al terminar y pico del proceso
+- rows_in / rows_out: filas que entran y salen
+
+finish() escribe el informe en JSON en data/runs/<etl>/<fecha-hora>.json, lo
+compara con la ejecución anterior de la misma ETL y marca como regresión las
+etapas bastante más lentas o con bastante más memoria.
+
+tracemalloc ralentiza algo las etapas con muchas asignaciones; se puede
+desactivar con ETL_TRACE_MALLOC=0 (entonces py_peak_mb queda a null).
+
+Uso como script (compara las dos últimas ejecuciones guardadas):
+    python etl/etl_trace.py frontur_canarias
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+# === RUTAS BASE ===
+BASE_DIR = Path(__file__).resolve().parents[1]
+RUNS_DIR = BASE_DIR / "data" / "runs"
+
+# Umbrales de regresión frente a la ejecución anterior (relativo y absoluto)
+WALL_TOLERANCE = 0.25
+WALL_MIN_DELTA_S = 0.5
+MEMORY_TOLERANCE = 0.25
+MEMORY_MIN_DELTA_MB = 20.0
+
+MB = 1024 * 1024
+
+
+def _rss_mb():
+    """Memoria residente actual (Linux /proc); None si no está disponible."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _rss_peak_mb():
+    """Pico de memoria residente del proceso; None en plataformas sin resource."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB, macOS en bytes
+    return peak / MB if sys.platform == "darwin" else peak / 1024
+
+
+class StageRecord:
+    """Métricas de una etapa; la ETL rellena rows_in / rows_out."""
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.wall_s = None
+        self.cpu_s = None
+        self.py_peak_mb = None
+        self.rss_mb = None
+        self.rss_peak_mb = None
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "wall_s": round(self.wall_s, 4) if self.wall_s is not None else None,
+            "cpu_s": round(self.cpu_s, 4) if self.cpu_s is not None else None,
+            "py_peak_mb": round(self.py_peak_mb, 2) if self.py_peak_mb is not None else None,
+            "rss_mb": round(self.rss_mb, 1) if self.rss_mb is not None else None,
+            "rss_peak_mb": round(self.rss_peak_mb, 1) if self.rss_peak_mb is not None else None,
+        }
+
+
+class RunTrace:
+    def __init__(self, etl_name, runs_dir=RUNS_DIR, enabled=True, trace_malloc=None):
+        self.etl_name = etl_name
+        self.runs_dir = Path(runs_dir) / etl_name
+        self.enabled = enabled
+        if trace_malloc is None:
+            trace_malloc = os.environ.get("ETL_TRACE_MALLOC", "1") != "0"
+        self.trace_malloc = enabled and trace_malloc
+        self.stages = []
+        self.started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self._t0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+
+        self._owns_tracemalloc = self.trace_malloc and not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start()
+
+    @classmethod
+    def disabled(cls):
+        """Traza sin efectos, para llamar a los pasos de la ETL fuera de main()."""
+        return cls("disabled", enabled=False)
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        record = StageRecord(name, rows_in)
+        if not self.enabled:
+            yield record
+            return
+
+        if self.trace_malloc:
+            tracemalloc.reset_peak()
+            malloc_base = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        cpu0 = time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall_s = time.perf_counter() - t0
+            record.cpu_s = time.process_time() - cpu0
+            if self.trace_malloc:
+                record.py_peak_mb = max(0, tracemalloc.get_traced_memory()[1] - malloc_base) / MB
+            record.rss_mb = _rss_mb()
+            record.rss_peak_mb = _rss_peak_mb()
+            self.stages.append(record)
+            print(
+                f"  [TRAZA] {name}: {record.wall_s:.2f} s · CPU {record.cpu_s:.2f} s"
+                + (f" · pico {record.py_peak_mb:.1f} MB" if record.py_peak_mb is not None else "")
+                + (f" · filas {record.rows_in if record.rows_in is not None else '-'} → {record.rows_out}"
+                   if record.rows_out is not None else "")
+            )
+
+    def report(self):
+        return {
+            "etl": self.etl_name,
+            "started_at": self.started_at,
+            "wall_s": round(time.perf_counter() - self._t0, 4),
+            "cpu_s": round(time.process_time() - self._cpu0, 4),
+            "rss_peak_mb": _rss_peak_mb(),
+            "tracemalloc": self.trace_malloc,
+            "stages": [stage.as_dict() for stage in self.stages],
+        }
+
+    def finish(self):
+        """Guarda el informe, lo compara con la ejecución anterior y lo devuelve."""
+        if not self.enabled:
+            return None
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+
+        report = self.report()
+        previous_path = latest_run_path(self.runs_dir)
+        previous = json.loads(previous_path.read_text(encoding="utf-8")) if previous_path else None
+        report["previous_run"] = previous_path.name if previous_path else None
+        report["regressions"] = find_regressions(report, previous) if previous else []
+
+        self.runs_dir.mkdir(parents=True, exist_ok=True)
+        # Nombre ordenable por fecha (con microsegundos)
+        path = self.runs_dir / (time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() // 1000 % 1_000_000:06d}.json")
+        path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        print(f"[TRAZA] {len(self.stages)} etapas · {report['wall_s']:.2f} s · informe en {path}")
+        print_regressions(report["regressions"], previous_path)
+        return report
+
+
+def latest_run_path(runs_dir):
+    """Último informe guardado en la carpeta de una ETL (nombres ordenables por fecha)."""
+    runs_dir = Path(runs_dir)
+    if not runs_dir.exists():
+        return None
+    paths = sorted(runs_dir.glob("*.json"))
+    return paths[-1] if paths else None
+
+
+def find_regressions(current, previous):
+    """Etapas (por nombre) más lentas o con más memoria que en la ejecución anterior."""
+    previous_stages = {stage["name"]: stage for stage in previous.get("stages", [])}
+    regressions = []
+
+    for stage in current["stages"]:
+        before = previous_stages.get(stage["name"])
+        if not before:
+            continue
+
+        checks = (
+            ("wall_s", WALL_TOLERANCE, WALL_MIN_DELTA_S),
+            ("py_peak_mb", MEMORY_TOLERANCE, MEMORY_MIN_DELTA_MB),
+        )
+        for metric, tolerance, min_delta in checks:
+            now, then = stage.get(metric), before.get(metric)
+            if now is None or then is None:
+                continue
+            if now - then > min_delta and now > then * (1 + tolerance):
+                regressions.append({
+                    "stage": stage["name"],
+                    "metric": metric,
+                    "previous": then,
+                    "current": now,
+                    "change_pct": round((now - then) / then * 100, 1) if then else None,
+                })
+
+        if stage.get("rows_out") is not None and before.get("rows_out") not in (None, stage["rows_out"]):
+            regressions.append({
+                "stage": stage["name"],
+                "metric": "rows_out",
+                "previous": before["rows_out"],
+                "current": stage["rows_out"],
+                "change_pct": None,
+            })
+    return regressions
+
+
+def print_regressions(regressions, previous_path):
+    if previous_path is None:
+        print("[TRAZA] Primera ejecución registrada; no hay con qué comparar.")
+        return
+    if not regressions:
+        print(f"[TRAZA] Sin regresiones frente a {previous_path.name}.")
+        return
+    for r in regressions:
+        change = f" ({r['change_pct']:+.1f} %)" if r["change_pct"] is not None else ""
+        print(f"[REGRESIÓN] {r['stage']} · {r['metric']}: {r['previous']} → {r['current']}{change}")
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Uso: python etl/etl_trace.py <etl>   (p. ej. frontur_canarias)")
+        sys.exit(2)
+
+    runs_dir = RUNS_DIR / sys.argv[1]
+    paths = sorted(runs_dir.glob("*.json")) if runs_dir.exists() else []
+    if len(paths) < 2:
+        print(f"[INFO] Hacen falta al menos dos ejecuciones en {runs_dir}")
+        return
+
+    previous, current = (json.loads(p.read_text(encoding="utf-8")) for p in paths[-2:])
+    print(f"=== {sys.argv[1]}: {paths[-2].name} → {paths[-1].name} ===")
+    before = {stage["name"]: stage for stage in previous["stages"]}
+    for stage in current["stages"]:
+        then = before.get(stage["name"], {})
+        print(
+            f"  {stage['name']:<12} {then.get('wall_s', '-')!s:>8} → {stage['wall_s']!s:>8} s"
+            f"   {then.get('py_peak_mb', '-')!s:>8} → {stage['py_peak_mb']!s:>8} MB"
+            f"   filas {stage['rows_out']}"
+        )
+    print_regressions(find_regressions(current, previous), paths[-2])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Ingesta de Excel en streaming con caché binaria por contenido.
+
+- Lee la hoja fila a fila con openpyxl en modo read_only (memoria acotada,
+  aunque el libro tenga muchos años y miles de filas).
+- Detecta cabeceras de varias filas: salta los títulos iniciales (filas con
+  una sola celda rellena), toma como cabecera las filas que hay hasta la
+  primera fila de datos y rellena hacia la derecha las celdas combinadas
+  (en read_only solo la primera celda de un rango combinado tiene valor).
+  Así se evitan las columnas 'unnamed:_1', 'unnamed:_2'... de pd.read_excel.
+- Una fila es de datos si su etiqueta (la primera celda rellena) es texto no
+  numérico y el resto de celdas son valores; una fila de cabecera como
+  [None, 2020, 2021] no corta la cabecera.
+- Guarda el resultado en Parquet en data/cache/excel, con el sha256 del
+  fichero en el nombre. Si el Excel no ha cambiado, no se vuelve a parsear.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# === RUTAS BASE ===
+BASE_DIR = Path(__file__).resolve().parents[1]
+CACHE_DIR = BASE_DIR / "data" / "cache" / "excel"
+
+# Se incluye en la clave de caché: si cambia la lógica de parseo, se invalida
+PARSER_VERSION = 2
+
+MAX_HEADER_ROWS = 4
+BATCH_ROWS = 5_000
+
+
+def file_sha256(path, chunk_size=1024 * 1024) -> str:
+    """Hash del contenido del fichero, leído por bloques."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _is_blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_title_row(row) -> bool:
+    return sum(not _is_blank(v) for v in row) <= 1
+
+
+def _is_data_row(row) -> bool:
+    """
+    Fila de datos: la etiqueta (primera celda rellena) es texto no numérico y
+    al menos la mitad de las celdas siguientes son números.
+    """
+    filled = [v for v in row if not _is_blank(v)]
+    if len(filled) < 2:
+        return False
+    label, cells = filled[0], filled[1:]
+    if _is_number(label) or _is_number(_parse_number(label)):
+        return False
+    return sum(_is_number(v) for v in cells) * 2 >= len(cells)
+
+
+def _parse_number(value):
+    """'2020' -> 2020.0; lo que no es número se devuelve tal cual."""
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return value
+    return value
+
+
+def _column_names(header_rows, width):
+    """
+    Combina las filas de cabecera en un nombre por columna.
+    Las filas superiores se rellenan hacia la derecha (celdas combinadas).
+    """
+    filled = []
+    for depth, row in enumerate(header_rows):
+        row = list(row) + [None] * (width - len(row))
+        if depth < len(header_rows) - 1:
+            last = None
+            for i, value in enumerate(row):
+                if _is_blank(value):
+                    row[i] = last
+                else:
+                    last = value
+        filled.append(row)
+
+    names = []
+    used = set()
+    for i in range(width):
+        parts = []
+        for row in filled:
+            value = row[i]
+            if _is_blank(value):
+                continue
+            text = str(value).strip()
+            if not parts or parts[-1] != text:
+                parts.append(text)
+        name = " - ".join(parts) or f"col_{i}"
+
+        if name in used:
+            # sufijo libre: "a", "a", "a_1" -> "a", "a_1", "a_1_1"
+            n = 1
+            while f"{name}_{n}" in used:
+                n += 1
+            name = f"{name}_{n}"
+        used.add(name)
+        names.append(name)
+    return names
+
+
+def _as_text(value):
+    if _is_blank(value):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _split_header(rows):
+    """
+    Consume el iterador de filas hasta la primera fila de datos.
+    Devuelve (filas_de_cabecera, primera_fila_de_datos o None).
+    """
+    header = []
+    for row in rows:
+        if all(_is_blank(v) for v in row):
+            continue
+        if not header and _is_title_row(row):
+            continue
+        if _is_data_row(row):
+            return header[-MAX_HEADER_ROWS:], row
+        header.append(row)
+    return header[-MAX_HEADER_ROWS:], None
+
+
+def stream_sheet_to_parquet(xlsx_path, out_path, sheet=None, batch_rows=BATCH_ROWS):
+    """
+    Parsea una hoja en streaming y la escribe como Parquet tipado.
+    Las columnas cuyas celdas son todas numéricas se guardan como float64;
+    el resto como texto. Devuelve el número de filas de datos.
+    """
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(".strings.tmp")
+
+    wb = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if sheet else wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        header_rows, first_data = _split_header(rows)
+
+        width = max([len(r) for r in header_rows] + [len(first_data or ())] + [1])
+        names = _column_names(header_rows, width) if header_rows else [f"col_{i}" for i in range(width)]
+        schema = pa.schema([(name, pa.string()) for name in names])
+        numeric = [True] * width
+        n_rows = 0
+
+        writer = pq.ParquetWriter(tmp_path, schema)
+        try:
+            batch = []
+
+            def flush():
+                if batch:
+                    columns = list(zip(*batch))
+                    writer.write_table(pa.table(
+                        [pa.array(col, type=pa.string()) for col in columns], schema=schema
+                    ))
+                    batch.clear()
+
+            data_rows = rows if first_data is None else _chain_first(first_data, rows)
+            for row in data_rows:
+                if all(_is_blank(v) for v in row):
+                    continue
+                row = _fit_row(row, width, n_rows)
+                for i, value in enumerate(row):
+                    if numeric[i] and not _is_blank(value) and not _is_number(value):
+                        numeric[i] = False
+                batch.append(tuple(_as_text(v) for v in row))
+                n_rows += 1
+                if len(batch) >= batch_rows:
+                    flush()
+            flush()
+        finally:
+            writer.close()
+    finally:
+        wb.close()
+
+    _cast_numeric_columns(tmp_path, out_path, names, numeric)
+    tmp_path.unlink()
+    return n_rows
+
+
+def _fit_row(row, width, n_rows):
+    """
+    Ajusta la fila al ancho de la cabecera. openpyxl rellena las filas hasta
+    la dimensión de la hoja; si aun así sobran celdas con valor, es un error
+    (antes se recortaban sin avisar).
+    """
+    if len(row) > width:
+        if not all(_is_blank(v) for v in row[width:]):
+            raise ValueError(
+                f"Fila de datos {n_rows + 1} con {len(row)} columnas; "
+                f"la cabecera tiene {width}: {row!r}"
+            )
+        row = row[:width]
+    return tuple(row) + (None,) * (width - len(row))
+
+
+def _chain_first(first, rest):
+    yield first
+    yield from rest
+
+
+def _cast_numeric_columns(src, dst, names, numeric):
+    """Reescribe el Parquet de texto convirtiendo a float64 las columnas numéricas, por lotes."""
+    target = pa.schema([
+        (name, pa.float64() if is_num else pa.string())
+        for name, is_num in zip(names, numeric)
+    ])
+    tmp_dst = Path(dst).with_suffix(".tmp")
+    reader = pq.ParquetFile(src)
+    with pq.ParquetWriter(tmp_dst, target, compression="zstd") as writer:
+        for record_batch in reader.iter_batches(batch_size=BATCH_ROWS):
+            arrays = [
+                pc.cast(record_batch.column(i), target.field(i).type)
+                for i in range(len(names))
+            ]
+            writer.write_table(pa.table(arrays, schema=target))
+    os.replace(tmp_dst, dst)
+
+
+def cache_path_for(xlsx_path, sheet=None, cache_dir=CACHE_DIR) -> Path:
+    digest = file_sha256(xlsx_path)
+    sheet_tag = sheet or "first"
+    return Path(cache_dir) / f"{digest[:32]}-{sheet_tag}-v{PARSER_VERSION}.parquet"
+
+
+def read_excel_cached(xlsx_path, sheet=None, cache_dir=CACHE_DIR) -> pd.DataFrame:
+    """
+    Devuelve la hoja como DataFrame. Si existe la caché para el contenido
+    actual del fichero, la lee directamente (sin abrir el Excel).
+    """
+    cached = cache_path_for(xlsx_path, sheet, cache_dir)
+    if cached.exists():
+        print(f"[CACHÉ] Excel sin cambios, se usa el parseo guardado:\n  {cached}")
+    else:
+        print(f"[PARSEO] Leyendo Excel en streaming (read_only):\n  {xlsx_path}")
+        n_rows = stream_sheet_to_parquet(xlsx_path, cached, sheet)
+        print(f"[OK] {n_rows} filas parseadas y guardadas en caché:\n  {cached}")
+
+    return pq.read_table(cached).to_pandas()
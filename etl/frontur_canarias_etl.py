@@ -1,8 +1,17 @@
+import argparse
 import os
+import sqlite3
 from pathlib import Path
 
 import pandas as pd
-from sqlalchemy import create_engine
+
+from post_load import run_post_load_hooks
+from processed_store import dataset_dir, write_dataset
+from star_schema import MONTHLY_FACT as FACT_TABLE, MONTHLY_WIDE_FACT, load_monthly, load_wide
+from etl_trace import RunTrace
+from kpi_snapshots import record_snapshot
+from parsing import decode_labels, parse_locale_number, parse_time_period
+from wide_ingest import measure_column, read_wide_observations
 
 # === RUTAS BASE ===
 BASE_DIR = Path(__file__).resolve().parents[1]
@@ -10,79 +19,152 @@ BASE_DIR = Path(__file__).resolve().parents[1]
 RAW_OBS_FILE = BASE_DIR / "data" / "raw" / "dataset-ISTAC-E16028B_000001-~latest-observations.tsv"
 
 PROCESSED_DIR = BASE_DIR / "data" / "processed"
-PROCESSED_FILE = PROCESSED_DIR / "frontur_canarias_monthly.csv"
 
 DB_PATH = BASE_DIR / "db.sqlite3"
-DB_URL = f"sqlite:///{DB_PATH}"
 
+# Vista sobre el esquema en estrella (ver star_schema.py)
 TABLE_NAME = "frontur_canarias_monthly"
 
+# Dataset Parquet con todas las medidas (modo --all-measures)
+WIDE_TABLE_NAME = "frontur_canarias_monthly_wide"
 
-def main():
-    print("=== ETL FRONTUR-CANARIAS (OBSERVATIONS TSV) ===")
+# Columna de la tabla ancha de la que sale la tabla clásica de turistas
+TOURISTS_MEASURE = measure_column("Turistas")
 
-    if not RAW_OBS_FILE.exists():
-        raise FileNotFoundError(
-            f"No se encontró el fichero de observaciones:\n{RAW_OBS_FILE}\n"
-            "Mueve el TSV de ISTAC a data/raw con ese nombre."
-        )
 
-    os.makedirs(PROCESSED_DIR, exist_ok=True)
+def parse_args():
+    parser = argparse.ArgumentParser(description="ETL FRONTUR-Canarias (observaciones ISTAC)")
+    parser.add_argument(
+        "--all-measures", action="store_true",
+        help="Pivota TODAS las medidas en una tabla ancha (una sola pasada por el TSV).",
+    )
+    return parser.parse_args()
 
-    print(f"[1] Cargando TSV de observaciones desde:\n    {RAW_OBS_FILE}")
-    df_obs = pd.read_csv(RAW_OBS_FILE, sep="\t", dtype=str)
 
-    print("\nColumnas encontradas en OBSERVATIONS:")
-    print(list(df_obs.columns), "\n")
+def clean_tourists(df_obs, trace=None):
+    """Camino clásico: solo Canarias y medida 'Turistas' → (year, month, residence, tourists)."""
+    trace = trace or RunTrace.disabled()
 
     # === 1. Filtrar solo Canarias y medida 'Turistas' ===
-    mask_canarias = df_obs["TERRITORIO"] == "Canary Islands"
-    mask_turistas = df_obs["MEDIDAS"] == "Turistas"
+    with trace.stage("filter", rows_in=len(df_obs)) as st:
+        mask_canarias = df_obs["TERRITORIO"] == "Canary Islands"
+        mask_turistas = df_obs["MEDIDAS"] == "Turistas"
 
-    df = df_obs[mask_canarias & mask_turistas].copy()
+        df = df_obs[mask_canarias & mask_turistas].copy()
+        st.rows_out = len(df)
 
     if df.empty:
         raise ValueError("No hay filas para (TERRITORIO='Canary Islands', MEDIDAS='Turistas').")
 
     # === 2. Extraer año y mes del campo TIME_PERIOD (formato '10/2025') ===
-    periodo = df["TIME_PERIOD"].astype(str)
-
-    df["month"] = periodo.str.extract(r"(\d{2})/\d{4}").astype(int)
-    df["year"] = periodo.str.extract(r"\d{2}/(\d{4})").astype(int)
-
-    # === 3. Limpiar número de turistas (OBS_VALUE) ===
-    # En este dataset son enteros sin separador de miles (ej. 1370188), pero lo hacemos robusto.
-    tourists_str = (
-        df["OBS_VALUE"]
-        .astype(str)
-        .str.replace(".", "", regex=False)
-        .str.replace(",", ".", regex=False)
-    )
-    df["tourists"] = pd.to_numeric(tourists_str, errors="coerce")
+    with trace.stage("parse", rows_in=len(df)) as st:
+        df[["year", "month"]] = parse_time_period(df["TIME_PERIOD"])
+        st.rows_out = len(df)
+
+    with trace.stage("clean", rows_in=len(df)) as st:
+        # === 3. Limpiar número de turistas (OBS_VALUE) ===
+        # En este dataset son enteros sin separador de miles (ej. 1370188), pero lo hacemos robusto.
+        df["tourists"] = parse_locale_number(df["OBS_VALUE"])
+
+        df = df.dropna(subset=["tourists"])
+
+        # === 4. Normalizar residencia (LUGAR_RESIDENCIA) ===
+        df["residence"] = decode_labels(df["LUGAR_RESIDENCIA"])
+
+        df_clean = df[["year", "month", "residence", "tourists"]].copy()
+        st.rows_out = len(df_clean)
 
-    df = df.dropna(subset=["tourists"])
+    return df_clean
 
-    # === 4. Normalizar residencia (LUGAR_RESIDENCIA) ===
-    df["residence"] = df["LUGAR_RESIDENCIA"].astype(str).str.strip()
+
+def main():
+    args = parse_args()
+    trace = RunTrace("frontur_canarias" + ("_wide" if args.all_measures else ""))
+    print("=== ETL FRONTUR-CANARIAS (OBSERVATIONS TSV) ===")
+
+    if not RAW_OBS_FILE.exists():
+        raise FileNotFoundError(
+            f"No se encontró el fichero de observaciones:\n{RAW_OBS_FILE}\n"
+            "Mueve el TSV de ISTAC a data/raw con ese nombre."
+        )
+
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+
+    wide = None
+    if args.all_measures:
+        # Una sola pasada por bloques: todas las medidas pivotadas a columnas
+        # (lectura, filtro y parseo van fusionados en la misma pasada: una sola etapa)
+        print(f"[1] Leyendo TODAS las medidas (tabla ancha) desde:\n    {RAW_OBS_FILE}")
+        with trace.stage("read_pivot") as st:
+            wide = read_wide_observations(
+                RAW_OBS_FILE,
+                dimensions={"LUGAR_RESIDENCIA": "residence"},
+                pivot_cols=["MEDIDAS"],
+                row_filter={"TERRITORIO": "Canary Islands"},
+            )
+            st.rows_out = len(wide)
+        if wide.empty or TOURISTS_MEASURE not in wide.columns:
+            raise ValueError("No hay filas para (TERRITORIO='Canary Islands', MEDIDAS='Turistas').")
+        print("Medidas encontradas:", [c for c in wide.columns if c not in ("year", "month", "residence")])
+
+        with trace.stage("clean", rows_in=len(wide)) as st:
+            df_clean = (
+                wide.loc[wide[TOURISTS_MEASURE].notna(), ["year", "month", "residence", TOURISTS_MEASURE]]
+                .rename(columns={TOURISTS_MEASURE: "tourists"})
+            )
+            st.rows_out = len(df_clean)
+    else:
+        print(f"[1] Cargando TSV de observaciones desde:\n    {RAW_OBS_FILE}")
+        with trace.stage("read") as st:
+            df_obs = pd.read_csv(RAW_OBS_FILE, sep="\t", dtype=str)
+            st.rows_out = len(df_obs)
+
+        print("\nColumnas encontradas en OBSERVATIONS:")
+        print(list(df_obs.columns), "\n")
+
+        df_clean = clean_tourists(df_obs, trace)
 
     # === 5. Dataset final limpio ===
-    df_clean = df[["year", "month", "residence", "tourists"]].copy()
     df_clean = df_clean.sort_values(["year", "month", "residence"])
 
     print("Primeras filas limpias:")
     print(df_clean.head(12))
 
-    # === 6. Guardar CSV procesado ===
-    df_clean.to_csv(PROCESSED_FILE, index=False, encoding="utf-8")
-    print(f"\n[OK] CSV procesado guardado en:\n    {PROCESSED_FILE}")
-
-    # === 7. Guardar en SQLite ===
-    engine = create_engine(DB_URL)
-
-    with engine.begin() as conn:
-        df_clean.to_sql(TABLE_NAME, conn, if_exists="replace", index=False)
-
-    print(f"[OK] Tabla '{TABLE_NAME}' creada / reemplazada en:\n    {DB_PATH}")
+    # === 6. Guardar dataset procesado (Parquet particionado por año) ===
+    with trace.stage("write", rows_in=len(df_clean)) as st:
+        write_dataset(df_clean, TABLE_NAME)
+        if wide is not None:
+            write_dataset(wide, WIDE_TABLE_NAME)
+        st.rows_out = len(df_clean)
+    print(f"\n[OK] Parquet procesado guardado en:\n    {dataset_dir(TABLE_NAME)}")
+    if wide is not None:
+        print(f"[OK] Parquet ancho (todas las medidas) en:\n    {dataset_dir(WIDE_TABLE_NAME)}")
+
+    # === 7. Guardar en SQLite (esquema en estrella: dimensiones + hechos con claves enteras) ===
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        with trace.stage("load", rows_in=len(df_clean)) as st:
+            n_facts = load_monthly(conn, df_clean)
+            if wide is not None:
+                n_wide = load_wide(conn, MONTHLY_WIDE_FACT, wide, ["residence"])
+            conn.commit()
+            st.rows_out = n_facts
+        if wide is not None:
+            print(f"[OK] Tabla ancha '{MONTHLY_WIDE_FACT}' recargada ({n_wide} filas)")
+    finally:
+        conn.close()
+
+    print(f"[OK] Tabla '{FACT_TABLE}' recargada ({n_facts} filas) y vista '{TABLE_NAME}' en:\n    {DB_PATH}")
+
+    # === 8. Instantánea de KPIs (solo se guardan los periodos que cambian) ===
+    with trace.stage("snapshot", rows_in=len(df_clean)):
+        record_snapshot(TABLE_NAME, df_clean, ["residence"])
+
+    # === 9. Warm-up de la caché del dashboard y publicación de la nueva versión ===
+    with trace.stage("post_load"):
+        run_post_load_hooks()
+
+    trace.finish()
     print("=== ETL FRONTUR-CANARIAS COMPLETADO ===")
 
 
@@ -4,6 +4,11 @@ import requests
 import pandas as pd
 from sqlalchemy import create_engine
 
+from etl_trace import RunTrace
+from excel_ingest import read_excel_cached
+from parsing import normalize_columns
+from processed_store import write_dataset
+
 # =========================
 # CONFIGURACIÓN DEL PROYECTO
 # =========================
@@ -18,8 +23,8 @@ PROCESSED_DIR = os.path.join(BASE_DIR, "data", "processed")
 # Nombre del fichero Excel que ya has descargado (si no existe, se descargará)
 RAW_FILE_NAME = "frontur_euskadi_2021_viajes.xlsx"
 
-# Nombre del fichero CSV limpio
-CLEAN_FILE_NAME = "frontur_euskadi_2021_limpio.csv"
+# Año de referencia del Excel (se usa como partición del dataset procesado)
+DATA_YEAR = 2021
 
 # Base de datos SQLite
 DB_PATH = os.path.join(BASE_DIR, "db.sqlite3")
@@ -61,13 +66,13 @@ def download_excel_if_needed():
 
 def inspect_excel(raw_path: str):
     """
-    Lee el Excel y muestra por pantalla:
+    Lee el Excel (streaming read_only + caché por hash del fichero) y muestra por pantalla:
     - Número de filas y columnas
     - Nombres de columnas
     - Primeras 5 filas
     """
     print(f"[LEER] Leyendo Excel:\n  {raw_path}")
-    df = pd.read_excel(raw_path)
+    df = read_excel_cached(raw_path)
 
     print("\n[INFO] Dimensiones del DataFrame:")
     print(f"  Filas: {df.shape[0]}, Columnas: {df.shape[1]}")
@@ -82,27 +87,27 @@ def inspect_excel(raw_path: str):
     return df
 
 
-def clean_and_save_csv(df: pd.DataFrame):
+def clean(df: pd.DataFrame) -> pd.DataFrame:
     """
     Limpieza básica:
     - Normaliza nombres de columnas (minúsculas, sin espacios)
     - Elimina filas completamente vacías
-    - Guarda CSV limpio en data/processed
     """
     print("\n[LIMPIEZA] Normalizando nombres de columnas...")
     df = df.copy()
-    df.columns = [str(c).strip().lower().replace(" ", "_").replace("ó", "o").replace("á", "a")
-                  .replace("é", "e").replace("í", "i").replace("ú", "u")
-                  for c in df.columns]
+    df.columns = normalize_columns(df.columns)
 
     print("[LIMPIEZA] Eliminando filas completamente vacías...")
     df.dropna(how="all", inplace=True)
+    return df
 
-    clean_path = os.path.join(PROCESSED_DIR, CLEAN_FILE_NAME)
-    df.to_csv(clean_path, index=False, encoding="utf-8-sig")
-    print(f"[OK] CSV limpio guardado en:\n  {clean_path}")
+
+def write_processed(df: pd.DataFrame):
+    """Guarda el dataset limpio en data/processed (Parquet, partición year=DATA_YEAR)."""
+    clean_path = write_dataset(df.assign(year=DATA_YEAR), TABLE_NAME)
+    print(f"[OK] Parquet limpio guardado en:\n  {clean_path}")
     print(f"[INFO] Filas: {df.shape[0]}, Columnas: {df.shape[1]}")
-    return clean_path, df
+    return clean_path
 
 
 def load_to_sqlite(df: pd.DataFrame):
@@ -121,17 +126,31 @@ def load_to_sqlite(df: pd.DataFrame):
 
 def run_etl():
     """Orquesta todo el proceso ETL."""
-    print("===== ETL FRONTUR EUSKADI 2021 (Descarga → Limpieza → CSV → SQLite) =====")
+    print("===== ETL FRONTUR EUSKADI 2021 (Descarga → Limpieza → Parquet → SQLite) =====")
+
+    trace = RunTrace("frontur_euskadi")
 
     ensure_directories()
-    raw_path = download_excel_if_needed()
-    df_raw = inspect_excel(raw_path)
-    clean_path, df_clean = clean_and_save_csv(df_raw)
-    load_to_sqlite(df_clean)
+    with trace.stage("download"):
+        raw_path = download_excel_if_needed()
+    with trace.stage("read") as st:
+        df_raw = inspect_excel(raw_path)
+        st.rows_out = len(df_raw)
+    with trace.stage("clean", rows_in=len(df_raw)) as st:
+        df_clean = clean(df_raw)
+        st.rows_out = len(df_clean)
+    with trace.stage("write", rows_in=len(df_clean)) as st:
+        clean_path = write_processed(df_clean)
+        st.rows_out = len(df_clean)
+    with trace.stage("load", rows_in=len(df_clean)) as st:
+        load_to_sqlite(df_clean)
+        st.rows_out = len(df_clean)
+
+    trace.finish()
 
     print("\n===== ETL COMPLETADO =====")
     print(f"- Excel original: {raw_path}")
-    print(f"- CSV limpio:     {clean_path}")
+    print(f"- Parquet limpio: {clean_path}")
     print(f"- SQLite:         {DB_PATH} (tabla '{TABLE_NAME}')")
 
 
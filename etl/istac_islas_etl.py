@@ -1,7 +1,17 @@
-import pandas as pd
+import argparse
 import sqlite3
 from pathlib import Path
 
+import pandas as pd
+
+from post_load import run_post_load_hooks
+from processed_store import ISLANDS_MARGINALS_DATASET, dataset_dir, island_marginals, write_dataset
+from star_schema import ISLANDS_FACT as FACT_TABLE, ISLANDS_WIDE_FACT, load_islands, load_wide
+from etl_trace import RunTrace
+from kpi_snapshots import record_snapshot
+from parsing import decode_labels, parse_time_period
+from wide_ingest import measure_column, read_wide_observations
+
 # ==== Rutas básicas ====
 # BASE_DIR = carpeta raíz del proyecto (kanarytour_frontur_analytics)
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -13,115 +23,150 @@ DB_PATH = BASE_DIR / "db.sqlite3"
 OBS_FILE = RAW_DIR / "dataset-ISTAC-E16028B_000011-~latest-observations.tsv"
 ATTR_FILE = RAW_DIR / "dataset-ISTAC-E16028B_000011-~latest-attributes.tsv"  # ahora no lo usamos, pero lo dejamos referenciado
 
-# Nombre de la tabla nueva en SQLite
+# Nombre de la tabla en SQLite (vista sobre el esquema en estrella, ver star_schema.py)
 TABLE_NAME = "frontur_canarias_islands_monthly"
 
-# CSV procesado que dejaremos en data/processed
-PROCESSED_CSV = PROCESSED_DIR / "frontur_canarias_islands_monthly.csv"
+# El dataset procesado se guarda en data/processed/parquet/dataset=<TABLE_NAME>
 
+# Modo --all-measures: todas las medidas y tipos de viajero como columnas
+WIDE_TABLE_NAME = "frontur_canarias_islands_monthly_wide"
+TOURISTS_MEASURE = measure_column("Tourist", "Turistas")
 
-def main():
-    print("==== ETL ISTAC · Tabla 6 (Islas por residencia) ====")
-    print("BASE_DIR:", BASE_DIR)
-    print("Leyendo observaciones de:", OBS_FILE)
 
-    # === 1. Leer observaciones ===
-    df = pd.read_csv(OBS_FILE, sep="\t")
+def parse_args():
+    parser = argparse.ArgumentParser(description="ETL ISTAC · Tabla 6 (islas por residencia)")
+    parser.add_argument(
+        "--all-measures", action="store_true",
+        help="Pivota TODAS las medidas y tipos de viajero en una tabla ancha (una sola pasada).",
+    )
+    return parser.parse_args()
+
+
+def read_tourists(obs_file, trace=None):
+    """Camino clásico: solo viajeros 'Tourist' y medida 'Turistas'."""
+    trace = trace or RunTrace.disabled()
+
+    with trace.stage("read") as st:
+        df = pd.read_csv(obs_file, sep="\t")
+        st.rows_out = len(df)
 
     # Solo nos quedamos con viajeros tipo "Tourist" y medida "Turistas"
-    df = df[
-        (df["TIPO_VIAJERO"] == "Tourist")
-        & (df["MEDIDAS"] == "Turistas")
-    ].copy()
+    with trace.stage("filter", rows_in=len(df)) as st:
+        df = df[
+            (df["TIPO_VIAJERO"] == "Tourist")
+            & (df["MEDIDAS"] == "Turistas")
+        ].copy()
+        st.rows_out = len(df)
 
     print("Filas tras filtrar Tourist/Turistas:", len(df))
 
     # === 2. Parsear año/mes desde TIME_PERIOD ("10/2025" → year=2025, month=10) ===
-    def parse_period(s: str):
-        m_str, y_str = str(s).split("/")
-        return int(y_str), int(m_str)
-
-    df["year"], df["month"] = zip(*df["TIME_PERIOD"].map(parse_period))
-
-    # Fecha normalizada YYYY-MM-01 (como texto, amigable para SQLite y Django)
-    df["date"] = pd.to_datetime(df[["year", "month"]].assign(day=1))
-
-    # === 3. Nos quedamos con las columnas relevantes y renombramos ===
-    clean = df[
-        ["year", "month", "date", "LUGAR_RESIDENCIA", "TERRITORIO", "OBS_VALUE"]
-    ].rename(
-        columns={
-            "LUGAR_RESIDENCIA": "residence",
-            "TERRITORIO": "island",
-            "OBS_VALUE": "tourists",
-        }
-    )
+    with trace.stage("parse", rows_in=len(df)) as st:
+        df[["year", "month"]] = parse_time_period(df["TIME_PERIOD"])
+        st.rows_out = len(df)
+
+    with trace.stage("clean", rows_in=len(df)) as st:
+        # === 3. Nos quedamos con las columnas relevantes y renombramos ===
+        clean = df[
+            ["year", "month", "LUGAR_RESIDENCIA", "TERRITORIO", "OBS_VALUE"]
+        ].rename(
+            columns={
+                "LUGAR_RESIDENCIA": "residence",
+                "TERRITORIO": "island",
+                "OBS_VALUE": "tourists",
+            }
+        )
+
+        # Quitamos filas sin dato numérico
+        before = len(clean)
+        clean = clean.dropna(subset=["tourists"])
+        after = len(clean)
+
+        # Aseguramos tipos básicos
+        clean["year"] = clean["year"].astype(int)
+        clean["month"] = clean["month"].astype(int)
+        # Sin espacios en los extremos, igual que las dimensiones de la estrella
+        clean["residence"] = decode_labels(clean["residence"])
+        clean["island"] = decode_labels(clean["island"])
+        clean["tourists"] = clean["tourists"].astype(float)
+        st.rows_out = len(clean)
 
-    # Quitamos filas sin dato numérico
-    before = len(clean)
-    clean = clean.dropna(subset=["tourists"])
-    after = len(clean)
     print(f"Filas totales: {before}  →  después de limpiar NaN: {after}")
+    return clean
 
-    # Aseguramos tipos básicos
-    clean["year"] = clean["year"].astype(int)
-    clean["month"] = clean["month"].astype(int)
-    clean["date"] = clean["date"].dt.strftime("%Y-%m-%d")
-    clean["residence"] = clean["residence"].astype(str)
-    clean["island"] = clean["island"].astype(str)
-    clean["tourists"] = clean["tourists"].astype(float)
 
-    # === 4. Guardar CSV procesado ===
-    PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
-    clean.to_csv(PROCESSED_CSV, index=False, encoding="utf-8")
-    print("✔ CSV limpio guardado en:", PROCESSED_CSV)
+def main():
+    args = parse_args()
+    trace = RunTrace("istac_islas" + ("_wide" if args.all_measures else ""))
+    print("==== ETL ISTAC · Tabla 6 (Islas por residencia) ====")
+    print("BASE_DIR:", BASE_DIR)
+    print("Leyendo observaciones de:", OBS_FILE)
 
-    # === 5. Volcar a SQLite (db.sqlite3 de Django) ===
+    # === 1-3. Leer y limpiar observaciones ===
+    wide = None
+    if args.all_measures:
+        # Una sola pasada por bloques: (tipo de viajero, medida) pivotados a columnas
+        # (lectura, filtro y parseo van fusionados en la misma pasada: una sola etapa)
+        with trace.stage("read_pivot") as st:
+            wide = read_wide_observations(
+                OBS_FILE,
+                dimensions={"LUGAR_RESIDENCIA": "residence", "TERRITORIO": "island"},
+                pivot_cols=["TIPO_VIAJERO", "MEDIDAS"],
+            )
+            st.rows_out = len(wide)
+        if TOURISTS_MEASURE not in wide.columns:
+            raise ValueError("No hay filas para (TIPO_VIAJERO='Tourist', MEDIDAS='Turistas').")
+        print("Medidas encontradas:", [c for c in wide.columns if c not in ("year", "month", "residence", "island")])
+
+        with trace.stage("clean", rows_in=len(wide)) as st:
+            clean = (
+                wide.loc[wide[TOURISTS_MEASURE].notna(), ["year", "month", "residence", "island", TOURISTS_MEASURE]]
+                .rename(columns={TOURISTS_MEASURE: "tourists"})
+            )
+            st.rows_out = len(clean)
+    else:
+        clean = read_tourists(OBS_FILE, trace)
+
+    # === 4. Guardar dataset procesado (Parquet particionado por año) ===
+    PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+    with trace.stage("write", rows_in=len(clean)) as st:
+        write_dataset(clean, TABLE_NAME)
+        # Marginales del drill-down para el backend DuckDB (en SQLite las calcula load_islands)
+        write_dataset(island_marginals(clean), ISLANDS_MARGINALS_DATASET)
+        if wide is not None:
+            write_dataset(wide, WIDE_TABLE_NAME)
+        st.rows_out = len(clean)
+    print("✔ Parquet limpio guardado en:", dataset_dir(TABLE_NAME))
+    if wide is not None:
+        print("✔ Parquet ancho (todas las medidas) en:", dataset_dir(WIDE_TABLE_NAME))
+
+    # === 5. Volcar a SQLite (db.sqlite3 de Django) en esquema en estrella ===
+    # Hechos con claves enteras (periodo, isla, residencia) + dimensiones;
+    # la tabla antigua queda como vista con las mismas columnas.
     print("Conectando a SQLite:", DB_PATH)
     conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    create_sql = f"""
-    CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        year INTEGER NOT NULL,
-        month INTEGER NOT NULL,
-        date TEXT NOT NULL,
-        residence TEXT NOT NULL,
-        island TEXT NOT NULL,
-        tourists REAL
-    );
-    """
-
-    print("Creando tabla (si no existe):", TABLE_NAME)
-    cur.execute(create_sql)
-
-    # Opcional: borramos todo para recargar limpio
-    print("Borrando datos previos (si los hay)...")
-    cur.execute(f"DELETE FROM {TABLE_NAME};")
-
-    insert_sql = f"""
-    INSERT INTO {TABLE_NAME} (year, month, date, residence, island, tourists)
-    VALUES (?, ?, ?, ?, ?, ?);
-    """
-
-    records = [
-        (
-            int(row["year"]),
-            int(row["month"]),
-            row["date"],
-            row["residence"],
-            row["island"],
-            float(row["tourists"]),
-        )
-        for _, row in clean.iterrows()
-    ]
 
-    print(f"Insertando {len(records)} filas en {TABLE_NAME}...")
-    cur.executemany(insert_sql, records)
-    conn.commit()
+    print(f"Cargando {len(clean)} filas en {FACT_TABLE} (+ dimensiones)...")
+    with trace.stage("load", rows_in=len(clean)) as st:
+        n_facts = load_islands(conn, clean)
+        if wide is not None:
+            n_wide = load_wide(conn, ISLANDS_WIDE_FACT, wide, ["island", "residence"])
+        conn.commit()
+        st.rows_out = n_facts
     conn.close()
+    if wide is not None:
+        print(f"✔ {n_wide} filas en la tabla ancha {ISLANDS_WIDE_FACT}")
+    print(f"✔ {n_facts} filas de hechos; vista '{TABLE_NAME}' disponible")
+
+    # === 6. Instantánea de KPIs (solo se guardan los periodos que cambian) ===
+    with trace.stage("snapshot", rows_in=len(clean)):
+        record_snapshot(TABLE_NAME, clean, ["island", "residence"])
+
+    # === 7. Warm-up de la caché del dashboard y publicación de la nueva versión ===
+    with trace.stage("post_load"):
+        run_post_load_hooks()
 
+    trace.finish()
     print("✔ ETL completado para", TABLE_NAME)
 
 
@@ -0,0 +1,355 @@
+"""
+Instantáneas de KPIs por ejecución de ETL, con deduplicación por contenido.
+
+Cada recarga de las tablas mensuales sustituye los datos anteriores y el ISTAC
+revisa los meses recientes: sin guardar lo que había no se puede saber cuánto
+movió una revisión los KPIs del último trimestre. Cada ETL llama a
+record_snapshot() tras la carga y se guarda:
+
+- un blob por periodo (YYYY-MM) con el total y los totales por dimensión
+  (residencia, isla...), en JSON canónico y nombrado por su sha256;
+- un blob con los KPIs agregados (total, por año, últimos 12 meses);
+- un manifiesto por ejecución que solo lista los periodos cuyo hash cambió
+  frente a la ejecución anterior (más los eliminados).
+
+Un periodo sin cambios no escribe nada: su blob ya existe y no aparece en el
+manifiesto. El espacio crece con el tamaño de las revisiones, no con el número
+de ejecuciones. Cada CHECKPOINT_EVERY ejecuciones el manifiesto es completo,
+para que reconstruir una ejecución no recorra una cadena sin fin.
+
+Estructura en disco:
+
+    data/snapshots/<dataset>/
+        blobs/ab/ab12....json
+        manifests/20250101-120000-000123.json
+
+diff_runs() compara dos ejecuciones por hash y solo abre los blobs de los
+periodos que difieren.
+
+Uso como script:
+    python etl/kpi_snapshots.py frontur_canarias_monthly            # últimas dos
+    python etl/kpi_snapshots.py frontur_canarias_monthly <run> <run>
+"""
+
+import hashlib
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# === RUTAS BASE ===
+BASE_DIR = Path(__file__).resolve().parents[1]
+SNAPSHOTS_DIR = BASE_DIR / "data" / "snapshots"
+
+# Cada cuántas ejecuciones se escribe un manifiesto completo
+CHECKPOINT_EVERY = 50
+
+# Decimales con los que se guardan los valores (evita hashes distintos por ruido de float)
+VALUE_DECIMALS = 4
+
+
+def _canonical(payload):
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _round(value):
+    return round(float(value), VALUE_DECIMALS)
+
+
+class SnapshotStore:
+    def __init__(self, dataset, root=SNAPSHOTS_DIR):
+        self.dataset = dataset
+        self.root = Path(root) / dataset
+        self.blobs_dir = self.root / "blobs"
+        self.manifests_dir = self.root / "manifests"
+
+    # --- blobs ---
+
+    def _blob_path(self, digest):
+        return self.blobs_dir / digest[:2] / f"{digest}.json"
+
+    def put_blob(self, payload):
+        """Guarda el blob si no existe; devuelve (hash, escrito)."""
+        data = _canonical(payload)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if path.exists():
+            return digest, False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+        return digest, True
+
+    def get_blob(self, digest):
+        return json.loads(self._blob_path(digest).read_text(encoding="utf-8"))
+
+    # --- manifiestos ---
+
+    def run_ids(self):
+        """Ejecuciones guardadas, de la más antigua a la más reciente."""
+        if not self.manifests_dir.exists():
+            return []
+        return sorted(p.stem for p in self.manifests_dir.glob("*.json"))
+
+    def manifest(self, run_id):
+        return json.loads((self.manifests_dir / f"{run_id}.json").read_text(encoding="utf-8"))
+
+    def resolve(self, run_id):
+        """Manifiesto de una ejecución con el mapa completo periodo → hash."""
+        chain = []
+        current = self.manifest(run_id)
+        while True:
+            chain.append(current)
+            if current["full"] or current["parent"] is None:
+                break
+            current = self.manifest(current["parent"])
+
+        periods = {}
+        for manifest in reversed(chain):
+            if manifest["full"]:
+                periods = dict(manifest["periods"])
+            else:
+                periods.update(manifest["periods"])
+                for period in manifest["removed"]:
+                    periods.pop(period, None)
+
+        resolved = dict(chain[0])
+        resolved["periods"] = periods
+        return resolved
+
+    def write_manifest(self, manifest):
+        self.manifests_dir.mkdir(parents=True, exist_ok=True)
+        path = self.manifests_dir / f"{manifest['run_id']}.json"
+        path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        return path
+
+
+def period_payloads(df, dims, value_col="tourists"):
+    """
+    {periodo 'YYYY-MM': {"total", "by": {dim: {valor: total}}, "cells"}} a
+    partir de un DataFrame limpio (year, month, *dims, value_col).
+    "cells" (combinaciones de todas las dimensiones) solo con más de una dimensión.
+    """
+    df = df[["year", "month", *dims, value_col]].dropna(subset=[value_col])
+    period_codes = df["year"].to_numpy(dtype=np.int64) * 100 + df["month"].to_numpy(dtype=np.int64)
+    df = df.assign(period=period_codes)
+
+    payloads = {
+        int(code): {"total": 0.0, "by": {dim: {} for dim in dims}}
+        for code in np.unique(period_codes)
+    }
+    totals = df.groupby("period", sort=False)[value_col].sum()
+    for code, total in totals.items():
+        payloads[code]["total"] = _round(total)
+
+    for dim in dims:
+        grouped = df.groupby(["period", dim], sort=False, observed=True)[value_col].sum()
+        for (code, key), value in grouped.items():
+            payloads[code]["by"][dim][str(key)] = _round(value)
+
+    if len(dims) > 1:
+        for payload in payloads.values():
+            payload["cells"] = {}
+        grouped = df.groupby(["period", *dims], sort=False, observed=True)[value_col].sum()
+        for (code, *keys), value in grouped.items():
+            payloads[code]["cells"]["|".join(map(str, keys))] = _round(value)
+
+    return {f"{code // 100:04d}-{code % 100:02d}": payload for code, payload in payloads.items()}
+
+
+def aggregate_kpis(payloads):
+    """KPIs agregados a partir de los totales por periodo."""
+    periods = sorted(payloads)
+    if not periods:
+        return {"periods": 0}
+    totals = [payloads[p]["total"] for p in periods]
+
+    by_year = {}
+    for period, total in zip(periods, totals):
+        year = period[:4]
+        by_year[year] = _round(by_year.get(year, 0.0) + total)
+
+    last_12 = sum(totals[-12:])
+    prev_12 = sum(totals[-24:-12]) if len(totals) >= 24 else None
+    return {
+        "periods": len(periods),
+        "first_period": periods[0],
+        "last_period": periods[-1],
+        "total": _round(sum(totals)),
+        "by_year": by_year,
+        "last_12m": _round(last_12),
+        "prev_12m": _round(prev_12) if prev_12 is not None else None,
+        "yoy_12m_pct": _round((last_12 - prev_12) / prev_12 * 100) if prev_12 else None,
+    }
+
+
+def record_snapshot(dataset, df, dims, value_col="tourists", root=SNAPSHOTS_DIR):
+    """
+    Guarda la instantánea de una ejecución y devuelve su manifiesto (con
+    "stats": periodos cambiados/eliminados y blobs nuevos escritos).
+    """
+    store = SnapshotStore(dataset, root)
+    payloads = period_payloads(df, dims, value_col)
+
+    run_ids = store.run_ids()
+    previous = store.resolve(run_ids[-1]) if run_ids else None
+    previous_periods = previous["periods"] if previous else {}
+
+    blobs_written = 0
+    hashes = {}
+    for period in sorted(payloads):
+        digest, written = store.put_blob(payloads[period])
+        hashes[period] = digest
+        blobs_written += written
+    kpis_hash, written = store.put_blob(aggregate_kpis(payloads))
+    blobs_written += written
+
+    changed = {p: h for p, h in hashes.items() if previous_periods.get(p) != h}
+    removed = sorted(set(previous_periods) - set(hashes))
+
+    # Ejecuciones desde el último manifiesto completo
+    depth = 0 if previous is None else previous.get("depth", 0) + 1
+    full = previous is None or depth >= CHECKPOINT_EVERY
+    if full:
+        depth = 0
+
+    run_id = time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() // 1000 % 1_000_000:06d}"
+    if run_ids and run_id <= run_ids[-1]:
+        # Misma marca de tiempo que la anterior (relojes gruesos): mantener el orden
+        run_id = run_ids[-1] + "-1"
+    manifest = {
+        "run_id": run_id,
+        "dataset": dataset,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parent": run_ids[-1] if run_ids else None,
+        "full": full,
+        "depth": depth,
+        "dims": list(dims),
+        "kpis": kpis_hash,
+        "periods": hashes if full else changed,
+        "removed": [] if full else removed,
+        "stats": {
+            "periods": len(hashes),
+            "changed": len(changed),
+            "removed": len(removed),
+            "blobs_written": blobs_written,
+        },
+    }
+    path = store.write_manifest(manifest)
+
+    print(
+        f"[SNAPSHOT] {dataset}: {len(changed)} periodos cambiados, {len(removed)} eliminados, "
+        f"{blobs_written} blobs nuevos · {path.name}"
+    )
+    return manifest
+
+
+def _delta(before, after):
+    if before is None or after is None:
+        return None
+    return _round(after - before)
+
+
+def _diff_maps(before, after):
+    """Claves con valor distinto entre dos dicts {clave: número}."""
+    changes = {}
+    for key in sorted(set(before) | set(after)):
+        b, a = before.get(key), after.get(key)
+        if b != a:
+            changes[key] = {"before": b, "after": a, "delta": _delta(b, a)}
+    return changes
+
+
+def diff_runs(dataset, run_a, run_b, root=SNAPSHOTS_DIR):
+    """
+    Cambios de run_a a run_b: KPIs agregados y periodos añadidos, eliminados o
+    revisados (con el detalle por dimensión). Los periodos con el mismo hash
+    no se leen.
+    """
+    store = SnapshotStore(dataset, root)
+    a, b = store.resolve(run_a), store.resolve(run_b)
+    periods_a, periods_b = a["periods"], b["periods"]
+
+    kpis_a = store.get_blob(a["kpis"])
+    kpis_b = kpis_a if a["kpis"] == b["kpis"] else store.get_blob(b["kpis"])
+    kpi_changes = {}
+    for key in sorted(set(kpis_a) | set(kpis_b)):
+        before, after = kpis_a.get(key), kpis_b.get(key)
+        if before == after:
+            continue
+        if isinstance(before, dict) or isinstance(after, dict):
+            kpi_changes[key] = _diff_maps(before or {}, after or {})
+        else:
+            numeric = all(isinstance(v, (int, float)) for v in (before, after))
+            kpi_changes[key] = {
+                "before": before,
+                "after": after,
+                "delta": _delta(before, after) if numeric else None,
+            }
+
+    revised = []
+    for period in sorted(set(periods_a) & set(periods_b)):
+        if periods_a[period] == periods_b[period]:
+            continue
+        before, after = store.get_blob(periods_a[period]), store.get_blob(periods_b[period])
+        revised.append({
+            "period": period,
+            "before": before["total"],
+            "after": after["total"],
+            "delta": _delta(before["total"], after["total"]),
+            "by": {
+                dim: _diff_maps(before["by"].get(dim, {}), after["by"].get(dim, {}))
+                for dim in sorted(set(before["by"]) | set(after["by"]))
+            },
+        })
+
+    return {
+        "dataset": dataset,
+        "from_run": run_a,
+        "to_run": run_b,
+        "kpis": kpi_changes,
+        "added": sorted(set(periods_b) - set(periods_a)),
+        "removed": sorted(set(periods_a) - set(periods_b)),
+        "revised": revised,
+    }
+
+
+def main():
+    if len(sys.argv) not in (2, 4):
+        print("Uso: python etl/kpi_snapshots.py <dataset> [<run_a> <run_b>]")
+        sys.exit(2)
+
+    dataset = sys.argv[1]
+    if len(sys.argv) == 4:
+        run_a, run_b = sys.argv[2:]
+    else:
+        run_ids = SnapshotStore(dataset).run_ids()
+        if len(run_ids) < 2:
+            print(f"[INFO] Hacen falta al menos dos instantáneas de {dataset}")
+            return
+        run_a, run_b = run_ids[-2:]
+
+    diff = diff_runs(dataset, run_a, run_b)
+    print(f"=== {dataset}: {run_a} → {run_b} ===")
+    for key, change in diff["kpis"].items():
+        if "before" in change:
+            print(f"  KPI {key}: {change['before']} → {change['after']}")
+        else:
+            for sub, c in change.items():
+                print(f"  KPI {key}[{sub}]: {c['before']} → {c['after']}")
+    if diff["added"]:
+        print(f"  Periodos nuevos: {', '.join(diff['added'])}")
+    if diff["removed"]:
+        print(f"  Periodos eliminados: {', '.join(diff['removed'])}")
+    for r in diff["revised"]:
+        print(f"  Revisado {r['period']}: {r['before']:,.0f} → {r['after']:,.0f} ({r['delta']:+,.0f})")
+    if not (diff["kpis"] or diff["added"] or diff["removed"] or diff["revised"]):
+        print("  Sin cambios.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Parseo compartido de las ETL: periodos, números y etiquetas de dimensiones.
+
+Los cubos del ISTAC repiten los mismos valores en cada fila: unos cientos de
+periodos, unas decenas de residencias e islas, miles de filas por valor. Aquí
+cada valor DISTINTO se parsea una sola vez (pd.factorize → códigos + únicos) y
+el resultado se propaga a todas las filas indexando con los códigos, así el
+coste depende del número de valores distintos y no del de filas.
+
+Las lecturas por bloques pueden pasar un DecodeCache para no volver a parsear
+en cada bloque los valores ya vistos en los anteriores.
+
+Mismo comportamiento que el código que sustituye en las ETL:
+- parse_time_period: "10/2025" -> year=2025, month=10 (ValueError si no encaja)
+- parse_locale_number: "1.370.188" -> 1370188.0, "12,5" -> 12.5, texto -> NaN;
+  "9.5" -> 9.5 (el punto solo es de miles en grupos de tres: \d{1,3}(\.\d{3})+)
+- decode_labels: str(valor), opcionalmente sin espacios en los extremos
+- normalize_column_name: minúsculas, "_" por espacios y sin tildes (á é í ó ú)
+"""
+
+import functools
+
+import numpy as np
+import pandas as pd
+
+TIME_PERIOD_PATTERN = r"(?P<month>\d{1,2})/(?P<year>\d{4})"
+# "1.370.188": puntos de miles; "9.5" o "1234.56" llevan punto decimal
+THOUSANDS_PATTERN = r"[-+]?\d{1,3}(?:\.\d{3})+"
+
+_ACCENTS = str.maketrans({"á": "a", "é": "e", "í": "i", "ó": "o", "ú": "u"})
+
+
+class DecodeCache:
+    """Valor crudo -> valor decodificado, compartido entre bloques de una lectura."""
+
+    def __init__(self):
+        self.values = {}
+
+    @staticmethod
+    def key(value):
+        # NaN != NaN: todos los ausentes comparten clave
+        return None if pd.isna(value) else value
+
+
+def decode_distinct(values, decode, cache=None, dtype=object):
+    """
+    Aplica `decode` (función vectorizada: Series de únicos -> array del mismo
+    largo) a cada valor distinto de `values` y devuelve un ndarray por fila.
+    """
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+    uniques = pd.Series(uniques, dtype=object)
+
+    if cache is None:
+        decoded = np.asarray(decode(uniques), dtype=dtype)
+    else:
+        keys = [cache.key(u) for u in uniques]
+        missing = [i for i, k in enumerate(keys) if k not in cache.values]
+        if missing:
+            fresh = np.asarray(decode(uniques.iloc[missing].reset_index(drop=True)), dtype=dtype)
+            for i, value in zip(missing, fresh):
+                cache.values[keys[i]] = value
+        decoded = np.array([cache.values[k] for k in keys], dtype=dtype)
+
+    return decoded[codes]
+
+
+def _decode_periods(uniques):
+    parts = uniques.astype(str).str.extract(TIME_PERIOD_PATTERN)
+    bad = parts["month"].isna() | parts["year"].isna()
+    if bad.any():
+        raise ValueError(f"TIME_PERIOD no reconocido: {uniques[bad].iloc[0]!r}")
+    # año y mes empaquetados en un entero (AAAAMM) para propagarlos con un solo índice
+    return parts["year"].astype(int).to_numpy() * 100 + parts["month"].astype(int).to_numpy()
+
+
+def parse_time_period(periods: pd.Series, cache=None) -> pd.DataFrame:
+    """'10/2025' -> year=2025, month=10 (parseando una vez cada periodo distinto)."""
+    packed = decode_distinct(periods, _decode_periods, cache, dtype=np.int64)
+    return pd.DataFrame({"year": packed // 100, "month": packed % 100}, index=periods.index)
+
+
+def _decode_numbers(uniques):
+    text = uniques.astype(str).str.strip()
+    # Con coma decimal los puntos son de miles; sin coma, solo si forman grupos de tres
+    dotted_thousands = text.str.contains(",", regex=False) | text.str.fullmatch(THOUSANDS_PATTERN)
+    text = text.where(~dotted_thousands, text.str.replace(".", "", regex=False))
+    return pd.to_numeric(text.str.replace(",", ".", regex=False), errors="coerce")
+
+
+def parse_locale_number(values: pd.Series, cache=None) -> pd.Series:
+    """
+    Números con '.' de miles y ',' decimal ("1.370.188", "12,5") a float;
+    un punto que no separa grupos de tres cifras es decimal ("9.5",
+    "1234.56"). Lo que no es número queda NaN.
+    """
+    return pd.Series(
+        decode_distinct(values, _decode_numbers, cache, dtype=np.float64),
+        index=values.index,
+    )
+
+
+def decode_labels(values: pd.Series, strip=True, categorical=False, cache=None) -> pd.Series:
+    """
+    Etiquetas de una dimensión como texto (str(valor), sin espacios en los
+    extremos con strip=True). categorical=True devuelve un Categorical.
+    """
+    def decode(uniques):
+        labels = uniques.astype(str)
+        return labels.str.strip() if strip else labels
+
+    labels = pd.Series(decode_distinct(values, decode, cache), index=values.index, dtype=object)
+    return labels.astype("category") if categorical else labels
+
+
+@functools.lru_cache(maxsize=None)
+def normalize_column_name(name) -> str:
+    """'Gasto Medio (€)' -> 'gasto_medio_(€)'; 'Duración' -> 'duracion'."""
+    return str(name).strip().lower().replace(" ", "_").translate(_ACCENTS)
+
+
+def normalize_columns(columns) -> list:
+    return [normalize_column_name(c) for c in columns]
@@ -0,0 +1,59 @@
+"""
+Hooks que se ejecutan al terminar una carga de las ETL en db.sqlite3.
+
+Primero puntúa todas las series en busca de anomalías (manage.py
+detect_anomalies, tabla series_anomalies) y después lanza el warm-up del
+dashboard (manage.py warm_dashboard_cache): precalcula las combinaciones de
+filtros más usadas para la nueva versión de datos y solo entonces la
+publica, así los workers no recalculan todos a la vez.
+
+Si el warm-up falla, se publica igualmente una versión nueva (manage.py
+publish_data_version): sin ella el dashboard seguiría sirviendo la caché de
+los datos anteriores hasta que caducara.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+# === RUTAS BASE ===
+BASE_DIR = Path(__file__).resolve().parents[1]
+DJANGO_DIR = BASE_DIR / "django_app"
+
+# En orden: el warm-up ya debe ver las anomalías nuevas
+POST_LOAD_COMMANDS = [
+    ["detect_anomalies"],
+    ["warm_dashboard_cache"],
+]
+
+WARMUP_COMMAND = ["warm_dashboard_cache"]
+PUBLISH_COMMAND = ["publish_data_version"]
+
+
+def _run_manage(command) -> bool:
+    """Ejecuta manage.py <command>; avisa si falla y devuelve si terminó bien."""
+    print(f"[POST-CARGA] manage.py {' '.join(command)}")
+    result = subprocess.run(
+        [sys.executable, "manage.py", *command],
+        cwd=DJANGO_DIR,
+    )
+    if result.returncode != 0:
+        print(f"[AVISO] 'manage.py {' '.join(command)}' terminó con código {result.returncode}")
+    return result.returncode == 0
+
+
+def publish_new_data_version() -> bool:
+    """Publica una versión de datos nueva sin warm-up (la caché anterior deja de servirse)."""
+    return _run_manage(PUBLISH_COMMAND)
+
+
+def run_post_load_hooks():
+    """
+    Ejecuta los comandos de post-carga. Un fallo se avisa pero no rompe la
+    ETL: los datos ya están cargados y el dashboard los calculará bajo demanda.
+    Si el warm-up no llega a publicar la versión nueva, se publica aparte.
+    """
+    for command in POST_LOAD_COMMANDS:
+        ok = _run_manage(command)
+        if not ok and command == WARMUP_COMMAND:
+            publish_new_data_version()
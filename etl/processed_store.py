@@ -0,0 +1,274 @@
+"""
+Almacén procesado en Parquet, particionado por dataset y año.
+
+Sustituye a los CSV de data/processed. Estructura en disco:
+
+    data/processed/parquet/
+        dataset=frontur_canarias_monthly/
+            year=2019/part-0.parquet
+            year=2020/part-0.parquet
+            ...
+
+- Columnas tipadas (enteros pequeños, categorías diccionario, float64)
+  y comprimidas con zstd. Las etiquetas (residence, island) se guardan sin
+  espacios en los extremos, igual que en las dimensiones de SQLite
+  (star_schema.encode_labels).
+- Escritura en streaming: DatasetWriter acepta trozos (chunks) y mantiene
+  abierto un ParquetWriter por año, así la memoria depende del chunk y no
+  del dataset completo.
+- island_marginals(): marginales del drill-down isla × residencia para el
+  backend DuckDB, igual que agg_islands_marginals en SQLite.
+- Lectura con poda de particiones: read_dataset(year_from, year_to, columns)
+  solo abre los directorios year=... del rango pedido y solo las columnas
+  pedidas.
+"""
+
+import shutil
+import uuid
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# === RUTAS BASE ===
+BASE_DIR = Path(__file__).resolve().parents[1]
+PARQUET_DIR = BASE_DIR / "data" / "processed" / "parquet"
+
+PARTITION_COL = "year"
+COMPRESSION = "zstd"
+
+# Tipos compactos para las columnas conocidas de los datasets FRONTUR
+COLUMN_DTYPES = {
+    "year": "int16",
+    "month": "int8",
+    "residence": "category",
+    "island": "category",
+    "tourists": "float64",
+}
+
+# Etiquetas de dimensión: se normalizan igual que en star_schema.encode_labels
+LABEL_COLUMNS = ("residence", "island")
+
+# Marginales residencia × isla × periodo; ALL_LABEL = "todas" en la dimensión agregada
+ISLANDS_MARGINALS_DATASET = "agg_islands_marginals"
+ALL_LABEL = ""
+
+
+def dataset_dir(dataset: str, root: Path = PARQUET_DIR) -> Path:
+    return Path(root) / f"dataset={dataset}"
+
+
+def _partition_dir(dataset: str, year: int, root: Path = PARQUET_DIR) -> Path:
+    return dataset_dir(dataset, root) / f"{PARTITION_COL}={int(year)}"
+
+
+def _typed(df: pd.DataFrame) -> pd.DataFrame:
+    """Normaliza las etiquetas y aplica los tipos compactos a las columnas conocidas."""
+    df = df.copy()
+    for col in LABEL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("string").str.strip()
+    for col, dtype in COLUMN_DTYPES.items():
+        if col in df.columns and col != PARTITION_COL:
+            df[col] = df[col].astype(dtype)
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].astype("string")
+    return df
+
+
+def _stable_schema(schema: pa.Schema) -> pa.Schema:
+    """
+    Fija el ancho de los índices de diccionario (int32): pandas usa int8/int16
+    según el número de categorías del chunk y todos los chunks deben compartir
+    el esquema del primero.
+    """
+    fields = []
+    for field in schema.remove_metadata():
+        if pa.types.is_dictionary(field.type):
+            field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+        fields.append(field)
+    return pa.schema(fields)
+
+
+class DatasetWriter:
+    """
+    Escritor en streaming de un dataset particionado por año.
+
+    Uso:
+        with DatasetWriter("frontur_canarias_monthly") as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+
+    Los ficheros se escriben primero en un directorio temporal y, al cerrar,
+    cada partición escrita sustituye a la anterior de forma atómica (rename).
+    Con replace=True (recarga completa) se eliminan además los años que ya no
+    aparecen; con replace=False (backfill) los años no tocados se conservan.
+    """
+
+    def __init__(self, dataset: str, replace: bool = True, root: Path = PARQUET_DIR):
+        self.dataset = dataset
+        self.replace = replace
+        self.root = Path(root)
+        self.rows_written = 0
+        self._writers = {}
+        self._schema = None
+        self._tmp_dir = dataset_dir(dataset, self.root).with_name(
+            f".tmp-{dataset}-{uuid.uuid4().hex[:8]}"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    @property
+    def years(self):
+        return sorted(self._writers)
+
+    def write(self, df: pd.DataFrame):
+        """Añade un chunk. Debe incluir la columna de partición (year)."""
+        if df.empty:
+            return
+        if PARTITION_COL not in df.columns:
+            raise ValueError(f"El chunk no tiene columna '{PARTITION_COL}' para particionar.")
+
+        typed = _typed(df)
+        for year, part in typed.groupby(PARTITION_COL, sort=True):
+            table = pa.Table.from_pandas(
+                part.drop(columns=[PARTITION_COL]), preserve_index=False
+            )
+            if self._schema is None:
+                self._schema = _stable_schema(table.schema)
+            table = table.cast(self._schema)
+
+            writer = self._writers.get(int(year))
+            if writer is None:
+                path = self._tmp_dir / f"{PARTITION_COL}={int(year)}" / "part-0.parquet"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                writer = pq.ParquetWriter(path, self._schema, compression=COMPRESSION)
+                self._writers[int(year)] = writer
+            writer.write_table(table)
+            self.rows_written += table.num_rows
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+
+        target = dataset_dir(self.dataset, self.root)
+        target.mkdir(parents=True, exist_ok=True)
+
+        if self.replace:
+            for old in target.glob(f"{PARTITION_COL}=*"):
+                if int(old.name.split("=", 1)[1]) not in self._writers:
+                    shutil.rmtree(old)
+
+        for year in self._writers:
+            new_part = self._tmp_dir / f"{PARTITION_COL}={year}"
+            final_part = _partition_dir(self.dataset, year, self.root)
+            if final_part.exists():
+                old_part = final_part.with_name(f".old-{final_part.name}-{uuid.uuid4().hex[:8]}")
+                final_part.rename(old_part)
+                new_part.rename(final_part)
+                shutil.rmtree(old_part)
+            else:
+                new_part.rename(final_part)
+
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        self._writers = {}
+
+    def abort(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+
+def write_dataset(df: pd.DataFrame, dataset: str, replace: bool = True,
+                  root: Path = PARQUET_DIR, chunk_rows: int = 100_000) -> Path:
+    """
+    Escribe un DataFrame completo como dataset particionado por año.
+    Devuelve el directorio del dataset.
+    """
+    with DatasetWriter(dataset, replace=replace, root=root) as writer:
+        for start in range(0, len(df), chunk_rows):
+            writer.write(df.iloc[start:start + chunk_rows])
+    return dataset_dir(dataset, root)
+
+
+def island_marginals(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    (year, month, residence, island, tourists) -> las filas por residencia e
+    isla más los totales (residencia, todas), (todas, isla) y (todas, todas)
+    de cada periodo. Con ellas el drill-down filtra filas y no reagrupa.
+    """
+    period = ["year", "month"]
+    labels = {col: df[col].astype(str).str.strip() for col in LABEL_COLUMNS}
+    facts = (
+        df.assign(**labels)
+        .groupby([*period, "residence", "island"], as_index=False, sort=True)["tourists"].sum()
+    )
+    by_residence = facts.groupby([*period, "residence"], as_index=False)["tourists"].sum()
+    by_island = facts.groupby([*period, "island"], as_index=False)["tourists"].sum()
+    by_period = facts.groupby(period, as_index=False)["tourists"].sum()
+    return pd.concat(
+        [
+            facts,
+            by_residence.assign(island=ALL_LABEL),
+            by_island.assign(residence=ALL_LABEL),
+            by_period.assign(residence=ALL_LABEL, island=ALL_LABEL),
+        ],
+        ignore_index=True,
+    )[[*period, "residence", "island", "tourists"]]
+
+
+def list_years(dataset: str, root: Path = PARQUET_DIR):
+    """Años disponibles en un dataset (sin abrir ningún fichero)."""
+    base = dataset_dir(dataset, root)
+    if not base.exists():
+        return []
+    return sorted(
+        int(p.name.split("=", 1)[1])
+        for p in base.glob(f"{PARTITION_COL}=*")
+        if p.is_dir()
+    )
+
+
+def read_dataset(dataset: str, year_from: int = None, year_to: int = None,
+                 columns=None, root: Path = PARQUET_DIR) -> pd.DataFrame:
+    """
+    Lee un dataset podando particiones por rango de años y columnas.
+    - year_from / year_to: límites inclusivos (None = sin límite)
+    - columns: lista de columnas a leer (None = todas); 'year' se añade
+      siempre desde el nombre de la partición.
+    """
+    years = [
+        y for y in list_years(dataset, root)
+        if (year_from is None or y >= year_from) and (year_to is None or y <= year_to)
+    ]
+
+    file_columns = None
+    if columns is not None:
+        file_columns = [c for c in columns if c != PARTITION_COL]
+
+    frames = []
+    for year in years:
+        for path in sorted(_partition_dir(dataset, year, root).glob("*.parquet")):
+            df = pq.read_table(path, columns=file_columns).to_pandas()
+            df.insert(0, PARTITION_COL, pd.Series([year] * len(df), dtype="int16"))
+            frames.append(df)
+
+    if not frames:
+        cols = list(columns) if columns is not None else [PARTITION_COL]
+        return pd.DataFrame(columns=cols)
+
+    out = pd.concat(frames, ignore_index=True)
+    if columns is not None:
+        out = out[list(columns)]
+    return out
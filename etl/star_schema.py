@@ -0,0 +1,476 @@
+"""
+Esquema en estrella de FRONTUR en SQLite.
+
+Dimensiones (claves enteras estables entre cargas):
+- dim_residence(residence_id, residence)
+- dim_island(island_id, island)
+- dim_period(period_id, year, month, date)   con period_id = year * 100 + month
+
+Hechos (solo claves enteras + medida numérica, tablas WITHOUT ROWID
+ordenadas por periodo):
+- fact_canarias_monthly(period_id, residence_id, tourists)
+- fact_canarias_islands_monthly(period_id, island_id, residence_id, tourists)
+
+Hechos anchos (ETL con --all-measures, ver wide_ingest.py): mismas claves y
+una columna REAL por medida (turistas, gasto_total, estancia_media...):
+- fact_canarias_monthly_wide(period_id, residence_id, <medidas>)
+- fact_canarias_islands_monthly_wide(period_id, island_id, residence_id, <medidas>)
+
+Marginales precalculadas para el drill-down isla × residencia del dashboard
+(se recalculan en cada carga de islas, ver refresh_island_marginals):
+- agg_islands_marginals(residence_id, island_id, period_id, tourists)
+  con las filas de hechos más los totales con id 0 = "todas":
+  (residencia, 0, periodo), (0, isla, periodo) y (0, 0, periodo).
+  Cualquier combinación de filtros (residencia, isla, rango de periodos) es
+  un rango del índice sin reagrupar la tabla de hechos.
+
+Registro de cambios para el feed incremental (/download/delta/):
+- row_changes(seq, fact_table, period_id, island_id, residence_id, op, tourists, changed_at)
+  Las cargas de fact_canarias_monthly / fact_canarias_islands_monthly ya no
+  vacían la tabla: comparan con los hechos actuales, aplican solo las filas
+  insertadas, modificadas o eliminadas y apuntan cada una aquí. seq
+  (AUTOINCREMENT, nunca se reutiliza) es la marca de agua de los clientes;
+  island_id = 0 en la tabla mensual.
+- row_changes_floor(fact_table, floor_seq): el registro solo guarda los
+  cambios con seq > floor_seq. Se poda lo anterior a CHANGE_LOG_RETENTION_DAYS
+  (compact_change_log) y una carga sobre la tabla vacía (primera carga,
+  migración) no apunta fila a fila: solo sube el suelo. Un cliente con una
+  marca por debajo del suelo recibe el snapshot completo.
+
+Las tablas antiguas frontur_canarias_monthly y frontur_canarias_islands_monthly
+pasan a ser VIEWs sobre la estrella, así Power BI, /download/ y cualquier SQL
+existente siguen funcionando con las mismas columnas.
+
+Las funciones reciben una conexión sqlite3 y NO hacen commit: la ETL
+decide la transacción.
+
+Uso como script (migra una BD existente con las tablas antiguas):
+    python etl/star_schema.py
+"""
+
+import sqlite3
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from post_load import publish_new_data_version
+
+# === RUTAS BASE ===
+BASE_DIR = Path(__file__).resolve().parents[1]
+DB_PATH = BASE_DIR / "db.sqlite3"
+
+MONTHLY_FACT = "fact_canarias_monthly"
+ISLANDS_FACT = "fact_canarias_islands_monthly"
+MONTHLY_WIDE_FACT = "fact_canarias_monthly_wide"
+ISLANDS_WIDE_FACT = "fact_canarias_islands_monthly_wide"
+ISLANDS_MARGINALS = "agg_islands_marginals"
+CHANGE_LOG = "row_changes"
+CHANGE_LOG_FLOOR = "row_changes_floor"
+
+# Los clientes que no refrescan en este plazo reciben el snapshot completo
+CHANGE_LOG_RETENTION_DAYS = 90
+
+# Clave de las filas de total ("todas las islas" / "todas las residencias")
+ALL_ID = 0
+
+# Columna de etiqueta -> (tabla de dimensión, clave entera)
+LABEL_DIMENSIONS = {
+    "island": ("dim_island", "island_id"),
+    "residence": ("dim_residence", "residence_id"),
+}
+
+# Nombres antiguos, ahora vistas sobre la estrella
+MONTHLY_VIEW = "frontur_canarias_monthly"
+ISLANDS_VIEW = "frontur_canarias_islands_monthly"
+
+SCHEMA_SQL = f"""
+CREATE TABLE IF NOT EXISTS dim_residence (
+    residence_id INTEGER PRIMARY KEY,
+    residence TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS dim_island (
+    island_id INTEGER PRIMARY KEY,
+    island TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS dim_period (
+    period_id INTEGER PRIMARY KEY,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    date TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS {MONTHLY_FACT} (
+    period_id INTEGER NOT NULL,
+    residence_id INTEGER NOT NULL,
+    tourists REAL NOT NULL,
+    PRIMARY KEY (period_id, residence_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS ix_{MONTHLY_FACT}_residence
+    ON {MONTHLY_FACT} (residence_id, period_id);
+
+CREATE TABLE IF NOT EXISTS {ISLANDS_FACT} (
+    period_id INTEGER NOT NULL,
+    island_id INTEGER NOT NULL,
+    residence_id INTEGER NOT NULL,
+    tourists REAL NOT NULL,
+    PRIMARY KEY (period_id, island_id, residence_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS ix_{ISLANDS_FACT}_residence
+    ON {ISLANDS_FACT} (residence_id, period_id);
+
+CREATE TABLE IF NOT EXISTS {ISLANDS_MARGINALS} (
+    residence_id INTEGER NOT NULL,
+    island_id INTEGER NOT NULL,
+    period_id INTEGER NOT NULL,
+    tourists REAL NOT NULL,
+    PRIMARY KEY (residence_id, island_id, period_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS ix_{ISLANDS_MARGINALS}_island
+    ON {ISLANDS_MARGINALS} (island_id, residence_id, period_id);
+
+CREATE TABLE IF NOT EXISTS {CHANGE_LOG} (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    fact_table TEXT NOT NULL,
+    period_id INTEGER NOT NULL,
+    island_id INTEGER NOT NULL,
+    residence_id INTEGER NOT NULL,
+    op TEXT NOT NULL,
+    tourists REAL,
+    changed_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_{CHANGE_LOG}_table
+    ON {CHANGE_LOG} (fact_table, seq);
+
+CREATE TABLE IF NOT EXISTS {CHANGE_LOG_FLOOR} (
+    fact_table TEXT PRIMARY KEY,
+    floor_seq INTEGER NOT NULL
+);
+"""
+
+LEGACY_VIEWS = {
+    MONTHLY_VIEW: f"""
+        CREATE VIEW {MONTHLY_VIEW} AS
+        SELECT p.year, p.month, r.residence, f.tourists
+        FROM {MONTHLY_FACT} f
+        JOIN dim_period p ON p.period_id = f.period_id
+        JOIN dim_residence r ON r.residence_id = f.residence_id
+    """,
+    ISLANDS_VIEW: f"""
+        CREATE VIEW {ISLANDS_VIEW} AS
+        SELECT p.year, p.month, p.date, r.residence, i.island, f.tourists
+        FROM {ISLANDS_FACT} f
+        JOIN dim_period p ON p.period_id = f.period_id
+        JOIN dim_residence r ON r.residence_id = f.residence_id
+        JOIN dim_island i ON i.island_id = f.island_id
+    """,
+}
+
+
+def ensure_schema(conn):
+    # Sentencia a sentencia: executescript() haría COMMIT de la transacción en curso
+    for statement in SCHEMA_SQL.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def encode_labels(conn, dim_table, id_col, label_col, labels: pd.Series) -> pd.Series:
+    """
+    Convierte una columna de etiquetas en claves enteras de la dimensión.
+    Cada etiqueta distinta se inserta/busca una sola vez y el resultado se
+    propaga a todas las filas (factorize).
+    """
+    codes, uniques = pd.factorize(labels.astype(str).str.strip())
+    conn.executemany(
+        f"INSERT OR IGNORE INTO {dim_table} ({label_col}) VALUES (?)",
+        [(label,) for label in uniques],
+    )
+    ids = dict(conn.execute(f"SELECT {label_col}, {id_col} FROM {dim_table}").fetchall())
+    unique_ids = pd.Series([ids[label] for label in uniques], dtype="int64")
+    return pd.Series(unique_ids.to_numpy()[codes], index=labels.index)
+
+
+def encode_periods(conn, years: pd.Series, months: pd.Series) -> pd.Series:
+    """period_id = year * 100 + month; registra en dim_period los periodos nuevos."""
+    period_ids = years.astype("int64") * 100 + months.astype("int64")
+    conn.executemany(
+        "INSERT OR IGNORE INTO dim_period (period_id, year, month, date) VALUES (?, ?, ?, ?)",
+        [
+            (int(pid), int(pid) // 100, int(pid) % 100, f"{int(pid) // 100:04d}-{int(pid) % 100:02d}-01")
+            for pid in pd.unique(period_ids)
+        ],
+    )
+    return period_ids
+
+
+def _sync_fact(conn, fact_table, frame: pd.DataFrame, key_cols) -> dict:
+    """
+    Deja fact_table igual que frame aplicando solo las diferencias (filas
+    nuevas, con otro valor o desaparecidas) y las apunta en row_changes.
+    Devuelve el número de filas por operación.
+    """
+    old = pd.read_sql_query(f"SELECT {', '.join(key_cols)}, tourists FROM {fact_table}", conn)
+    # Tabla vacía: el delta sería la tabla entera, igual que el snapshot completo
+    log_rows = not old.empty
+    merged = old.merge(frame, on=key_cols, how="outer", suffixes=("_old", ""), indicator=True)
+    # Redondeo: reagrupar los mismos datos no debe contar como revisión
+    changed_value = merged["tourists_old"].round(6) != merged["tourists"].round(6)
+
+    changes = {
+        "insert": merged[merged["_merge"] == "right_only"],
+        "update": merged[(merged["_merge"] == "both") & changed_value],
+        "delete": merged[merged["_merge"] == "left_only"],
+    }
+
+    key_where = " AND ".join(f"{col} = ?" for col in key_cols)
+    conn.executemany(
+        f"DELETE FROM {fact_table} WHERE {key_where}",
+        changes["delete"][key_cols].astype(int).itertuples(index=False, name=None),
+    )
+    upserts = pd.concat([changes["insert"], changes["update"]])[[*key_cols, "tourists"]]
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {fact_table} ({', '.join(key_cols)}, tourists) "
+        f"VALUES ({', '.join('?' * (len(key_cols) + 1))})",
+        upserts.astype({col: int for col in key_cols}).itertuples(index=False, name=None),
+    )
+
+    changed_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    if not log_rows:
+        if len(changes["insert"]):
+            _reset_change_log(conn, fact_table, changed_at)
+        return {op: len(rows) for op, rows in changes.items()}
+
+    for op, rows in changes.items():
+        values = [None] * len(rows) if op == "delete" else rows["tourists"].astype(float).tolist()
+        conn.executemany(
+            f"""
+            INSERT INTO {CHANGE_LOG}
+                (fact_table, period_id, island_id, residence_id, op, tourists, changed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            zip(
+                [fact_table] * len(rows),
+                rows["period_id"].astype(int).tolist(),
+                (rows["island_id"].astype(int).tolist() if "island_id" in key_cols else [0] * len(rows)),
+                rows["residence_id"].astype(int).tolist(),
+                [op] * len(rows),
+                values,
+                [changed_at] * len(rows),
+            ),
+        )
+    compact_change_log(conn)
+    return {op: len(rows) for op, rows in changes.items()}
+
+
+def _raise_floor(conn, fact_table, floor_seq):
+    """Descarta los cambios de fact_table con seq <= floor_seq y lo apunta como suelo."""
+    conn.execute(
+        f"""
+        INSERT INTO {CHANGE_LOG_FLOOR} (fact_table, floor_seq) VALUES (?, ?)
+        ON CONFLICT(fact_table) DO UPDATE SET floor_seq = MAX(floor_seq, excluded.floor_seq)
+        """,
+        (fact_table, floor_seq),
+    )
+    return conn.execute(
+        f"DELETE FROM {CHANGE_LOG} WHERE fact_table = ? AND seq <= ?", (fact_table, floor_seq)
+    ).rowcount
+
+
+def _reset_change_log(conn, fact_table, changed_at):
+    """
+    Reserva un seq (AUTOINCREMENT no lo reutiliza aunque se borre la fila) y
+    lo usa como suelo: la marca de agua avanza y cualquier cliente anterior
+    pasa a recibir el snapshot completo.
+    """
+    cursor = conn.execute(
+        f"""
+        INSERT INTO {CHANGE_LOG}
+            (fact_table, period_id, island_id, residence_id, op, tourists, changed_at)
+        VALUES (?, 0, 0, 0, 'reset', NULL, ?)
+        """,
+        (fact_table, changed_at),
+    )
+    _raise_floor(conn, fact_table, cursor.lastrowid)
+
+
+def compact_change_log(conn, keep_days=CHANGE_LOG_RETENTION_DAYS) -> int:
+    """
+    Poda de row_changes los cambios de más de keep_days días y sube el suelo
+    de cada tabla de hechos hasta el último seq podado. Devuelve las filas
+    eliminadas.
+    """
+    ensure_schema(conn)
+    cutoff = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(time.time() - keep_days * 86400))
+    expired = conn.execute(
+        f"SELECT fact_table, MAX(seq) FROM {CHANGE_LOG} WHERE changed_at < ? GROUP BY fact_table",
+        (cutoff,),
+    ).fetchall()
+    return sum(_raise_floor(conn, fact_table, floor_seq) for fact_table, floor_seq in expired)
+
+
+def _ensure_legacy_view(conn, name):
+    row = conn.execute(
+        "SELECT type FROM sqlite_master WHERE name = ?", (name,)
+    ).fetchone()
+    if row and row[0] == "table":
+        conn.execute(f"DROP TABLE {name}")
+        row = None
+    if row is None:
+        conn.execute(LEGACY_VIEWS[name])
+
+
+def load_monthly(conn, df: pd.DataFrame) -> int:
+    """
+    Recarga fact_canarias_monthly desde un DataFrame
+    (year, month, residence, tourists). Solo escribe las filas que
+    cambian (ver _sync_fact). Devuelve el número de filas.
+    """
+    ensure_schema(conn)
+    fact = pd.DataFrame({
+        "period_id": encode_periods(conn, df["year"], df["month"]),
+        "residence_id": encode_labels(conn, "dim_residence", "residence_id", "residence", df["residence"]),
+        "tourists": df["tourists"].astype(float),
+    })
+    fact = fact.groupby(["period_id", "residence_id"], as_index=False, sort=True)["tourists"].sum()
+    _sync_fact(conn, MONTHLY_FACT, fact.astype({"period_id": int, "residence_id": int}),
+               ["period_id", "residence_id"])
+    _ensure_legacy_view(conn, MONTHLY_VIEW)
+    return len(fact)
+
+
+def load_islands(conn, df: pd.DataFrame) -> int:
+    """
+    Recarga fact_canarias_islands_monthly desde un DataFrame
+    (year, month, residence, island, tourists). Solo escribe las filas que
+    cambian (ver _sync_fact). Devuelve el número de filas.
+    """
+    ensure_schema(conn)
+    fact = pd.DataFrame({
+        "period_id": encode_periods(conn, df["year"], df["month"]),
+        "island_id": encode_labels(conn, "dim_island", "island_id", "island", df["island"]),
+        "residence_id": encode_labels(conn, "dim_residence", "residence_id", "residence", df["residence"]),
+        "tourists": df["tourists"].astype(float),
+    })
+    fact = fact.groupby(["period_id", "island_id", "residence_id"], as_index=False, sort=True)["tourists"].sum()
+    _sync_fact(conn, ISLANDS_FACT, fact.astype({"period_id": int, "island_id": int, "residence_id": int}),
+               ["period_id", "island_id", "residence_id"])
+    refresh_island_marginals(conn)
+    _ensure_legacy_view(conn, ISLANDS_VIEW)
+    return len(fact)
+
+
+def refresh_island_marginals(conn) -> int:
+    """
+    Recalcula agg_islands_marginals desde fact_canarias_islands_monthly:
+    filas de hechos + totales por (residencia, periodo), (isla, periodo) y
+    periodo, con ALL_ID en la dimensión agregada. Devuelve el número de filas.
+    """
+    ensure_schema(conn)
+    conn.execute(f"DELETE FROM {ISLANDS_MARGINALS}")
+    conn.execute(
+        f"""
+        INSERT INTO {ISLANDS_MARGINALS} (residence_id, island_id, period_id, tourists)
+        SELECT residence_id, island_id, period_id, tourists
+        FROM {ISLANDS_FACT}
+        UNION ALL
+        SELECT residence_id, {ALL_ID}, period_id, SUM(tourists)
+        FROM {ISLANDS_FACT} GROUP BY residence_id, period_id
+        UNION ALL
+        SELECT {ALL_ID}, island_id, period_id, SUM(tourists)
+        FROM {ISLANDS_FACT} GROUP BY island_id, period_id
+        UNION ALL
+        SELECT {ALL_ID}, {ALL_ID}, period_id, SUM(tourists)
+        FROM {ISLANDS_FACT} GROUP BY period_id
+        """
+    )
+    return conn.execute(f"SELECT COUNT(*) FROM {ISLANDS_MARGINALS}").fetchone()[0]
+
+
+def load_wide(conn, fact_table, df: pd.DataFrame, labels) -> int:
+    """
+    Recarga una tabla de hechos ancha desde un DataFrame
+    (year, month, <labels>, una columna por medida). La tabla se recrea
+    porque el conjunto de medidas depende del cubo descargado.
+    Devuelve el número de filas.
+    """
+    ensure_schema(conn)
+    key_cols = ["period_id"] + [LABEL_DIMENSIONS[label][1] for label in labels]
+    measures = [c for c in df.columns if c not in ("year", "month", *labels)]
+
+    fact = pd.DataFrame({"period_id": encode_periods(conn, df["year"], df["month"])})
+    for label in labels:
+        dim_table, id_col = LABEL_DIMENSIONS[label]
+        fact[id_col] = encode_labels(conn, dim_table, id_col, label, df[label])
+    for measure in measures:
+        fact[measure] = df[measure].astype(float)
+
+    columns_sql = ",\n    ".join(
+        [f"{col} INTEGER NOT NULL" for col in key_cols] + [f'"{m}" REAL' for m in measures]
+    )
+    conn.execute(f"DROP TABLE IF EXISTS {fact_table}")
+    conn.execute(
+        f"""
+        CREATE TABLE {fact_table} (
+            {columns_sql},
+            PRIMARY KEY ({", ".join(key_cols)})
+        ) WITHOUT ROWID
+        """
+    )
+    quoted = ", ".join(key_cols + [f'"{m}"' for m in measures])
+    conn.executemany(
+        f"INSERT INTO {fact_table} ({quoted}) VALUES ({', '.join('?' * len(fact.columns))})",
+        (
+            tuple(None if pd.isna(v) else v for v in row)
+            for row in fact.astype({col: int for col in key_cols}).astype(object).itertuples(index=False, name=None)
+        ),
+    )
+    return len(fact)
+
+
+def migrate_legacy_tables(conn):
+    """Convierte las tablas antiguas (si siguen siendo tablas) a la estrella + vistas."""
+    for name, loader, columns in (
+        (MONTHLY_VIEW, load_monthly, "year, month, residence, tourists"),
+        (ISLANDS_VIEW, load_islands, "year, month, residence, island, tourists"),
+    ):
+        row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+        if not row or row[0] != "table":
+            print(f"[INFO] '{name}' ya es una vista (o no existe); no se migra.")
+            continue
+        df = pd.read_sql_query(f"SELECT {columns} FROM {name} WHERE tourists IS NOT NULL", conn)
+        n = loader(conn, df)
+        print(f"[OK] '{name}' migrada a la estrella ({n} filas de hechos).")
+
+
+def main():
+    print("=== MIGRACIÓN A ESQUEMA EN ESTRELLA ===")
+    print("BD:", DB_PATH)
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        migrate_legacy_tables(conn)
+        # BD ya en estrella pero cargada antes de existir las marginales
+        has_islands = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (ISLANDS_FACT,)
+        ).fetchone()
+        if has_islands:
+            n = refresh_island_marginals(conn)
+            print(f"[OK] '{ISLANDS_MARGINALS}' recalculada ({n} filas).")
+        conn.commit()
+    finally:
+        conn.close()
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("VACUUM")
+    conn.close()
+    # La caché del dashboard se calculó sobre las tablas anteriores
+    publish_new_data_version()
+    print("=== MIGRACIÓN COMPLETADA ===")
+
+
+if __name__ == "__main__":
+    main()
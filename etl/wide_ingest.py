@@ -0,0 +1,116 @@
+"""
+Ingesta "ancha" de los cubos de observaciones del ISTAC en una sola pasada.
+
+Los TSV de observaciones vienen en formato largo: una fila por
+(periodo, dimensiones, MEDIDAS[, TIPO_VIAJERO]) con su OBS_VALUE. Las ETL
+clásicas se quedan solo con MEDIDAS == "Turistas"; aquí se leen TODAS las
+medidas (y tipos de viajero) en un único recorrido por bloques del fichero y
+se pivotan a una tabla ancha: una fila por (periodo, dimensiones) y una
+columna REAL por medida.
+
+Los nombres de columna se normalizan con measure_column():
+    "Turistas"                  -> turistas
+    "Gasto total"               -> gasto_total
+    ("Tourist", "Turistas")     -> tourist__turistas
+
+Cada (periodo, dimensiones, medida) debe aparecer una sola vez: si se repite,
+falta alguna columna en dimensions/pivot_cols/row_filter (p. ej. TIPO_VIAJERO)
+y read_wide_observations falla en vez de quedarse con un valor cualquiera.
+"""
+
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from parsing import DecodeCache, decode_labels, parse_locale_number, parse_time_period
+
+# Filas por bloque al leer el TSV (memoria acotada aunque el cubo crezca)
+CHUNK_SIZE = 200_000
+
+# Claves repetidas que se muestran en el error
+MAX_DUPLICATES_SHOWN = 5
+
+
+def measure_column(*parts) -> str:
+    """Nombre de columna SQL seguro para una medida (o tipo de viajero + medida)."""
+    slugs = []
+    for part in parts:
+        text = unicodedata.normalize("NFKD", str(part)).encode("ascii", "ignore").decode("ascii")
+        slugs.append(re.sub(r"[^a-z0-9]+", "_", text.lower()).strip("_") or "sin_nombre")
+    name = "__".join(slugs)
+    return name if not name[0].isdigit() else f"m_{name}"
+
+
+def read_wide_observations(
+    path,
+    dimensions: dict,
+    pivot_cols: list,
+    row_filter: dict | None = None,
+    chunksize: int = CHUNK_SIZE,
+) -> pd.DataFrame:
+    """
+    Lee el TSV de observaciones por bloques y devuelve la tabla ancha.
+
+    - dimensions: {columna TSV: columna destino}, p. ej. {"LUGAR_RESIDENCIA": "residence"}
+    - pivot_cols: columnas TSV cuyos valores pasan a ser columnas (MEDIDAS, TIPO_VIAJERO...)
+    - row_filter: {columna TSV: valor} para descartar filas antes de pivotar
+
+    Resultado: year, month, <dimensiones>, una columna float por medida.
+    """
+    row_filter = row_filter or {}
+    usecols = list(dict.fromkeys(["TIME_PERIOD", "OBS_VALUE", *dimensions, *pivot_cols, *row_filter]))
+
+    # Cada periodo, etiqueta y combinación de medidas se decodifica una vez en toda la lectura
+    period_cache = DecodeCache()
+    value_cache = DecodeCache()
+    label_caches = {src: DecodeCache() for src in dimensions}
+    measure_names = {}
+
+    parts = []
+    for chunk in pd.read_csv(path, sep="\t", dtype=str, usecols=usecols, chunksize=chunksize):
+        for col, value in row_filter.items():
+            chunk = chunk[chunk[col] == value]
+        if chunk.empty:
+            continue
+
+        values = parse_locale_number(chunk["OBS_VALUE"], cache=value_cache)
+        chunk = chunk[values.notna()]
+        if chunk.empty:
+            continue
+
+        # Nombre de columna por combinación distinta de pivot_cols (no por fila)
+        codes, uniques = pd.MultiIndex.from_frame(chunk[pivot_cols]).factorize()
+        for key in uniques:
+            if key not in measure_names:
+                measure_names[key] = measure_column(*key)
+        names = [measure_names[key] for key in uniques]
+
+        part = parse_time_period(chunk["TIME_PERIOD"], cache=period_cache)
+        for src, dst in dimensions.items():
+            part[dst] = decode_labels(chunk[src], cache=label_caches[src])
+        part["measure"] = np.asarray(names, dtype=object)[codes]
+        part["value"] = values[values.notna()].astype("float64")
+        parts.append(part)
+
+    index_cols = ["year", "month", *dimensions.values()]
+    if not parts:
+        return pd.DataFrame(columns=index_cols)
+
+    long = pd.concat(parts, ignore_index=True)
+    duplicated = long.duplicated([*index_cols, "measure"], keep=False)
+    if duplicated.any():
+        keys = long.loc[duplicated, [*index_cols, "measure"]].drop_duplicates()
+        shown = keys.head(MAX_DUPLICATES_SHOWN).to_dict("records")
+        raise ValueError(
+            f"{int(duplicated.sum())} observaciones comparten (periodo, dimensiones, medida) "
+            f"en {len(keys)} claves; falta alguna columna en dimensions/pivot_cols/row_filter. "
+            f"Ejemplos: {shown}"
+        )
+
+    wide = long.pivot_table(
+        index=index_cols, columns="measure", values="value", aggfunc="first", observed=True
+    )
+    wide.columns.name = None
+    return wide.reset_index().sort_values(index_cols, ignore_index=True)
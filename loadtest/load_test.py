@@ -0,0 +1,598 @@
+"""
+Generador de carga asíncrono para el dashboard y las descargas CSV.
+
+Reproduce una mezcla de peticiones (scenarios.json o un fichero JSONL de
+replay) contra un servidor local a niveles de concurrencia crecientes y
+reporta, por nivel:
+- throughput (peticiones/s)
+- percentiles de latencia (p50, p90, p95, p99, max)
+- tasa de errores (HTTP >= 400, timeouts y errores de conexión)
+- uso de recursos del servidor (CPU y RSS del proceso gunicorn y sus workers)
+
+Uso típico (arranca gunicorn con la misma configuración que el Procfile):
+
+    python loadtest/load_test.py --start-server --levels 1,4,8,16,32 --duration 20
+
+Solo usa la librería estándar (asyncio + sockets), así no añade dependencias
+al proyecto.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+# === RUTAS BASE ===
+BASE_DIR = Path(__file__).resolve().parents[1]
+DJANGO_DIR = BASE_DIR / "django_app"
+
+DEFAULT_SCENARIO_FILE = Path(__file__).resolve().parent / "scenarios.json"
+DEFAULT_BASE_URL = "http://127.0.0.1:8765"
+DEFAULT_LEVELS = "1,2,4,8,16,32"
+
+# Criterios para considerar que el servidor "se ha caído" en un nivel
+MAX_ERROR_RATE = 0.01     # más de un 1 % de errores
+MAX_P99_SECONDS = 5.0     # p99 por encima de 5 s
+
+# Resolución del muestreo de recursos del servidor
+SAMPLE_INTERVAL = 0.5
+
+
+# =========================
+# MEZCLA DE PETICIONES
+# =========================
+
+def load_scenario(path):
+    """
+    Lee el fichero de escenario y devuelve la lista de entradas
+    [{"name", "path", "weight", "params"}].
+    """
+    with open(path, encoding="utf-8") as f:
+        scenario = json.load(f)
+
+    entries = []
+    for entry in scenario.get("requests", []):
+        entries.append(
+            {
+                "name": entry.get("name") or entry["path"],
+                "path": entry["path"],
+                "weight": float(entry.get("weight", 1)),
+                "params": entry.get("params") or {},
+            }
+        )
+
+    if not entries:
+        raise ValueError(f"El escenario no contiene peticiones: {path}")
+    return entries
+
+
+def load_replay(path):
+    """
+    Lee un fichero JSONL de replay. Cada línea con clave "path" es una
+    petición (con "params" o "query" opcionales). Las líneas que no describen
+    una petición HTTP se ignoran, así se puede reutilizar cualquier JSONL
+    que tenga al menos esa clave.
+    """
+    targets = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(item, dict) or not str(item.get("path", "")).startswith("/"):
+                continue
+
+            query = item.get("query") or ""
+            if not query and item.get("params"):
+                query = urlencode(item["params"])
+            target = item["path"] + (f"?{query}" if query else "")
+            targets.append((item.get("name") or item["path"], target))
+
+    if not targets:
+        raise ValueError(f"No hay peticiones reproducibles en: {path}")
+    return targets
+
+
+def build_target(entry, rng):
+    """Elige valores aleatorios para los parámetros de una entrada del escenario."""
+    params = {}
+    for key, values in entry["params"].items():
+        if isinstance(values, list):
+            params[key] = rng.choice(values)
+        else:
+            params[key] = values
+
+    query = urlencode(params)
+    return entry["path"] + (f"?{query}" if query else "")
+
+
+class RequestMix:
+    """Genera (nombre, path) según los pesos del escenario o en orden de replay."""
+
+    def __init__(self, entries=None, replay=None, seed=None):
+        self.entries = entries or []
+        self.replay = replay or []
+        self.rng = random.Random(seed)
+        self._replay_pos = 0
+        self._weights = [e["weight"] for e in self.entries]
+
+    def next(self):
+        if self.replay:
+            name, target = self.replay[self._replay_pos % len(self.replay)]
+            self._replay_pos += 1
+            return name, target
+
+        entry = self.rng.choices(self.entries, weights=self._weights, k=1)[0]
+        return entry["name"], build_target(entry, self.rng)
+
+
+# =========================
+# CLIENTE HTTP ASÍNCRONO
+# =========================
+
+async def http_get(host, port, target, timeout):
+    """
+    GET HTTP/1.1 mínimo sobre asyncio. Lee la respuesta completa (incluido
+    el cuerpo, para medir también el coste de transferir los CSV).
+    Devuelve (status, bytes_recibidos).
+    """
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port), timeout=timeout
+    )
+    try:
+        request = (
+            f"GET {target} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            "User-Agent: kanarytour-loadtest\r\n"
+            "Accept: */*\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(request.encode("ascii"))
+        await writer.drain()
+
+        status_line = await asyncio.wait_for(reader.readline(), timeout=timeout)
+        parts = status_line.decode("latin-1").split()
+        status = int(parts[1]) if len(parts) >= 2 and parts[1].isdigit() else 0
+
+        received = len(status_line)
+        while True:
+            chunk = await asyncio.wait_for(reader.read(65536), timeout=timeout)
+            if not chunk:
+                break
+            received += len(chunk)
+        return status, received
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+# =========================
+# MUESTREO DE RECURSOS DEL SERVIDOR (/proc)
+# =========================
+
+def _proc_children(pid):
+    children = []
+    task_dir = Path(f"/proc/{pid}/task")
+    if not task_dir.exists():
+        return children
+    for task in task_dir.iterdir():
+        try:
+            content = (task / "children").read_text().split()
+        except OSError:
+            continue
+        children.extend(int(c) for c in content)
+    return children
+
+
+def _proc_tree(pid):
+    pids = [pid]
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        for child in _proc_children(current):
+            pids.append(child)
+            pending.append(child)
+    return pids
+
+
+def _proc_cpu_rss(pid):
+    """Devuelve (segundos de CPU, RSS en bytes) de un proceso, o None."""
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+        statm = Path(f"/proc/{pid}/statm").read_text().split()
+    except OSError:
+        return None
+
+    # El nombre del proceso va entre paréntesis y puede contener espacios
+    fields = stat.rsplit(")", 1)[1].split()
+    utime, stime = int(fields[11]), int(fields[12])
+    ticks = os.sysconf("SC_CLK_TCK")
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    return (utime + stime) / ticks, int(statm[1]) * page_size
+
+
+class ResourceSampler:
+    """
+    Muestrea periódicamente CPU y memoria del proceso del servidor y de todos
+    sus hijos (master + workers de gunicorn). Solo funciona en Linux; en otros
+    sistemas devuelve un resumen vacío.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.samples = []
+        self._task = None
+        self._running = False
+
+    def _snapshot(self):
+        cpu_total = 0.0
+        rss_total = 0
+        for pid in _proc_tree(self.pid):
+            usage = _proc_cpu_rss(pid)
+            if usage is None:
+                continue
+            cpu_total += usage[0]
+            rss_total += usage[1]
+        return time.perf_counter(), cpu_total, rss_total
+
+    async def _run(self):
+        while self._running:
+            self.samples.append(self._snapshot())
+            await asyncio.sleep(SAMPLE_INTERVAL)
+
+    def start(self):
+        if self.pid is None or not Path(f"/proc/{self.pid}").exists():
+            return
+        self.samples = []
+        self._running = True
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return {}
+        self._running = False
+        await self._task
+        self._task = None
+        self.samples.append(self._snapshot())
+
+        if len(self.samples) < 2:
+            return {}
+
+        cpu_pcts = []
+        for (t0, c0, _), (t1, c1, _) in zip(self.samples, self.samples[1:]):
+            if t1 > t0:
+                cpu_pcts.append((c1 - c0) / (t1 - t0) * 100)
+
+        t_start, cpu_start, _ = self.samples[0]
+        t_end, cpu_end, _ = self.samples[-1]
+        rss_values = [rss for _, _, rss in self.samples]
+        return {
+            "cpu_seconds": round(cpu_end - cpu_start, 3),
+            "cpu_pct_avg": round((cpu_end - cpu_start) / (t_end - t_start) * 100, 1),
+            "cpu_pct_max": round(max(cpu_pcts), 1) if cpu_pcts else None,
+            "rss_mb_max": round(max(rss_values) / 1024 / 1024, 1),
+            "rss_mb_end": round(rss_values[-1] / 1024 / 1024, 1),
+            "processes": len(_proc_tree(self.pid)),
+        }
+
+
+# =========================
+# EJECUCIÓN POR NIVEL
+# =========================
+
+def percentile(sorted_values, pct):
+    """Percentil por interpolación lineal sobre una lista ya ordenada."""
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(results, elapsed):
+    """Resume una lista de (nombre, status, latencia, bytes, error)."""
+    latencies = sorted(r[2] for r in results)
+    errors = [r for r in results if r[4] is not None or r[1] >= 400 or r[1] == 0]
+    total = len(results)
+
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        "requests": total,
+        "errors": len(errors),
+        "error_rate": round(len(errors) / total, 4) if total else 0.0,
+        "throughput_rps": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+        "mb_received": round(sum(r[3] for r in results) / 1024 / 1024, 2),
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 50)),
+            "p90": ms(percentile(latencies, 90)),
+            "p95": ms(percentile(latencies, 95)),
+            "p99": ms(percentile(latencies, 99)),
+            "max": ms(latencies[-1] if latencies else None),
+        },
+    }
+
+
+async def run_level(base_url, mix, concurrency, duration, timeout, sampler):
+    """
+    Lanza `concurrency` usuarios virtuales en bucle cerrado durante
+    `duration` segundos y devuelve el resumen del nivel.
+    """
+    url = urlsplit(base_url)
+    host = url.hostname or "127.0.0.1"
+    port = url.port or 80
+    prefix = url.path.rstrip("/")
+
+    results = []
+    deadline = time.perf_counter() + duration
+
+    async def virtual_user():
+        while time.perf_counter() < deadline:
+            name, target = mix.next()
+            t0 = time.perf_counter()
+            try:
+                status, size = await http_get(host, port, prefix + target, timeout)
+                error = None
+            except (asyncio.TimeoutError, OSError) as exc:
+                status, size, error = 0, 0, type(exc).__name__
+            results.append((name, status, time.perf_counter() - t0, size, error))
+
+    sampler.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    resources = await sampler.stop()
+
+    by_name = defaultdict(list)
+    for r in results:
+        by_name[r[0]].append(r)
+
+    summary = summarize(results, elapsed)
+    summary["concurrency"] = concurrency
+    summary["duration_s"] = round(elapsed, 2)
+    summary["server"] = resources
+    summary["by_request"] = {
+        name: summarize(items, elapsed) for name, items in sorted(by_name.items())
+    }
+    summary["error_types"] = dict(
+        sorted(
+            _count(
+                r[4] or f"HTTP {r[1]}" for r in results
+                if r[4] is not None or r[1] >= 400 or r[1] == 0
+            ).items()
+        )
+    )
+    return summary
+
+
+def _count(values):
+    counts = defaultdict(int)
+    for v in values:
+        counts[v] += 1
+    return counts
+
+
+def level_failed(summary):
+    p99 = summary["latency_ms"]["p99"]
+    return summary["error_rate"] > MAX_ERROR_RATE or (
+        p99 is not None and p99 > MAX_P99_SECONDS * 1000
+    )
+
+
+# =========================
+# ARRANQUE DEL SERVIDOR LOCAL
+# =========================
+
+def start_server(base_url, workers, server_cmd=None):
+    """
+    Arranca gunicorn (mismo entrypoint que el Procfile) en el puerto de
+    base_url y espera a que acepte conexiones.
+    """
+    url = urlsplit(base_url)
+    host = url.hostname or "127.0.0.1"
+    port = url.port or 80
+
+    if server_cmd:
+        cmd = server_cmd.split()
+    else:
+        cmd = [
+            sys.executable, "-m", "gunicorn", "kanarytour_django.wsgi:application",
+            "--bind", f"{host}:{port}",
+            "--workers", str(workers),
+            "--log-level", "warning",
+        ]
+
+    print(f"[SERVIDOR] Arrancando: {' '.join(cmd)}")
+    proc = subprocess.Popen(cmd, cwd=DJANGO_DIR)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"El servidor terminó al arrancar (código {proc.returncode}).")
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                print(f"[SERVIDOR] Escuchando en {host}:{port} (pid {proc.pid})")
+                return proc
+        except OSError:
+            time.sleep(0.3)
+
+    proc.terminate()
+    raise RuntimeError("El servidor no respondió en 30 s.")
+
+
+def find_server_pid(base_url):
+    """Busca el pid que escucha en el puerto de base_url (solo Linux, vía /proc/net/tcp)."""
+    port = urlsplit(base_url).port or 80
+    inodes = set()
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            lines = Path(table).read_text().splitlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            local_port = int(fields[1].rsplit(":", 1)[1], 16)
+            if local_port == port and fields[3] == "0A":  # LISTEN
+                inodes.add(fields[9])
+
+    if not inodes:
+        return None
+
+    candidates = []
+    for proc_dir in Path("/proc").iterdir():
+        if not proc_dir.name.isdigit():
+            continue
+        try:
+            for fd in (proc_dir / "fd").iterdir():
+                link = os.readlink(fd)
+                if link.startswith("socket:[") and link[8:-1] in inodes:
+                    candidates.append(int(proc_dir.name))
+                    break
+        except OSError:
+            continue
+
+    # El master de gunicorn es el de pid más bajo (los workers heredan el socket)
+    return min(candidates) if candidates else None
+
+
+# =========================
+# INFORME
+# =========================
+
+def print_level(summary):
+    lat = summary["latency_ms"]
+    server = summary["server"] or {}
+    cpu = server.get("cpu_pct_avg")
+    rss = server.get("rss_mb_max")
+    print(
+        f"  c={summary['concurrency']:>4}  "
+        f"rps={summary['throughput_rps']:>8.2f}  "
+        f"p50={lat['p50']}ms  p95={lat['p95']}ms  p99={lat['p99']}ms  "
+        f"errores={summary['error_rate'] * 100:.2f}%  "
+        f"cpu={cpu if cpu is not None else '-'}%  "
+        f"rss={rss if rss is not None else '-'}MB"
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Test de carga del dashboard KanaryTour.")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    parser.add_argument("--scenario", default=str(DEFAULT_SCENARIO_FILE))
+    parser.add_argument("--replay", help="Fichero JSONL con peticiones a reproducir en orden.")
+    parser.add_argument("--levels", default=DEFAULT_LEVELS,
+                        help="Niveles de concurrencia separados por comas.")
+    parser.add_argument("--duration", type=float, default=15.0,
+                        help="Segundos por nivel de concurrencia.")
+    parser.add_argument("--warmup", type=float, default=3.0,
+                        help="Segundos de calentamiento antes del primer nivel.")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=26)
+    parser.add_argument("--start-server", action="store_true",
+                        help="Arranca gunicorn localmente antes de la prueba.")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="Workers de gunicorn al usar --start-server.")
+    parser.add_argument("--server-cmd", help="Comando alternativo para arrancar el servidor.")
+    parser.add_argument("--server-pid", type=int,
+                        help="PID del servidor a monitorizar (si ya está arrancado).")
+    parser.add_argument("--keep-going", action="store_true",
+                        help="No parar al primer nivel que supere los umbrales.")
+    parser.add_argument("--output", help="Ruta del informe JSON (por defecto loadtest/results/).")
+    return parser.parse_args(argv)
+
+
+async def run(args):
+    entries = load_scenario(args.scenario)
+    replay = load_replay(args.replay) if args.replay else None
+    levels = [int(x) for x in args.levels.split(",") if x.strip()]
+
+    server_proc = None
+    if args.start_server:
+        server_proc = start_server(args.base_url, args.workers, args.server_cmd)
+
+    try:
+        pid = args.server_pid or (server_proc.pid if server_proc else find_server_pid(args.base_url))
+        if pid is None:
+            print("[AVISO] No se encontró el proceso del servidor; no se medirán recursos.")
+
+        if args.warmup > 0:
+            print(f"[CALENTAMIENTO] {args.warmup:.0f} s a concurrencia 1")
+            await run_level(args.base_url, RequestMix(entries, replay, args.seed), 1,
+                            args.warmup, args.timeout, ResourceSampler(None))
+
+        report = {
+            "base_url": args.base_url,
+            "scenario": args.scenario,
+            "replay": args.replay,
+            "duration_per_level_s": args.duration,
+            "workers": args.workers if args.start_server else None,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "levels": [],
+            "breaking_concurrency": None,
+            "max_sustained_rps": None,
+        }
+
+        print(f"[CARGA] Niveles: {levels} · {args.duration:.0f} s por nivel")
+        for level in levels:
+            mix = RequestMix(entries, replay, args.seed + level)
+            summary = await run_level(args.base_url, mix, level, args.duration,
+                                      args.timeout, ResourceSampler(pid))
+            report["levels"].append(summary)
+            print_level(summary)
+
+            if level_failed(summary):
+                if report["breaking_concurrency"] is None:
+                    report["breaking_concurrency"] = level
+                    print(f"[LÍMITE] El servidor supera los umbrales a concurrencia {level}.")
+                if not args.keep_going:
+                    break
+            elif report["breaking_concurrency"] is None:
+                report["max_sustained_rps"] = max(
+                    report["max_sustained_rps"] or 0.0, summary["throughput_rps"]
+                )
+        return report
+    finally:
+        if server_proc is not None:
+            server_proc.terminate()
+            try:
+                server_proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server_proc.kill()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print("=== TEST DE CARGA KANARYTOUR ===")
+
+    report = asyncio.run(run(args))
+
+    output = Path(args.output) if args.output else (
+        Path(__file__).resolve().parent / "results" / f"loadtest_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print(f"\n[OK] Informe guardado en:\n    {output}")
+    if report["max_sustained_rps"] is not None:
+        print(f"[OK] Máximo throughput sostenido: {report['max_sustained_rps']} req/s")
+    print("=== TEST DE CARGA COMPLETADO ===")
+
+
+if __name__ == "__main__":
+    main()
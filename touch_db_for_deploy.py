@@ -1,5 +1,7 @@
 import sqlite3
 
+from etl.post_load import run_post_load_hooks
+
 conn = sqlite3.connect("db.sqlite3")
 cur = conn.cursor()
 
@@ -10,3 +12,6 @@ conn.commit()
 conn.close()
 
 print("Marca de deploy creada/actualizada en db.sqlite3")
+
+# Caché del dashboard caliente antes de servir tráfico tras el deploy
+run_post_load_hooks()